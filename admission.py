@@ -0,0 +1,203 @@
+"""
+Admission control in front of the model call.
+
+Every model call needs a token from a rate-limiting bucket and a slot under
+an adaptive concurrency limit. The limit grows by one slot per limit's worth
+of successful calls and is cut multiplicatively when the model answers 429/503
+or gets slower than the configured latency threshold (AIMD). Callers that
+cannot be admitted straight away wait in a bounded FIFO queue.
+
+Requests are refused up front when their deadline cannot cover the latency
+observed so far for the model they are about to call: answering DEADLINE_EXCEEDED immediately is better
+than spending quota on a result nobody will receive.
+"""
+import asyncio
+import collections
+import time
+
+import grpc
+
+# Status codes / messages Gemini uses when it is shedding load
+OVERLOAD_HTTP_CODES = {429, 503}
+OVERLOAD_MARKERS = ("429", "RESOURCE_EXHAUSTED", "503", "UNAVAILABLE")
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, code, details):
+        super().__init__(details)
+        self.code = code
+        self.details = details
+
+
+def is_overload_error(error):
+    """True for errors that mean the model side is over quota or overloaded"""
+    code = getattr(error, "code", None)
+    if isinstance(code, int) and code in OVERLOAD_HTTP_CODES:
+        return True
+    message = str(error)
+    return any(marker in message for marker in OVERLOAD_MARKERS)
+
+
+class TokenBucket:
+    """Refills `rate` tokens per second up to `burst`; tokens are reserved ahead, so waiters are served in order"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+
+    def reserve(self, max_wait):
+        """Take a token and return how long to wait for it, or None (nothing taken) if that exceeds max_wait"""
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        wait = max(0.0, (1 - self._tokens) / self.rate)
+        if max_wait is not None and wait > max_wait:
+            return None
+        self._tokens -= 1
+        return wait
+
+
+class AdmissionController:
+    def __init__(self, rate=0.0, burst=10, initial_limit=32, min_limit=1, max_limit=256,
+                 max_queue=256, latency_threshold=0.0, backoff=0.5, latency_backoff=0.9):
+        self.bucket = TokenBucket(rate, burst)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(min(max(initial_limit, min_limit), max_limit))
+        self.max_queue = max_queue
+        self.latency_threshold = latency_threshold
+        self.backoff = backoff
+        self.latency_backoff = latency_backoff
+        self.in_flight = 0
+        # Seconds from admission to the end of the model stream, per model: a flash tier and a
+        # search-grounded pro call differ several-fold. A model is absent until its first call finishes
+        self._latency = {}
+        self._waiters = collections.deque()
+        self._rate_waiting = 0
+        self._last_decrease = 0.0
+        self._stats = {
+            "admitted": 0, "queued": 0, "rejected_queue_full": 0, "rejected_rate": 0,
+            "rejected_deadline": 0, "overload_signals": 0, "latency_signals": 0,
+        }
+
+    def expected_latency(self, model=None):
+        """Smoothed seconds from admission to the end of a call to model; 0 before the first one"""
+        return self._latency.get(model, 0.0)
+
+    async def acquire(self, deadline=None, model=None):
+        """
+        Wait for a rate token and a concurrency slot; returns the admission time to pass to release().
+
+        deadline is a time.monotonic() value. Raises AdmissionRejected with
+        DEADLINE_EXCEEDED when the remaining time cannot cover the expected latency
+        of model, or RESOURCE_EXHAUSTED when the queue or the rate budget is full.
+        """
+        budget = self._budget(deadline, model)
+        if budget is not None and budget <= 0:
+            self._stats["rejected_deadline"] += 1
+            raise AdmissionRejected(
+                grpc.StatusCode.DEADLINE_EXCEEDED,
+                f"Deadline too short for the expected model latency ({self.expected_latency(model):.1f}s)",
+            )
+        if self._rate_waiting + len(self._waiters) >= self.max_queue:
+            self._stats["rejected_queue_full"] += 1
+            raise AdmissionRejected(grpc.StatusCode.RESOURCE_EXHAUSTED, "Too many requests waiting for the model")
+
+        wait = self.bucket.reserve(budget)
+        if wait is None:
+            self._stats["rejected_rate"] += 1
+            raise AdmissionRejected(grpc.StatusCode.RESOURCE_EXHAUSTED, "Model rate limit reached, try again later")
+        if wait > 0:
+            self._rate_waiting += 1
+            try:
+                await asyncio.sleep(wait)
+            finally:
+                self._rate_waiting -= 1
+
+        if self.in_flight < int(self.limit) and not self._waiters:
+            return self._admit()
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._stats["queued"] += 1
+        try:
+            return await asyncio.wait_for(asyncio.shield(waiter), self._budget(deadline, model))
+        except asyncio.TimeoutError:
+            self._abandon(waiter)
+            self._stats["rejected_deadline"] += 1
+            raise AdmissionRejected(
+                grpc.StatusCode.DEADLINE_EXCEEDED, "Deadline would expire before the model could answer"
+            )
+        except asyncio.CancelledError:
+            self._abandon(waiter)
+            raise
+
+    def release(self, admitted_at, outcome, model=None):
+        """
+        Return the slot taken by acquire() for a call to model. outcome is "ok", "overload" (429/503
+        from the model) or "error"/"cancelled", which say nothing about capacity and leave the limit alone.
+        """
+        self.in_flight -= 1
+        now = time.monotonic()
+        if outcome == "ok":
+            latency = now - admitted_at
+            previous = self._latency.get(model)
+            self._latency[model] = latency if previous is None else 0.8 * previous + 0.2 * latency
+            if self.latency_threshold and latency > self.latency_threshold:
+                self._stats["latency_signals"] += 1
+                self._decrease(admitted_at, self.latency_backoff)
+            else:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        elif outcome == "overload":
+            self._stats["overload_signals"] += 1
+            self._decrease(admitted_at, self.backoff)
+        self._wake()
+
+    def stats(self):
+        """Read from the metrics and health threads; copies are single C calls, so no lock is needed"""
+        latency = self._latency.copy()
+        return dict(
+            self._stats.copy(),
+            limit=self.limit,
+            in_flight=self.in_flight,
+            waiting=len(self._waiters) + self._rate_waiting,
+            # The slowest model bounds how long an admitted request can take
+            expected_latency=max(latency.values(), default=0.0),
+        )
+
+    def _budget(self, deadline, model):
+        """Seconds this request may still wait before the call to model would overrun its deadline"""
+        if deadline is None:
+            return None
+        return deadline - time.monotonic() - self.expected_latency(model)
+
+    def _admit(self):
+        self.in_flight += 1
+        self._stats["admitted"] += 1
+        return time.monotonic()
+
+    def _abandon(self, waiter):
+        if waiter.done():
+            # Admitted in the same instant the caller gave up; hand the slot on
+            self.in_flight -= 1
+            self._wake()
+        else:
+            waiter.cancel()
+            self._waiters.remove(waiter)
+
+    def _decrease(self, admitted_at, factor):
+        # One burst of failures is one signal: calls admitted before the last cut don't cut again
+        if admitted_at < self._last_decrease:
+            return
+        self.limit = max(self.min_limit, self.limit * factor)
+        self._last_decrease = time.monotonic()
+
+    def _wake(self):
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(self._admit())
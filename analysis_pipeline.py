@@ -0,0 +1,963 @@
+"""
+Transport-independent analysis pipeline shared by the gRPC servers.
+
+The pipeline validates the image, consults the result cache, streams the
+Gemini response and parses it. It is written against asyncio so a single
+process can keep many slow model calls in flight; failures are raised as
+AnalysisError carrying the gRPC status code the servicers report.
+"""
+import asyncio
+import functools
+import hashlib
+import logging
+import math
+import multiprocessing
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import grpc
+import httpx
+from google.genai import types
+from dotenv import load_dotenv
+
+from result_cache import ResultCache, make_cache_key, cache_key_scope, config_fingerprint
+from perceptual_hash import NearDuplicateIndex
+from image_preprocessing import preprocess_image
+from image_validation import DecompressionBomb, InvalidImage, inspect_image
+from image_fetcher import ImageFetcher, ImageTooLarge, NotAnImage, normalize_url
+from product_images import SMALL_EDGE, choose_max_edge, distinct_images
+from single_flight import SingleFlight
+from clients import get_client_pool
+from response_parser import IncrementalFieldExtractor, ResponseParseError, parse_gemini_response
+from metrics import observe_cascade, observe_memory, observe_model, observe_stage, stage
+from admission import AdmissionController, AdmissionRejected, is_overload_error
+from key_pool import KeySpec, NoKeyAvailable, is_key_failure, parse_api_keys, split_quota
+from hedging import Hedger
+from model_cascade import CHECKS, ModelCascade, Tier, configure, parse_tiers
+from prompt_cache import PromptCache, is_cache_error
+from product_research import (
+    COMPOSE_PROMPT, IDENTIFY_PROMPT, RESEARCH_PROMPT, TWO_STAGE_VERSION, compose_request, identity_key,
+    parse_identity, parse_research, research_request,
+)
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+# Aynı anahtarları kullanan süreç sayısı; anahtar kotaları ve kabul bütçeleri bu sayıya bölünür
+# (çok süreçli sunucuda süpervizör GRPC_WORKER_PROCESSES değerini verir)
+GEMINI_QUOTA_SHARES = max(1, int(os.getenv("GEMINI_QUOTA_SHARES", "1")))
+# Birden fazla anahtar/proje: "anahtar1,anahtar2:rpm:tpm"; rpm/tpm verilmezse varsayılanlar kullanılır
+GEMINI_KEY_RPM = int(os.getenv("GEMINI_KEY_RPM", "150"))
+GEMINI_KEY_TPM = int(os.getenv("GEMINI_KEY_TPM", "2000000"))
+API_KEYS = split_quota(
+    parse_api_keys(os.getenv("GOOGLE_API_KEYS") or GOOGLE_API_KEY or "", GEMINI_KEY_RPM, GEMINI_KEY_TPM)
+    or [KeySpec(GOOGLE_API_KEY, GEMINI_KEY_RPM, GEMINI_KEY_TPM)],
+    GEMINI_QUOTA_SHARES,
+)
+# Gerçek kullanım yanıtla gelene kadar bir çağrı için ayrılan tahmini token sayısı
+GEMINI_ESTIMATED_TOKENS = int(os.getenv("GEMINI_ESTIMATED_TOKENS", "4000"))
+# 429/5xx alan çağrının denenebileceği en fazla anahtar sayısı
+GEMINI_MAX_KEY_ATTEMPTS = int(os.getenv("GEMINI_MAX_KEY_ATTEMPTS", "3"))
+MODEL_NAME = "gemini-2.5-pro"
+MAX_IMAGE_BYTES = 10 * 1024 * 1024
+# Başlığında bundan fazla piksel (genişlik × yükseklik) bildiren görseller çözülmeden reddedilir
+MAX_IMAGE_PIXELS = int(os.getenv("MAX_IMAGE_PIXELS", "50000000"))
+
+# Sonuç önbelleği ayarları
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "10000"))
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+RESULT_CACHE_TTL_SECONDS = int(os.getenv("RESULT_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+RESULT_CACHE_DB_PATH = os.getenv("RESULT_CACHE_DB_PATH", "")
+# Yeniden boyutlandırılmış/sıkıştırılmış kopyalar için algısal hash eşiği (negatif değer kapatır)
+NEAR_DUPLICATE_MAX_DISTANCE = int(os.getenv("NEAR_DUPLICATE_MAX_DISTANCE", "6"))
+NEAR_DUPLICATE_MAX_ENTRIES = int(os.getenv("NEAR_DUPLICATE_MAX_ENTRIES", "1000000"))
+# Modele gönderilmeden önce görselin küçültülmesi; işlem havuzu 0 ise iş parçacığında çalışır
+PREPROCESS_MAX_EDGE = int(os.getenv("PREPROCESS_MAX_EDGE", "1536"))
+PREPROCESS_FORMAT = os.getenv("PREPROCESS_FORMAT", "JPEG").upper()
+PREPROCESS_QUALITY = int(os.getenv("PREPROCESS_QUALITY", "85"))
+PREPROCESS_WORKERS = int(os.getenv("PREPROCESS_WORKERS", str(os.cpu_count() or 1)))
+# URL indirme: bağlantı/okuma/toplam süre sınırları ve ETag/Last-Modified ile disk önbelleği
+URL_CONNECT_TIMEOUT = float(os.getenv("URL_CONNECT_TIMEOUT", "5"))
+URL_READ_TIMEOUT = float(os.getenv("URL_READ_TIMEOUT", "10"))
+URL_TOTAL_TIMEOUT = float(os.getenv("URL_TOTAL_TIMEOUT", "30"))
+URL_CACHE_DIR = os.getenv("URL_CACHE_DIR", "")
+URL_CACHE_MAX_BYTES = int(os.getenv("URL_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+# Toplu istek ayarları
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "1000"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "16"))
+# Bir toplu istekte yüklenen görsellerin toplam boyutu; gRPC mesaj sınırı buna göre ayarlanır.
+# Daha büyük kataloglar URL öğeleriyle ya da SubmitAnalysis ile gönderilmelidir
+BATCH_MAX_BYTES = int(os.getenv("BATCH_MAX_BYTES", str(16 * MAX_IMAGE_BYTES)))
+# Model çağrısı kabul kontrolü: saniyede en fazla istek (0 = sınırsız), AIMD eşzamanlılık sınırı ve bekleme kuyruğu
+# Ayarlar tüm sunucu için verilir; her süreç GEMINI_QUOTA_SHARES'te bir payını kullanır
+ADMISSION_RATE = float(os.getenv("ADMISSION_RATE", "0")) / GEMINI_QUOTA_SHARES
+ADMISSION_BURST = max(1, int(os.getenv("ADMISSION_BURST", "10")) // GEMINI_QUOTA_SHARES)
+ADMISSION_MIN_LIMIT = int(os.getenv("ADMISSION_MIN_LIMIT", "1"))
+ADMISSION_INITIAL_LIMIT = max(ADMISSION_MIN_LIMIT, int(os.getenv("ADMISSION_INITIAL_LIMIT", "32")) // GEMINI_QUOTA_SHARES)
+ADMISSION_MAX_LIMIT = max(ADMISSION_MIN_LIMIT, int(os.getenv("ADMISSION_MAX_LIMIT", "256")) // GEMINI_QUOTA_SHARES)
+ADMISSION_MAX_QUEUE = max(1, int(os.getenv("ADMISSION_MAX_QUEUE", "256")) // GEMINI_QUOTA_SHARES)
+# Bu süreyi (saniye) aşan model çağrıları sınırı düşürür (0 = yalnızca 429/503 sinyali)
+ADMISSION_LATENCY_THRESHOLD = float(os.getenv("ADMISSION_LATENCY_THRESHOLD", "0"))
+# Yedek (hedge) istek: ilk parça HEDGE_QUANTILE gecikmesinde gelmezse aynı çağrı ikinci kez yapılır
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "false").lower() == "true"
+HEDGE_QUANTILE = float(os.getenv("HEDGE_QUANTILE", "0.9"))
+# Çağrı başına ek çağrı payı (0.05 = en fazla %5 fazladan çağrı)
+HEDGE_BUDGET = float(os.getenv("HEDGE_BUDGET", "0.05"))
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "1.0"))
+# Model kademesi: "hızlı-model:düşünme-bütçesi,...,gemini-2.5-pro" ucuzdan pahalıya; boşsa yalnızca MODEL_NAME
+MODEL_CASCADE = os.getenv("MODEL_CASCADE", "")
+# Ara kademe cevabında aranan koşullar (json,title,length,turkish); biri tutmazsa sonraki modele geçilir
+MODEL_CASCADE_CHECKS = os.getenv("MODEL_CASCADE_CHECKS", ",".join(CHECKS))
+# Statik istem Gemini tarafında önbelleğe alınır (cached content); isteklerde yalnızca görsel gönderilir
+PROMPT_CACHE_ENABLED = os.getenv("PROMPT_CACHE_ENABLED", "false").lower() == "true"
+PROMPT_CACHE_TTL_SECONDS = int(os.getenv("PROMPT_CACHE_TTL_SECONDS", "3600"))
+# Süresinin dolmasına bu kadar saniye kala önbellek arka planda yenilenir
+PROMPT_CACHE_REFRESH_SECONDS = int(os.getenv("PROMPT_CACHE_REFRESH_SECONDS", "300"))
+# İki aşamalı akış: ucuz bir çağrı ürünü tanır, aramalı pazar araştırması ürün kimliği başına önbelleğe alınır
+TWO_STAGE_ENABLED = os.getenv("TWO_STAGE_ENABLED", "false").lower() == "true"
+IDENTIFY_MODEL = os.getenv("IDENTIFY_MODEL", "gemini-2.5-flash")
+IDENTIFY_THINKING_BUDGET = int(os.getenv("IDENTIFY_THINKING_BUDGET", "0"))
+RESEARCH_MODEL = os.getenv("RESEARCH_MODEL", "gemini-2.5-pro")
+# İstemdeki "son 12 ay" kuralı: araştırma sonuçları en fazla bir yıl kullanılır
+RESEARCH_TTL_SECONDS = int(os.getenv("RESEARCH_TTL_SECONDS", str(365 * 24 * 3600)))
+RESEARCH_CACHE_MAX_ENTRIES = int(os.getenv("RESEARCH_CACHE_MAX_ENTRIES", "100000"))
+RESEARCH_CACHE_DB_PATH = os.getenv("RESEARCH_CACHE_DB_PATH", "")
+# Tek ürünün birden fazla görseli tek model çağrısında (GenerateFromProductImages)
+PRODUCT_MAX_IMAGES = int(os.getenv("PRODUCT_MAX_IMAGES", "16"))
+# Görsellerin toplam token bütçesi; aşılırsa hepsi aynı kenar uzunluğuna küçültülür
+PRODUCT_MAX_IMAGE_TOKENS = int(os.getenv("PRODUCT_MAX_IMAGE_TOKENS", "10000"))
+# Görsellerin toplam boyutu; base64 ile büyüyen istek Gemini'nin 20MB satır içi sınırının altında kalır
+PRODUCT_MAX_BYTES = int(os.getenv("PRODUCT_MAX_BYTES", str(12 * 1024 * 1024)))
+
+
+# source_bytes is what the client sent (the cache is keyed on it); payload is what the model gets
+PreparedImage = namedtuple("PreparedImage", "source_bytes payload mime_type fingerprint")
+
+
+class AnalysisError(Exception):
+    """Request failure carrying the gRPC status code to report"""
+
+    def __init__(self, code, details):
+        super().__init__(details)
+        self.code = code
+        self.details = details
+
+
+def _batch_item_key(kind, args):
+    """Deduplication key for a batch item: content hash for uploads, URL for links"""
+    if kind == "image":
+        image_bytes, filename, content_type = args
+        return kind, hashlib.sha256(image_bytes).hexdigest(), filename, content_type
+    if kind == "image_url":
+        return kind, normalize_url(args[0])
+    return kind, id(args)
+
+
+async def _gather_all(coros):
+    """Run coroutines concurrently and return their results; the first failure cancels the rest"""
+    tasks = [asyncio.ensure_future(coro) for coro in coros]
+    try:
+        return await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+# Görsel doğrulama fonksiyonu
+def validate_image(image_bytes):
+    """
+    Format, real MIME type and dimensions read from the file header without decoding pixels.
+    The filename and content type the client sent are not trusted; raises AnalysisError.
+    """
+    try:
+        return inspect_image(image_bytes, MAX_IMAGE_PIXELS)
+    except DecompressionBomb:
+        raise AnalysisError(
+            grpc.StatusCode.INVALID_ARGUMENT, f"Resim çözünürlüğü çok büyük. Maksimum {MAX_IMAGE_PIXELS} piksel desteklenir."
+        )
+    except InvalidImage:
+        raise AnalysisError(grpc.StatusCode.INVALID_ARGUMENT, "Geçersiz resim formatı.")
+
+def create_prompt():
+    return """
+<prompt>
+  <role>Bir e-ticaret içerik uzmanı ve pazar araştırmacısı olarak çalışıyorsun. Amacın, görseldeki ürünü analiz ederek SEO uyumlu, profesyonel ve satışa yönelik bir ürün tanıtımı hazırlamak.</role>
+
+  <workflow>
+    <step index="1">Görseli incele ve ürünü doğru şekilde tanımla (model/seri, malzeme, renk, form, ayırt edici detaylar).</step>
+    <step index="2">Zorunlu web araması yap: güncel pazar bilgilerini topla (fiyat aralıkları, rakip/benzer ürünler, teknik özellikler, trendler, talep/yorum içgörüleri).</step>
+    <step index="3">En az 3 benzer ürünü fiyat aralığı ve öne çıkan özelliklerle özetle; mümkünse bölge/para birimini belirt.</step>
+    <step index="4">Toplanan verileri kullanarak yalnızca belirtilen JSON formatında yanıt ver.</step>
+  </workflow>
+
+  <web_search required="true">
+    <must_include>Fiyat aralıkları; benzer ürünlerin marka/modeli; temel özellikler; en az 3 kaynak URL.</must_include>
+    <freshness>Güncel bilgiye öncelik ver (son 12 ay).</freshness>
+    <disclaimer>Varsayım yapma; belirsizse "bilgi yetersiz" de.</disclaimer>
+  </web_search>
+
+  <output>
+    <format>JSON</format>
+    <constraints>
+      <title max_chars="60"/>
+      <description word_count_min="150" word_count_max="300"/>
+      <language>Turkish</language>
+      <return_only_json>true</return_only_json>
+    </constraints>
+    <json_template><![CDATA[
+{
+  "title": "SEO uyumlu ürün başlığı (en fazla 60 karakter)",
+  "description": "150-300 kelime: görsel özellikler, kullanım alanları, hedef kitle ve pazardan güncel bulgularla desteklenen, profesyonel ve ikna edici açıklama. Doğal SEO anahtar kelimeleri kullan.",
+  "search_info": "Web aramasından elde edilen özet bulgular + kısa kaynak listesi (URL'lerle)."
+}
+    ]]></json_template>
+  </output>
+
+  <style>
+    <tone>Profesyonel, ikna edici, satış odaklı</tone>
+    <seo>Doğal anahtar kelimeler; başlıkta birincil anahtar kelime; açıklamada semantik varyasyonlar</seo>
+  </style>
+
+  <rules>
+    <rule>Görselden gözlemlenebilir özellikleri (malzeme, tasarım, renk, boyut izlenimi) açıkça belirt.</rule>
+    <rule>Web aramasından öğrendiğin güncel bilgileri açıklamaya entegre et.</rule>
+    <rule>Kullanım alanlarını ve hedef kitleyi netleştir.</rule>
+    <rule>Genellemeden kaçın; veriye dayalı yaz.</rule>
+    <rule>Çıktıyı yalnızca belirtilen JSON formatında üret; JSON dışına çıkma.</rule>
+  </rules>
+</prompt>
+"""
+
+def product_images_note(count):
+    """Text sent ahead of the photos when one request carries several images of the same product"""
+    return (
+        f"Aşağıdaki {count} görsel aynı ürüne ait (farklı açılar, etiket ve detay çekimleri). "
+        "Tüm görselleri birlikte değerlendir ve ürün için tek bir başlık ve açıklama yaz."
+    )
+
+
+# İstem ve model ayarları açılışta bir kez kurulur; her istek aynı nesneleri kullanır
+PROMPT = create_prompt()
+PROMPT_PART = types.Part.from_text(text=PROMPT)
+# Prompt metni değiştiğinde önbellekteki eski sonuçlar otomatik olarak geçersiz olur
+PROMPT_VERSION = hashlib.sha256(PROMPT.encode("utf-8")).hexdigest()[:12]
+
+SAFETY_SETTINGS = [
+    types.SafetySetting(
+        category=category,
+        threshold="BLOCK_ONLY_HIGH",  # Block few
+    )
+    for category in (
+        "HARM_CATEGORY_HARASSMENT",
+        "HARM_CATEGORY_HATE_SPEECH",
+        "HARM_CATEGORY_SEXUALLY_EXPLICIT",
+        "HARM_CATEGORY_DANGEROUS_CONTENT",
+    )
+]
+
+
+def _request_contents(template, parts, with_prompt=True):
+    """Request contents; the template's prompt is left out when the model already has it cached"""
+    return [types.Content(role="user", parts=[template.prompt_part, *parts] if with_prompt else parts)]
+
+
+def _image_upload_config():
+    tools = [
+        types.Tool(url_context=types.UrlContext()),
+        types.Tool(googleSearch=types.GoogleSearch())
+        ]
+    return types.GenerateContentConfig(
+        temperature=0.7,
+        thinking_config=types.ThinkingConfig(thinking_budget=-1),
+        safety_settings=SAFETY_SETTINGS,
+        tools=tools,
+    )
+
+
+def _image_url_config():
+    tools = [types.Tool(googleSearch=types.GoogleSearch())]
+    return types.GenerateContentConfig(
+        thinking_config=types.ThinkingConfig(thinking_budget=-1),
+        tools=tools,
+    )
+
+
+def _identify_config():
+    return types.GenerateContentConfig(
+        temperature=0.2,
+        response_mime_type="application/json",
+        safety_settings=SAFETY_SETTINGS,
+    )
+
+
+def _research_config():
+    return types.GenerateContentConfig(
+        thinking_config=types.ThinkingConfig(thinking_budget=-1),
+        tools=[types.Tool(googleSearch=types.GoogleSearch())],
+    )
+
+
+def _compose_config():
+    return types.GenerateContentConfig(
+        temperature=0.7,
+        response_mime_type="application/json",
+        safety_settings=SAFETY_SETTINGS,
+    )
+
+
+UPLOAD_CONFIG = _image_upload_config()
+URL_CONFIG = _image_url_config()
+IDENTIFY_CONFIG = _identify_config()
+RESEARCH_CONFIG = _research_config()
+COMPOSE_CONFIG = _compose_config()
+
+
+class RequestTemplate:
+    """
+    Static prompt and generation config of one kind of model call, built once,
+    with a config copy per model tier.
+
+    `version` fingerprints the config and the preprocessing settings (they change
+    what the model sees) and is part of the result cache key.
+    """
+
+    def __init__(self, name, prompt, config, tiers):
+        self.name = name
+        self.prompt_part = prompt if isinstance(prompt, types.Part) else types.Part.from_text(text=prompt)
+        self.tools = config.tools
+        self.tiers = tiers
+        self.configs = [configure(config, tier) for tier in tiers]
+        self.version = config_fingerprint((config, PREPROCESS_MAX_EDGE, PREPROCESS_FORMAT, PREPROCESS_QUALITY))
+
+
+class AnalysisPipeline:
+    """Validation, caching, model call and parsing for both image RPCs"""
+
+    def __init__(self, result_cache=None, near_duplicates=None, clients=None, fetcher=None, admission=None,
+                 hedger=None, cascade=None, prompt_cache=None, research_store=None, two_stage=None):
+        self.clients = clients or get_client_pool(API_KEYS)
+        self.fetcher = fetcher or ImageFetcher(
+            self.clients,
+            max_bytes=MAX_IMAGE_BYTES,
+            connect_timeout=URL_CONNECT_TIMEOUT,
+            read_timeout=URL_READ_TIMEOUT,
+            total_timeout=URL_TOTAL_TIMEOUT,
+            cache_dir=URL_CACHE_DIR or None,
+            cache_max_bytes=URL_CACHE_MAX_BYTES,
+        )
+        self.single_flight = SingleFlight()
+        self.admission = admission or AdmissionController(
+            rate=ADMISSION_RATE,
+            burst=ADMISSION_BURST,
+            initial_limit=ADMISSION_INITIAL_LIMIT,
+            min_limit=ADMISSION_MIN_LIMIT,
+            max_limit=ADMISSION_MAX_LIMIT,
+            max_queue=ADMISSION_MAX_QUEUE,
+            latency_threshold=ADMISSION_LATENCY_THRESHOLD,
+        )
+        self.hedger = hedger or Hedger(
+            enabled=HEDGE_ENABLED,
+            quantile=HEDGE_QUANTILE,
+            budget=HEDGE_BUDGET,
+            min_delay=HEDGE_MIN_DELAY,
+        )
+        self.cascade = cascade or ModelCascade(
+            parse_tiers(MODEL_CASCADE, MODEL_NAME),
+            [check.strip() for check in MODEL_CASCADE_CHECKS.split(",") if check.strip()],
+        )
+        self.upload_template = RequestTemplate("upload", PROMPT_PART, UPLOAD_CONFIG, self.cascade.tiers)
+        self.url_template = RequestTemplate("url", PROMPT_PART, URL_CONFIG, self.cascade.tiers)
+        self.two_stage = TWO_STAGE_ENABLED if two_stage is None else two_stage
+        self.identify_template = RequestTemplate(
+            "identify", IDENTIFY_PROMPT, IDENTIFY_CONFIG, [Tier(IDENTIFY_MODEL, IDENTIFY_THINKING_BUDGET)]
+        )
+        self.research_template = RequestTemplate(
+            "research", RESEARCH_PROMPT, RESEARCH_CONFIG, [Tier(RESEARCH_MODEL, -1)]
+        )
+        self.compose_template = RequestTemplate("compose", COMPOSE_PROMPT, COMPOSE_CONFIG, self.cascade.tiers)
+        # Market research per product identity, kept for the prompt's 12-month freshness window
+        self.research_store = research_store or ResultCache(
+            max_entries=RESEARCH_CACHE_MAX_ENTRIES,
+            ttl_seconds=RESEARCH_TTL_SECONDS,
+            db_path=RESEARCH_CACHE_DB_PATH or None,
+        )
+        self._research_stats = {"identified": 0, "unidentified": 0, "researched": 0, "research_failed": 0}
+        self._product_stats = {"requests": 0, "images": 0, "duplicates": 0, "downscaled": 0}
+        self.prompt_cache = prompt_cache or PromptCache(
+            display_name=f"product-analyzer-{PROMPT_VERSION}",
+            enabled=PROMPT_CACHE_ENABLED,
+            ttl_seconds=PROMPT_CACHE_TTL_SECONDS,
+            refresh_seconds=PROMPT_CACHE_REFRESH_SECONDS,
+        )
+        self._preprocess_pool = self._new_preprocess_pool()
+        self._preprocess_stats = {
+            "images": 0, "original_bytes": 0, "bytes_saved": 0, "decoded_bytes": 0, "decode_seconds": 0.0,
+            "peak_request_bytes": 0,
+        }
+        # One cache for every RPC, but the key includes the request template: uploads and URLs use
+        # different model configs, so the same image is cached once per RPC
+        self.result_cache = result_cache or ResultCache(
+            max_entries=RESULT_CACHE_MAX_ENTRIES,
+            max_bytes=RESULT_CACHE_MAX_BYTES,
+            ttl_seconds=RESULT_CACHE_TTL_SECONDS,
+            db_path=RESULT_CACHE_DB_PATH or None,
+        )
+        self.near_duplicates = near_duplicates or NearDuplicateIndex(
+            max_distance=NEAR_DUPLICATE_MAX_DISTANCE,
+            max_entries=NEAR_DUPLICATE_MAX_ENTRIES,
+        )
+        # Evicted results must not stay reachable as near-duplicate matches
+        self.result_cache.on_evict = lambda key: self.near_duplicates.remove(key, cache_key_scope(key))
+        for key, fingerprint in self.result_cache.fingerprints():
+            self.near_duplicates.add(fingerprint, key, cache_key_scope(key))
+
+    async def generate_from_image(self, image_bytes, filename, content_type, deadline=None):
+        """
+        Analyse an uploaded image and return a title/description/search_info dict.
+
+        deadline is the caller's time.monotonic() deadline; requests that cannot
+        finish in time are rejected before the model is called.
+        """
+        prepared = await self._check_upload(image_bytes)
+        return await self._generate(prepared, self.upload_template, "Gemini API hatası", deadline)
+
+    async def generate_from_image_stream(self, image_bytes, filename, content_type, deadline=None):
+        """
+        Analyse an uploaded image, yielding ("text_delta", text) and ("field", (name, value))
+        events while the model streams, followed by a final ("result", dict) event.
+        """
+        prepared = await self._check_upload(image_bytes)
+        cache_key = self._cache_key(prepared.source_bytes, self.upload_template)
+        async for event in self._generate_events(
+            [prepared], self.upload_template, cache_key, "Gemini API hatası", deadline
+        ):
+            yield event
+
+    async def _check_upload(self, image_bytes):
+        """Validate and preprocess an uploaded image"""
+        self._validate_upload(image_bytes)
+        try:
+            return await self._prepare(image_bytes)
+        except AnalysisError:
+            raise
+        except Exception as e:
+            raise AnalysisError(grpc.StatusCode.INVALID_ARGUMENT, f"Resim dosyası işlenirken hata: {str(e)}")
+
+    def _validate_upload(self, image_bytes):
+        """Size and header checks of an uploaded image; returns its ImageInfo"""
+        # Görsel doğrulama
+        with stage("validate"):
+            if len(image_bytes) > MAX_IMAGE_BYTES:
+                raise AnalysisError(grpc.StatusCode.INVALID_ARGUMENT, "Resim dosyası çok büyük. Maksimum 10MB desteklenir.")
+            return validate_image(image_bytes)
+
+    async def generate_from_image_url(self, image_url, deadline=None):
+        """Download an image from a URL and analyse it"""
+        if not image_url:
+            raise AnalysisError(grpc.StatusCode.INVALID_ARGUMENT, "Image URL is required")
+        # Coalesce the download as well as the model call for the same URL
+        return await self.single_flight.do(
+            f"url:{normalize_url(image_url)}", lambda: self._generate_from_image_url(image_url, deadline)
+        )
+
+    async def _generate_from_image_url(self, image_url, deadline):
+        image_bytes, _ = await self._fetch_image(image_url)
+        # Validate image can be processed
+        try:
+            prepared = await self._prepare(image_bytes)
+        except AnalysisError:
+            raise
+        except Exception as e:
+            raise AnalysisError(grpc.StatusCode.INVALID_ARGUMENT, f"Error processing image: {str(e)}")
+        return await self._generate(prepared, self.url_template, "Gemini API error", deadline)
+
+    async def _fetch_image(self, image_url):
+        """Download an image and check its header; returns (image_bytes, ImageInfo)"""
+        try:
+            # Download image from URL; type and size are checked while streaming
+            with stage("url_download"):
+                image_bytes, content_type = await self.fetcher.fetch(image_url)
+
+            # The Content-Type header only got the download started; the bytes decide
+            try:
+                return image_bytes, inspect_image(image_bytes, MAX_IMAGE_PIXELS)
+            except DecompressionBomb:
+                raise AnalysisError(
+                    grpc.StatusCode.INVALID_ARGUMENT, f"Image resolution is too large. Maximum {MAX_IMAGE_PIXELS} pixels supported."
+                )
+            except InvalidImage:
+                raise NotAnImage(content_type)
+
+        except AnalysisError:
+            raise
+        except NotAnImage as e:
+            raise AnalysisError(grpc.StatusCode.INVALID_ARGUMENT, f"URL does not point to an image. Content-Type: {e.content_type}")
+        except ImageTooLarge:
+            raise AnalysisError(grpc.StatusCode.INVALID_ARGUMENT, "Image file is too large. Maximum 10MB supported.")
+        except asyncio.TimeoutError:
+            raise AnalysisError(grpc.StatusCode.INVALID_ARGUMENT, "Error downloading image from URL: download timed out")
+        except httpx.HTTPError as e:
+            raise AnalysisError(grpc.StatusCode.INVALID_ARGUMENT, f"Error downloading image from URL: {str(e)}")
+        except Exception as e:
+            raise AnalysisError(grpc.StatusCode.INTERNAL, f"Unexpected error: {str(e)}")
+
+    async def generate_batch(self, items, deadline=None):
+        """
+        Analyse many images with bounded concurrency, yielding (index, result, error)
+        as each one finishes. Items are ("image", (image_bytes, filename, content_type))
+        or ("image_url", (image_url,)); identical items are analysed only once.
+        """
+        if len(items) > BATCH_MAX_ITEMS:
+            raise AnalysisError(grpc.StatusCode.INVALID_ARGUMENT, f"Batch too large. Maximum {BATCH_MAX_ITEMS} items supported.")
+        uploaded = sum(len(args[0]) for kind, args in items if kind == "image")
+        if uploaded > BATCH_MAX_BYTES:
+            raise AnalysisError(
+                grpc.StatusCode.INVALID_ARGUMENT,
+                f"Batch images too large in total. Maximum {BATCH_MAX_BYTES} bytes supported; "
+                "send larger catalogs as image URLs or through SubmitAnalysis.",
+            )
+
+        indices_by_key = {}
+        item_by_key = {}
+        for index, item in enumerate(items):
+            key = _batch_item_key(*item)
+            if key not in indices_by_key:
+                indices_by_key[key] = []
+                item_by_key[key] = item
+            indices_by_key[key].append(index)
+
+        semaphore = asyncio.Semaphore(BATCH_MAX_CONCURRENCY)
+
+        async def run(key):
+            kind, args = item_by_key[key]
+            async with semaphore:
+                try:
+                    if kind == "image":
+                        return key, await self.generate_from_image(*args, deadline=deadline), None
+                    if kind == "image_url":
+                        return key, await self.generate_from_image_url(*args, deadline=deadline), None
+                    return key, None, AnalysisError(grpc.StatusCode.INVALID_ARGUMENT, "Batch item has no image or image_url")
+                except AnalysisError as e:
+                    return key, None, e
+                except Exception as e:
+                    return key, None, AnalysisError(grpc.StatusCode.INTERNAL, f"Unexpected error: {str(e)}")
+
+        tasks = [asyncio.ensure_future(run(key)) for key in indices_by_key]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                key, result, error = await next_done
+                for index in indices_by_key[key]:
+                    yield index, result, error
+        finally:
+            # The caller went away or stopped reading; don't keep spending model calls
+            for task in tasks:
+                task.cancel()
+
+    async def generate_from_product_images(self, items, deadline=None):
+        """
+        Analyse several photos of one product (angles, label close-ups) in a single model
+        call and return one title/description/search_info dict. Items are given as for
+        generate_batch. Photos are loaded in parallel, duplicates dropped and the rest
+        downscaled until they fit PRODUCT_MAX_IMAGE_TOKENS and PRODUCT_MAX_BYTES.
+        """
+        if not items:
+            raise AnalysisError(grpc.StatusCode.INVALID_ARGUMENT, "At least one image is required")
+        if len(items) > PRODUCT_MAX_IMAGES:
+            raise AnalysisError(
+                grpc.StatusCode.INVALID_ARGUMENT, f"Too many images. Maximum {PRODUCT_MAX_IMAGES} per product supported."
+            )
+        self._product_stats["requests"] += 1
+        self._product_stats["images"] += len(items)
+
+        # The same upload or URL given twice is loaded once
+        unique = {}
+        for index, item in enumerate(items):
+            unique.setdefault(_batch_item_key(*item), (index, item))
+        loaded = await _gather_all(self._load_product_image(index, *item) for index, item in unique.values())
+        # Different URLs, or an upload and a URL, can still be the same file
+        sources = {}
+        for index, (image_bytes, info) in zip([index for index, _ in unique.values()], loaded):
+            sources.setdefault(hashlib.sha256(image_bytes).digest(), (index, image_bytes, info))
+        sources = list(sources.values())
+
+        if len(sources) == 1:
+            self._product_stats["duplicates"] += len(items) - 1
+            _, image_bytes, _ = sources[0]
+            prepared = await self._prepare_product_image(0, image_bytes, PREPROCESS_MAX_EDGE)
+            # A single distinct photo is an ordinary upload and shares its cache entry
+            return await self._generate(prepared, self.upload_template, "Gemini API hatası", deadline)
+
+        max_edge = choose_max_edge(
+            [(info.width, info.height) for _, _, info in sources], PRODUCT_MAX_IMAGE_TOKENS, PREPROCESS_MAX_EDGE
+        )
+        prepared = await _gather_all(
+            self._prepare_product_image(index, image_bytes, max_edge) for index, image_bytes, _ in sources
+        )
+        # Resized or recompressed copies of the same shot add nothing but tokens
+        kept = distinct_images([image.fingerprint for image in prepared], NEAR_DUPLICATE_MAX_DISTANCE)
+        sources = [sources[i] for i in kept]
+        prepared = [prepared[i] for i in kept]
+        self._product_stats["duplicates"] += len(items) - len(prepared)
+
+        total_bytes = sum(len(image.payload) for image in prepared)
+        while total_bytes > PRODUCT_MAX_BYTES and max_edge > SMALL_EDGE:
+            # Payload size follows the pixel count, so scale the edge by the square root of the overshoot
+            max_edge = max(SMALL_EDGE, int(max_edge * math.sqrt(PRODUCT_MAX_BYTES / total_bytes) * 0.9))
+            prepared = await _gather_all(
+                self._prepare_product_image(index, image_bytes, max_edge) for index, image_bytes, _ in sources
+            )
+            total_bytes = sum(len(image.payload) for image in prepared)
+        if total_bytes > PRODUCT_MAX_BYTES:
+            raise AnalysisError(
+                grpc.StatusCode.INVALID_ARGUMENT, f"Images too large in total. Maximum {PRODUCT_MAX_BYTES} bytes supported."
+            )
+        if max_edge < PREPROCESS_MAX_EDGE:
+            self._product_stats["downscaled"] += 1
+
+        # The set of photos and the budgets decide what the model sees; the order does not matter
+        digests = sorted(hashlib.sha256(image.source_bytes).hexdigest() for image in prepared)
+        content = f"product:{PRODUCT_MAX_IMAGE_TOKENS}:{PRODUCT_MAX_BYTES}:{','.join(digests)}".encode("utf-8")
+        return await self._generate_images(
+            prepared, self.upload_template, self._cache_key(content, self.upload_template), "Gemini API hatası", deadline
+        )
+
+    async def _load_product_image(self, index, kind, args):
+        """Bytes and header info of one product photo; errors name the photo's position"""
+        try:
+            if kind == "image":
+                image_bytes = args[0]
+                return image_bytes, self._validate_upload(image_bytes)
+            if kind == "image_url":
+                if not args[0]:
+                    raise AnalysisError(grpc.StatusCode.INVALID_ARGUMENT, "Image URL is required")
+                return await self._fetch_image(args[0])
+            raise AnalysisError(grpc.StatusCode.INVALID_ARGUMENT, "Item has neither an image nor an image URL")
+        except AnalysisError as e:
+            raise AnalysisError(e.code, f"images[{index}]: {e.details}")
+
+    async def _prepare_product_image(self, index, image_bytes, max_edge):
+        try:
+            return await self._prepare(image_bytes, max_edge)
+        except AnalysisError as e:
+            raise AnalysisError(e.code, f"images[{index}]: {e.details}")
+        except Exception as e:
+            raise AnalysisError(grpc.StatusCode.INVALID_ARGUMENT, f"images[{index}]: Error processing image: {str(e)}")
+
+    def product_stats(self):
+        return dict(self._product_stats)
+
+    def preprocess_stats(self):
+        """Totals for the preprocessing stage across all requests"""
+        return dict(self._preprocess_stats)
+
+    def _new_preprocess_pool(self):
+        if PREPROCESS_WORKERS <= 0:
+            return None
+        # spawn, not fork: forking a process that already runs gRPC threads is unsafe
+        return ProcessPoolExecutor(max_workers=PREPROCESS_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+
+    async def _prepare(self, image_bytes, max_edge=PREPROCESS_MAX_EDGE):
+        """Downscale and re-encode the image in the process pool so decoding never blocks the loop"""
+        job = functools.partial(
+            preprocess_image, image_bytes, max_edge, PREPROCESS_FORMAT, PREPROCESS_QUALITY
+        )
+        try:
+            with stage("preprocess"):
+                payload, mime_type, fingerprint, stats = await asyncio.get_running_loop().run_in_executor(
+                    self._preprocess_pool, job
+                )
+        except BrokenProcessPool:
+            self._preprocess_pool = self._new_preprocess_pool()
+            raise AnalysisError(grpc.StatusCode.INTERNAL, "Image preprocessing worker crashed")
+
+        self._account_memory(stats, reencoded=payload is not None)
+        if payload is None:
+            payload = image_bytes
+        self._preprocess_stats["images"] += 1
+        self._preprocess_stats["original_bytes"] += stats["original_bytes"]
+        self._preprocess_stats["bytes_saved"] += stats["bytes_saved"]
+        self._preprocess_stats["decoded_bytes"] += stats["decoded_bytes"]
+        self._preprocess_stats["decode_seconds"] += stats["decode_seconds"]
+        observe_stage("decode", stats["decode_seconds"])
+        logger.debug(
+            "Preprocessed image %sx%s -> %sx%s, %d bytes saved, decode %.1f ms",
+            *stats["original_size"], *stats["payload_size"], stats["bytes_saved"], stats["decode_seconds"] * 1000,
+        )
+        return PreparedImage(image_bytes, payload, mime_type, fingerprint)
+
+    def _account_memory(self, stats, reencoded):
+        """
+        Estimate the bytes one request holds in this process at its peak: the source image,
+        a separate payload when it was re-encoded, and either the decoded bitmap (decoded
+        in-thread) or the pickled copy of the source sent to a pool worker.
+        """
+        source = stats["original_bytes"]
+        payload = stats["payload_bytes"] if reencoded else 0
+        decoding = source if self._preprocess_pool is not None else stats["decoded_bytes"]
+        peak = source + payload + decoding
+        observe_memory("source", source)
+        observe_memory("payload", stats["payload_bytes"])
+        observe_memory("decoded", stats["decoded_bytes"])
+        observe_memory("peak", peak)
+        self._preprocess_stats["peak_request_bytes"] = max(self._preprocess_stats["peak_request_bytes"], peak)
+
+    def _cache_key(self, content, template):
+        # Two-stage answers come from different prompts, so they get their own entries
+        prompt_version = f"{PROMPT_VERSION}+{TWO_STAGE_VERSION}" if self.two_stage else PROMPT_VERSION
+        return make_cache_key(content, prompt_version, self.cascade.name, template.version)
+
+    async def _generate(self, prepared, template, error_label, deadline=None):
+        cache_key = self._cache_key(prepared.source_bytes, template)
+        return await self._generate_images([prepared], template, cache_key, error_label, deadline)
+
+    async def _generate_images(self, images, template, cache_key, error_label, deadline=None):
+        async def generate():
+            async for kind, payload in self._generate_events(images, template, cache_key, error_label, deadline):
+                if kind == "result":
+                    return payload
+
+        # Identical images requested at the same moment share one model call
+        return await self.single_flight.do(cache_key, generate)
+
+    async def _generate_events(self, images, template, cache_key, error_label, deadline=None):
+        # Only a single image has a perceptual hash to match near-duplicates against
+        fingerprint = images[0].fingerprint if len(images) == 1 else None
+        with stage("cache_lookup"):
+            cached = self._lookup_cached(cache_key, fingerprint)
+        if cached is not None:
+            yield "result", cached
+            return
+
+        with stage("prompt_build"):
+            parts = [types.Part.from_bytes(data=image.payload, mime_type=image.mime_type) for image in images]
+            if len(images) > 1:
+                parts.insert(0, types.Part.from_text(text=product_images_note(len(images))))
+
+        research = None
+        if self.two_stage:
+            brief = await self._research_brief(parts, error_label, deadline)
+            if brief is not None:
+                identity, research = brief
+                # The description is written from the observations and the research; the image is not sent again
+                parts = [types.Part.from_text(text=compose_request(identity, research))]
+                template = self.compose_template
+
+        tiers = template.tiers
+        for index, tier in enumerate(tiers[:-1]):
+            # Earlier tiers are buffered: their answer reaches the client only if it passes the checks
+            try:
+                chunks = self._model_text(parts, template, index, error_label, deadline)
+                text = "".join([text async for text in chunks])
+            except AnalysisError as e:
+                # A bigger model does not help when the service is out of capacity or time
+                if e.code in (grpc.StatusCode.RESOURCE_EXHAUSTED, grpc.StatusCode.DEADLINE_EXCEEDED):
+                    raise
+                logger.warning("%s failed, escalating: %s", tier.model, e.details)
+                observe_cascade(tier.model, "error")
+                continue
+            with stage("parse"):
+                result, violations = self.cascade.check(text)
+            if violations:
+                observe_cascade(tier.model, violations[0])
+                continue
+            observe_cascade(tier.model, "accepted")
+            yield "text_delta", text
+            for field in IncrementalFieldExtractor().feed(text):
+                yield "field", field
+            if research is not None:
+                result["search_info"] = research["search_info"]
+            self._store_result(cache_key, fingerprint, result)
+            yield "result", result
+            return
+
+        tier = tiers[-1]
+        response_parts = []
+        extractor = IncrementalFieldExtractor()
+        try:
+            async for text in self._model_text(parts, template, len(tiers) - 1, error_label, deadline):
+                response_parts.append(text)
+                yield "text_delta", text
+                for field in extractor.feed(text):
+                    yield "field", field
+        except AnalysisError:
+            observe_cascade(tier.model, "error")
+            raise
+
+        try:
+            with stage("parse"):
+                result = parse_gemini_response("".join(response_parts))
+        except ResponseParseError as e:
+            observe_cascade(tier.model, "json")
+            raise AnalysisError(grpc.StatusCode.INTERNAL, str(e))
+        observe_cascade(tier.model, "accepted")
+        if research is not None:
+            result["search_info"] = research["search_info"]
+        self._store_result(cache_key, fingerprint, result)
+        yield "result", result
+
+    async def _research_brief(self, image_parts, error_label, deadline):
+        """
+        Identify the product and get its market research, from the store while fresh.
+        Returns (identity, research), or None to fall back to the single search-grounded call.
+        """
+        try:
+            with stage("identify"):
+                text = await self._model_answer(image_parts, self.identify_template, error_label, deadline)
+            identity = parse_identity(text)
+            if identity is None:
+                self._research_stats["unidentified"] += 1
+                return None
+            self._research_stats["identified"] += 1
+
+            key = identity_key(identity)
+            with stage("research_lookup"):
+                research = self.research_store.get(key)
+            if research is None:
+                async def run():
+                    with stage("research"):
+                        text = await self._model_answer(
+                            [types.Part.from_text(text=research_request(identity))],
+                            self.research_template, error_label, deadline,
+                        )
+                    found = parse_research(text)
+                    if found is not None:
+                        self._research_stats["researched"] += 1
+                        self.research_store.put(key, found)
+                    return found
+
+                # Several images of the same product arriving together share one research call
+                research = await self.single_flight.do(key, run)
+        except AnalysisError as e:
+            # A bigger call does not help when the service is out of capacity or time
+            if e.code in (grpc.StatusCode.RESOURCE_EXHAUSTED, grpc.StatusCode.DEADLINE_EXCEEDED):
+                raise
+            logger.warning("Two-stage analysis failed, falling back to a single call: %s", e.details)
+            research = None
+        if research is None:
+            self._research_stats["research_failed"] += 1
+            return None
+        return identity, research
+
+    def research_stats(self):
+        return dict(self._research_stats)
+
+    async def _model_answer(self, parts, template, error_label, deadline):
+        """Full text of a single-tier model call"""
+        return "".join([text async for text in self._model_text(parts, template, 0, error_label, deadline)])
+
+    async def _model_text(self, parts, template, tier_index, error_label, deadline):
+        """Admitted, hedged call to one tier of a template; yields the response text as it streams"""
+        model = template.tiers[tier_index].model
+        try:
+            with stage("admission_wait"):
+                admitted_at = await self.admission.acquire(deadline, model)
+        except AdmissionRejected as e:
+            raise AnalysisError(e.code, e.details)
+
+        # Anything that ends the stream early (client gone, cancellation) says nothing about model capacity
+        outcome = "cancelled"
+        try:
+            async with self.clients.track("gemini"):
+                started = time.perf_counter()
+                first_chunk = True
+                chunks = self.hedger.stream(
+                    lambda: self._stream_model(parts, template, tier_index), key=model
+                )
+                async for chunk in chunks:
+                    if first_chunk:
+                        observe_stage("model_first_chunk", time.perf_counter() - started)
+                        first_chunk = False
+                    # Grounding-only chunks carry no text
+                    if not chunk.text:
+                        continue
+                    yield chunk.text
+                observe_stage("model_stream", time.perf_counter() - started)
+                observe_model(model, time.perf_counter() - started)
+            outcome = "ok"
+        except NoKeyAvailable as e:
+            outcome = "overload"
+            raise AnalysisError(grpc.StatusCode.RESOURCE_EXHAUSTED, str(e))
+        except Exception as e:
+            outcome = "overload" if is_overload_error(e) else "error"
+            raise AnalysisError(grpc.StatusCode.INTERNAL, f"{error_label}: {str(e)}")
+        finally:
+            self.admission.release(admitted_at, outcome, model)
+
+    async def _stream_model(self, parts, template, tier_index):
+        """
+        Stream response chunks from the model on the API key with the most quota headroom.
+
+        A key that fails with 429/5xx before any text has arrived is ejected and the
+        call is retried on another key; once text has been streamed it cannot be retried.
+        Where the key has the prompt cached on the model side only the request's own parts are sent.
+        """
+        model = template.tiers[tier_index].model
+        tried = []
+        last_error = None
+        cache_retried = False
+        while len(tried) < GEMINI_MAX_KEY_ATTEMPTS:
+            try:
+                lease = self.clients.keys.acquire(GEMINI_ESTIMATED_TOKENS, exclude=tried)
+            except NoKeyAvailable:
+                if last_error is not None:
+                    raise last_error
+                raise
+            tried.append(lease.api_key)
+            tokens_used = None
+            error = None
+            streamed = False
+            cached_config = None
+            try:
+                with stage("prompt_cache"):
+                    cached_config = await self.prompt_cache.lookup(lease.api_key, model, template, tier_index)
+                if cached_config is None:
+                    contents, config = _request_contents(template, parts), template.configs[tier_index]
+                else:
+                    contents, config = _request_contents(template, parts, with_prompt=False), cached_config
+                async for chunk in await lease.client.aio.models.generate_content_stream(
+                    model=model,
+                    contents=contents,
+                    config=config,
+                ):
+                    usage = getattr(chunk, "usage_metadata", None)
+                    if usage is not None and usage.total_token_count:
+                        tokens_used = usage.total_token_count
+                    streamed = streamed or bool(chunk.text)
+                    yield chunk
+                return
+            except Exception as e:
+                error = e
+                if cached_config is not None and not streamed and is_cache_error(e):
+                    # The cached prompt expired or was deleted: recreate it and try the same key again
+                    self.prompt_cache.invalidate(lease.api_key, model, template, tier_index)
+                    if not cache_retried:
+                        cache_retried = True
+                        tried.remove(lease.api_key)
+                        last_error = e
+                        continue
+                if streamed or not is_key_failure(e):
+                    raise
+                last_error = e
+                logger.warning("Gemini call failed on %s, trying another key: %s", lease.api_key.label, e)
+            finally:
+                self.clients.keys.release(lease, tokens_used, error)
+        raise last_error
+
+    def _lookup_cached(self, cache_key, fingerprint):
+        """Exact cache hit first, then the closest perceptually similar image"""
+        cached = self.result_cache.get(cache_key)
+        if cached is not None or fingerprint is None:
+            return cached
+        match = self.near_duplicates.lookup(
+            fingerprint, cache_key_scope(cache_key), lambda key: self.result_cache.get(key, record_miss=False)
+        )
+        return match[2] if match is not None else None
+
+    def _store_result(self, cache_key, fingerprint, result):
+        self.result_cache.put(cache_key, result, fingerprint=fingerprint)
+        if fingerprint is not None:
+            self.near_duplicates.add(fingerprint, cache_key, cache_key_scope(cache_key))
@@ -0,0 +1,99 @@
+"""
+Regression check and microbenchmark for response_parser.
+
+Every case in parser_corpus.jsonl is parsed and compared with its expected
+fields (exit status 1 on any mismatch), then timed. A scaling run over
+synthetic search-heavy answers from 10 KB to 1 MB shows that parse time grows
+linearly with input size.
+
+    python benchmarks/bench_parser.py [--iterations N]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from response_parser import parse_gemini_response  # noqa: E402
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "parser_corpus.jsonl")
+SCALING_SIZES = (10_000, 100_000, 1_000_000)
+
+_ANSWER = json.dumps({
+    "title": "Paslanmaz Çelik Termos 750 ml",
+    "description": "Çift cidarlı vakum yalıtımlı, sızdırmaz kapaklı termos.",
+    "search_info": "Benzer ürünler 450-900 TL aralığında.",
+}, ensure_ascii=False)
+
+
+def load_corpus(path=CORPUS_PATH):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def check_corpus(cases):
+    failures = 0
+    for case in cases:
+        try:
+            result = parse_gemini_response(case["response"])
+        except ValueError as e:
+            result = {"error": str(e)[:120]}
+        if result != case["expected"]:
+            failures += 1
+            print(f"FAIL {case['name']}: {result}")
+    return failures
+
+
+def time_call(text, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        try:
+            parse_gemini_response(text)
+        except ValueError:
+            # Unparseable inputs are timed too; rejecting them must be just as cheap
+            pass
+    return (time.perf_counter() - started) / iterations
+
+
+def noisy_response(size):
+    """Citation noise full of stray braces and broken JSON, with the answer at the end"""
+    line = 'Kaynak https://example.com/urun?q={termos} fiyat {"min": 450, "max": } ...\n'
+    noise = line * (max(size - len(_ANSWER), 0) // len(line))
+    return noise + "```json\n" + _ANSWER + "\n```"
+
+
+def unclosed_response(size):
+    """Worst case for naive retry-at-every-brace parsing: nested objects that never close"""
+    return '{"a": ' * (size // 6) + _ANSWER
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    cases = load_corpus()
+    failures = check_corpus(cases)
+    print(f"corpus: {len(cases) - failures}/{len(cases)} cases passed")
+    if failures:
+        return 1
+
+    print(f"\n{'case':<36}{'bytes':>10}{'µs/parse':>12}")
+    for case in cases:
+        seconds = time_call(case["response"], args.iterations)
+        print(f"{case['name']:<36}{len(case['response'].encode('utf-8')):>10}{seconds * 1e6:>12.1f}")
+
+    print(f"\n{'scaling':<36}{'bytes':>10}{'ms/parse':>12}{'ns/byte':>10}")
+    for name, make in (("noisy_search_output", noisy_response), ("unclosed_nesting", unclosed_response)):
+        for size in SCALING_SIZES:
+            text = make(size)
+            iterations = max(args.iterations * SCALING_SIZES[0] // size, 3)
+            seconds = time_call(text, iterations)
+            print(f"{name:<36}{len(text):>10}{seconds * 1e3:>12.2f}{seconds * 1e9 / len(text):>10.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,201 @@
+"""
+Local stand-in for the Gemini streaming API, for offline load tests.
+
+FakeGeminiClient implements the calls the pipeline makes,
+`client.aio.models.generate_content_stream(model=..., contents=..., config=...)`
+and `client.aio.caches.create/update` for the cached prompt. It streams a
+well-formed answer with a configurable time to first chunk, token rate and
+failure mix; the identification and research prompts of the two-stage flow
+get answers of their own shape. `install` swaps it in for every API key in
+the process-wide client pool so the real server code runs unchanged on top
+of it.
+"""
+import asyncio
+import json
+import random
+
+import analysis_pipeline
+import clients
+
+CHARS_PER_TOKEN = 4
+FAILURE_MODES = ("error", "midstream", "malformed", "hang")
+
+_DESCRIPTION_WORDS = (
+    "paslanmaz çelik termos çift cidarlı vakum yalıtımı sayesinde içecekleri uzun süre sıcak ve soğuk tutar "
+    "sızdırmaz kapak ofis okul kamp ve seyahat için ideal ergonomik tasarım kaymaz yüzey kolay temizlik"
+).split()
+
+
+class FakeGeminiSettings:
+    def __init__(self, first_chunk_seconds=1.0, tokens_per_second=80.0, chunk_tokens=16,
+                 description_words=200, failure_rate=0.0, failure_modes=("error",), seed=None,
+                 ungrounded_first_chunk_seconds=None):
+        self.first_chunk_seconds = first_chunk_seconds
+        # Calls without search tools; defaults to first_chunk_seconds
+        self.ungrounded_first_chunk_seconds = ungrounded_first_chunk_seconds
+        self.tokens_per_second = tokens_per_second
+        self.chunk_tokens = chunk_tokens
+        self.description_words = description_words
+        self.failure_rate = failure_rate
+        self.failure_modes = tuple(failure_modes)
+        self.seed = seed
+
+
+class _Chunk:
+    def __init__(self, text):
+        self.text = text
+
+
+class _CachedContent:
+    def __init__(self, name, contents=None, tools=None):
+        self.name = name
+        self.contents = contents or []
+        self.tools = tools
+
+
+class _FakeCaches:
+    def __init__(self):
+        self.entries = {}
+        self.creates = 0
+        self.updates = 0
+
+    async def create(self, model, config=None):
+        self.creates += 1
+        name = f"cachedContents/fake-{self.creates}"
+        self.entries[name] = _CachedContent(name, config.contents, config.tools)
+        return self.entries[name]
+
+    async def update(self, name, config=None):
+        if name not in self.entries:
+            raise RuntimeError(f"404 NOT_FOUND: {name} (fake)")
+        self.updates += 1
+        return self.entries[name]
+
+
+class _FakeModels:
+    def __init__(self, settings, caches):
+        self.settings = settings
+        self.caches = caches
+        self._random = random.Random(settings.seed)
+        self.calls = 0
+
+    async def generate_content_stream(self, model, contents, config=None):
+        self.calls += 1
+        cached_content = getattr(config, "cached_content", None)
+        tools = getattr(config, "tools", None)
+        if cached_content:
+            if cached_content not in self.caches.entries:
+                raise RuntimeError("403 PERMISSION_DENIED: CachedContent not found (or permission denied) (fake)")
+            cached = self.caches.entries[cached_content]
+            contents = list(cached.contents) + list(contents)
+            tools = cached.tools
+        failure = None
+        if self._random.random() < self.settings.failure_rate:
+            failure = self._random.choice(self.settings.failure_modes)
+        if failure == "error":
+            await asyncio.sleep(self.settings.first_chunk_seconds * self._random.random())
+            raise RuntimeError("429 RESOURCE_EXHAUSTED (fake)")
+        first_chunk_seconds = self.settings.first_chunk_seconds
+        if not tools and self.settings.ungrounded_first_chunk_seconds is not None:
+            first_chunk_seconds = self.settings.ungrounded_first_chunk_seconds
+        kind = _prompt_kind(contents)
+        return self._stream(self._answer(model, failure == "malformed", kind), failure, first_chunk_seconds)
+
+    async def _stream(self, text, failure, first_chunk_seconds):
+        settings = self.settings
+        await asyncio.sleep(first_chunk_seconds)
+        if failure == "hang":
+            # Never answers; only the caller's deadline ends this call
+            await asyncio.Event().wait()
+        chunk_chars = settings.chunk_tokens * CHARS_PER_TOKEN
+        delay = settings.chunk_tokens / settings.tokens_per_second if settings.tokens_per_second > 0 else 0
+        for start in range(0, len(text), chunk_chars):
+            if failure == "midstream" and start >= len(text) // 2:
+                raise RuntimeError("503 UNAVAILABLE: stream reset (fake)")
+            yield _Chunk(text[start:start + chunk_chars])
+            await asyncio.sleep(delay)
+
+    def _answer(self, model, malformed, kind="analysis"):
+        if kind == "identify":
+            return json.dumps({
+                "brand": self._random.choice(["Stanley", "Thermos", ""]),
+                "model": "Classic 750",
+                "category": "paslanmaz çelik termos",
+                "observations": "Mat yeşil paslanmaz çelik gövde, katlanır sap ve vidalı kapak görülüyor.",
+            }, ensure_ascii=False)
+        if kind == "research":
+            return json.dumps({
+                "search_info": "Benzer ürünler 450-900 TL. Kaynaklar: https://example.com/a, https://example.com/b",
+            }, ensure_ascii=False)
+        words = [self._random.choice(_DESCRIPTION_WORDS) for _ in range(self.settings.description_words)]
+        answer = json.dumps({
+            "title": f"Paslanmaz Çelik Termos 750 ml ({model})",
+            "description": " ".join(words).capitalize() + ".",
+            "search_info": "Benzer ürünler 450-900 TL. Kaynaklar: https://example.com/a, https://example.com/b",
+        }, ensure_ascii=False, indent=2)
+        if malformed:
+            # Cut before the description so neither the JSON nor the lenient scan can recover it
+            return "Görseli inceledim.\n```json\n" + answer[:answer.index('"description"')]
+        return "```json\n" + answer + "\n```"
+
+
+def _prompt_kind(contents):
+    """Which of the service's prompts a request carries, from the JSON template it asks for"""
+    text = " ".join(
+        getattr(part, "text", None) or "" for content in contents for part in (getattr(content, "parts", None) or [])
+    )
+    if '"brand"' in text:
+        return "identify"
+    if '"search_info"' in text and '"title"' not in text:
+        return "research"
+    return "analysis"
+
+
+class _FakeAio:
+    def __init__(self, settings):
+        self.caches = _FakeCaches()
+        self.models = _FakeModels(settings, self.caches)
+
+
+class FakeGeminiClient:
+    def __init__(self, settings=None):
+        self.aio = _FakeAio(settings or FakeGeminiSettings())
+
+
+def install(settings=None):
+    """Replace the genai client of every configured key in the shared client pool; returns the fake client"""
+    fake = FakeGeminiClient(settings)
+    for api_key in clients.get_client_pool(analysis_pipeline.API_KEYS).keys.keys:
+        api_key.client = fake
+    return fake
+
+
+def add_arguments(parser):
+    group = parser.add_argument_group("fake Gemini backend")
+    group.add_argument("--first-chunk-seconds", type=float, default=1.0, help="model latency before the first chunk")
+    group.add_argument("--ungrounded-first-chunk-seconds", type=float,
+                       help="latency before the first chunk for calls without search (default: --first-chunk-seconds)")
+    group.add_argument("--tokens-per-second", type=float, default=80.0, help="streaming rate after the first chunk")
+    group.add_argument("--chunk-tokens", type=int, default=16)
+    group.add_argument("--description-words", type=int, default=200)
+    group.add_argument("--failure-rate", type=float, default=0.0, help="fraction of calls that fail")
+    group.add_argument("--failure-modes", default="error",
+                       help=f"comma-separated mix of {', '.join(FAILURE_MODES)}")
+    group.add_argument("--seed", type=int)
+
+
+def settings_from_args(args):
+    modes = tuple(mode.strip() for mode in args.failure_modes.split(",") if mode.strip())
+    unknown = set(modes) - set(FAILURE_MODES)
+    if unknown:
+        raise ValueError(f"Unknown failure modes: {', '.join(sorted(unknown))}")
+    return FakeGeminiSettings(
+        first_chunk_seconds=args.first_chunk_seconds,
+        ungrounded_first_chunk_seconds=args.ungrounded_first_chunk_seconds,
+        tokens_per_second=args.tokens_per_second,
+        chunk_tokens=args.chunk_tokens,
+        description_words=args.description_words,
+        failure_rate=args.failure_rate,
+        failure_modes=modes,
+        seed=args.seed,
+    )
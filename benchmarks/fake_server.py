@@ -0,0 +1,34 @@
+"""
+Run the real gRPC server on top of the fake Gemini backend.
+
+All server settings come from the usual environment variables
+(GRPC_PORT, GRPC_SERVER_MODE, ...); the flags only shape the fake model.
+
+    python benchmarks/fake_server.py --first-chunk-seconds 2 --failure-rate 0.05
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("GOOGLE_API_KEY", "fake-api-key")
+# The fake model is patched into this process only; supervised workers would call the real API
+os.environ.setdefault("GRPC_WORKER_PROCESSES", "1")
+
+import fake_gemini  # noqa: E402
+import grpc_server  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description="gRPC server backed by a fake Gemini model")
+    fake_gemini.add_arguments(parser)
+    args = parser.parse_args()
+    fake_gemini.install(fake_gemini.settings_from_args(args))
+    try:
+        grpc_server.serve()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
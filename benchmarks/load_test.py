@@ -0,0 +1,344 @@
+"""
+Offline load generator for the analyzer.
+
+By default it starts `fake_server.py` (the real server on the fake Gemini
+backend) in a child process, drives it with synthetic images and reports
+throughput, p50/p95/p99 latency, status codes and the server's peak RSS.
+Use --target to load an already running server instead.
+
+Load is either closed-loop (--concurrency workers back to back) or open-loop
+(--qps arrivals per second regardless of how fast responses come back).
+Every request carries a distinct image unless --repeat-ratio says otherwise,
+so the result cache does not hide the model path.
+
+    python benchmarks/load_test.py --rpc mix --concurrency 64 --duration 30
+    python benchmarks/load_test.py --qps 20 --first-chunk-seconds 5 --json run.json --baseline previous.json
+"""
+import argparse
+import asyncio
+import http.server
+import io
+import json
+import os
+import random
+import resource
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+import grpc
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fake_gemini  # noqa: E402
+import product_analyzer_pb2  # noqa: E402
+import product_analyzer_pb2_grpc  # noqa: E402
+
+FAKE_SERVER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_server.py")
+RPCS = ("image", "url", "stream")
+PERCENTILES = (50, 95, 99)
+
+
+def synthetic_jpeg(max_edge, rng):
+    """Smooth random texture: compresses like a photo rather than like pure noise"""
+    width, height = max_edge, max_edge * 3 // 4
+    channels = [
+        Image.effect_noise((max(width // 16, 1), max(height // 16, 1)), 64).resize((width, height), Image.Resampling.BILINEAR)
+        for _ in range(3)
+    ]
+    image = Image.merge("RGB", channels)
+    image.paste((rng.randrange(256), rng.randrange(256), rng.randrange(256)),
+                (width // 4, height // 4, width // 2, height // 2))
+    output = io.BytesIO()
+    image.save(output, format="JPEG", quality=90)
+    return output.getvalue()
+
+
+class ImageSource:
+    """Pool of synthetic images; a per-request nonce after the JPEG end marker makes each upload unique"""
+
+    def __init__(self, sizes, images_per_size, repeat_ratio, seed=None):
+        self._rng = random.Random(seed)
+        self.images = [synthetic_jpeg(size, self._rng) for size in sizes for _ in range(images_per_size)]
+        self.repeat_ratio = repeat_ratio
+        self._sent = []
+        self._counter = 0
+
+    def next(self):
+        """(pool index, nonce) for the next request"""
+        if self._sent and self._rng.random() < self.repeat_ratio:
+            return self._rng.choice(self._sent)
+        self._counter += 1
+        choice = (self._rng.randrange(len(self.images)), self._counter)
+        self._sent.append(choice)
+        return choice
+
+    def body(self, index, nonce):
+        # Decoders stop at the end-of-image marker, so the trailer only changes the hash
+        return self.images[index] + b"nonce:%d" % nonce
+
+
+def start_image_server(source):
+    """Serve /<index>/<nonce>.jpg from the image pool for the URL RPC"""
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            try:
+                index, name = self.path.strip("/").split("/")
+                body = source.body(int(index), int(name.split(".")[0]))
+            except (ValueError, IndexError):
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "image/jpeg")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = {}
+        self.codes = {}
+
+    def add(self, rpc, seconds, code):
+        self.codes[code] = self.codes.get(code, 0) + 1
+        if code == "OK":
+            self.latencies.setdefault(rpc, []).append(seconds)
+
+    def all_latencies(self):
+        return sorted(value for values in self.latencies.values() for value in values)
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    rank = max(int(round(pct / 100 * len(sorted_values))) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+async def call(stub, rpc, source, image_base_url, timeout, recorder):
+    index, nonce = source.next()
+    started = time.perf_counter()
+    code = "OK"
+    try:
+        if rpc == "image":
+            await stub.GenerateFromImage(product_analyzer_pb2.ImageRequest(
+                image=source.body(index, nonce), filename="bench.jpg", content_type="image/jpeg"), timeout=timeout)
+        elif rpc == "url":
+            await stub.GenerateFromImageUrl(product_analyzer_pb2.ImageUrlRequest(
+                image_url=f"{image_base_url}/{index}/{nonce}.jpg"), timeout=timeout)
+        else:
+            async for _ in stub.GenerateFromImageStream(product_analyzer_pb2.ImageRequest(
+                    image=source.body(index, nonce), filename="bench.jpg", content_type="image/jpeg"), timeout=timeout):
+                pass
+    except grpc.aio.AioRpcError as e:
+        code = e.code().name
+    recorder.add(rpc, time.perf_counter() - started, code)
+
+
+async def run_load(args, source, image_base_url):
+    rpcs = RPCS[:2] if args.rpc == "mix" else (args.rpc,)
+    rng = random.Random(args.seed)
+    recorder = Recorder()
+    async with grpc.aio.insecure_channel(args.target, options=[
+        ("grpc.max_send_message_length", 64 * 1024 * 1024),
+    ]) as channel:
+        stub = product_analyzer_pb2_grpc.ProductAnalyzerStub(channel)
+        started = time.perf_counter()
+        deadline = started + args.duration
+
+        if args.qps:
+            # Open loop: arrivals follow a Poisson process at the target rate
+            tasks = set()
+            next_arrival = started
+            while next_arrival < deadline:
+                await asyncio.sleep(max(next_arrival - time.perf_counter(), 0))
+                task = asyncio.ensure_future(
+                    call(stub, rng.choice(rpcs), source, image_base_url, args.timeout, recorder))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                next_arrival += rng.expovariate(args.qps)
+            if tasks:
+                await asyncio.wait(tasks)
+        else:
+            async def worker():
+                while time.perf_counter() < deadline:
+                    await call(stub, rng.choice(rpcs), source, image_base_url, args.timeout, recorder)
+
+            await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+    return recorder, elapsed
+
+
+def start_fake_server(args):
+    env = dict(
+        os.environ,
+        GRPC_PORT=args.target.rsplit(":", 1)[1],
+        GRPC_SERVER_MODE=args.server_mode,
+        # Synthetic images share a texture; near-duplicate matching would turn every miss into a hit
+        NEAR_DUPLICATE_MAX_DISTANCE="-1",
+        METRICS_PORT=os.environ.get("METRICS_PORT", "0"),
+        PYTHONUNBUFFERED="1",
+    )
+    fake_args = [
+        "--first-chunk-seconds", str(args.first_chunk_seconds),
+        "--tokens-per-second", str(args.tokens_per_second),
+        "--chunk-tokens", str(args.chunk_tokens),
+        "--description-words", str(args.description_words),
+        "--failure-rate", str(args.failure_rate),
+        "--failure-modes", args.failure_modes,
+    ]
+    if args.seed is not None:
+        fake_args += ["--seed", str(args.seed)]
+    process = subprocess.Popen([sys.executable, FAKE_SERVER, *fake_args], env=env)
+    channel = grpc.insecure_channel(args.target)
+    try:
+        grpc.channel_ready_future(channel).result(timeout=30)
+    finally:
+        channel.close()
+    return process
+
+
+def stop_fake_server(process):
+    # SIGINT lets the server exit normally, which also shuts down its preprocessing workers;
+    # SIGTERM would leave them orphaned
+    process.send_signal(signal.SIGINT)
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def peak_rss_bytes(process):
+    """High-water RSS of the server process (Linux /proc), or None where unavailable"""
+    try:
+        with open(f"/proc/{process.pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def build_report(args, recorder, elapsed, server_rss):
+    latencies = recorder.all_latencies()
+    ok = len(latencies)
+    total = sum(recorder.codes.values())
+    report = {
+        "rpc": args.rpc,
+        "mode": f"qps={args.qps}" if args.qps else f"concurrency={args.concurrency}",
+        "server_mode": args.server_mode,
+        "duration_seconds": round(elapsed, 3),
+        "requests": total,
+        "ok": ok,
+        "codes": dict(sorted(recorder.codes.items())),
+        "throughput_rps": round(ok / elapsed, 3) if elapsed else 0.0,
+        "latency_seconds": {f"p{pct}": percentile(latencies, pct) for pct in PERCENTILES},
+        "latency_by_rpc": {
+            rpc: {f"p{pct}": percentile(sorted(values), pct) for pct in PERCENTILES}
+            for rpc, values in sorted(recorder.latencies.items())
+        },
+        "server_peak_rss_bytes": server_rss,
+        # ru_maxrss is KiB on Linux
+        "client_peak_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+    }
+    return report
+
+
+def print_report(report, baseline=None):
+    def fmt_seconds(value):
+        return "-" if value is None else f"{value * 1000:.1f} ms"
+
+    def delta(key, current, lower_is_better):
+        if not baseline:
+            return ""
+        previous = baseline
+        for part in key:
+            previous = (previous or {}).get(part)
+        if not previous or current is None:
+            return ""
+        change = (current - previous) / previous * 100
+        worse = change > 0 if lower_is_better else change < 0
+        return f"  ({change:+.1f}%{' worse' if worse and abs(change) >= 5 else ''})"
+
+    print(f"\nrpc={report['rpc']} {report['mode']} server={report['server_mode']} "
+          f"duration={report['duration_seconds']}s")
+    print(f"requests: {report['requests']}  ok: {report['ok']}  codes: {report['codes']}")
+    print(f"throughput: {report['throughput_rps']:.2f} req/s"
+          + delta(("throughput_rps",), report["throughput_rps"], False))
+    for name, value in report["latency_seconds"].items():
+        print(f"latency {name}: {fmt_seconds(value)}" + delta(("latency_seconds", name), value, True))
+    for rpc, values in report["latency_by_rpc"].items():
+        print(f"  {rpc:<7}" + "  ".join(f"{name}={fmt_seconds(value)}" for name, value in values.items()))
+    if report["server_peak_rss_bytes"]:
+        print(f"server peak RSS: {report['server_peak_rss_bytes'] / 2 ** 20:.1f} MiB"
+              + delta(("server_peak_rss_bytes",), report["server_peak_rss_bytes"], True))
+    print(f"client peak RSS: {report['client_peak_rss_bytes'] / 2 ** 20:.1f} MiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test for the analyzer gRPC service")
+    parser.add_argument("--target", help="host:port of a running server (default: start fake_server.py)")
+    parser.add_argument("--port", type=int, default=50171, help="port for the fake server started by this script")
+    parser.add_argument("--server-mode", choices=("thread", "aio"), default="aio")
+    parser.add_argument("--rpc", choices=(*RPCS, "mix"), default="mix", help="mix alternates image and url")
+    load = parser.add_mutually_exclusive_group()
+    load.add_argument("--concurrency", type=int, default=16, help="closed-loop workers")
+    load.add_argument("--qps", type=float, help="open-loop arrival rate")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds to generate load")
+    parser.add_argument("--timeout", type=float, default=120.0, help="per-request deadline")
+    parser.add_argument("--sizes", default="256,1024,3000", help="max edge of synthetic images, comma-separated")
+    parser.add_argument("--images-per-size", type=int, default=4)
+    parser.add_argument("--repeat-ratio", type=float, default=0.0,
+                        help="fraction of requests that resend an earlier image (cache hits)")
+    parser.add_argument("--json", help="write the report to this file")
+    parser.add_argument("--baseline", help="earlier --json report to compare against")
+    fake_gemini.add_arguments(parser)
+    args = parser.parse_args()
+
+    spawn_server = args.target is None
+    if spawn_server:
+        args.target = f"127.0.0.1:{args.port}"
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    source = ImageSource(sizes, args.images_per_size, args.repeat_ratio, seed=args.seed)
+    image_server = start_image_server(source)
+    image_base_url = f"http://127.0.0.1:{image_server.server_port}"
+
+    process = start_fake_server(args) if spawn_server else None
+    try:
+        recorder, elapsed = asyncio.run(run_load(args, source, image_base_url))
+        server_rss = peak_rss_bytes(process) if process else None
+    finally:
+        image_server.shutdown()
+        if process:
+            stop_fake_server(process)
+
+    report = build_report(args, recorder, elapsed, server_rss)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
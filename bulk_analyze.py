@@ -0,0 +1,241 @@
+"""
+Offline catalog processing from a manifest, without the gRPC server.
+
+The manifest is JSONL (one {"path": ...} or {"url": ...} object per line) or
+CSV with a path or url column; an optional id column is copied to the output.
+Rows are read as they are needed, so memory stays flat however long the
+manifest is. Items run through the same AnalysisPipeline as the server
+(validation, preprocessing, prompt, parsing, caches) with up to --concurrency
+in flight, and every finished item is appended to the output JSONL.
+
+Progress is checkpointed next to the output: all manifest rows before the
+checkpoint are in the output, and rows after it that finished before a crash
+are found again in the output tail, so a rerun with the same arguments
+continues where the last one stopped without redoing any item.
+
+    python bulk_analyze.py catalog.jsonl --output results.jsonl --concurrency 32
+"""
+import argparse
+import asyncio
+import csv
+import json
+import mimetypes
+import os
+import random
+import sys
+import time
+
+import grpc
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from analysis_pipeline import BATCH_MAX_CONCURRENCY, AnalysisError, AnalysisPipeline  # noqa: E402
+from job_queue import RETRYABLE_CODES  # noqa: E402
+
+
+def read_manifest(path, start=0):
+    """Yield (row, item) for manifest rows from index start on; item is the row as a dict"""
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.lower().endswith(".csv"):
+            rows = csv.DictReader(f)
+        else:
+            rows = (json.loads(line) for line in f if line.strip())
+        for row, item in enumerate(rows):
+            if row >= start:
+                yield row, item
+
+
+def load_checkpoint(output_path):
+    """Manifest row up to which the output is complete, and the rows after it that are already in the output"""
+    start, offset, done = 0, 0, set()
+    try:
+        with open(output_path + ".checkpoint", encoding="utf-8") as f:
+            saved = json.load(f)
+        start, offset, done = saved["next_row"], saved["output_bytes"], set(saved["done"])
+    except FileNotFoundError:
+        pass
+    if not os.path.exists(output_path):
+        return start, done
+    with open(output_path, "rb+") as f:
+        # A crash can leave half a line at the end; drop it so the item is redone
+        end = f.seek(0, os.SEEK_END)
+        position = end
+        while position > offset:
+            f.seek(position - 1)
+            if f.read(1) == b"\n":
+                break
+            position -= 1
+        if position < end:
+            f.truncate(position)
+        # Only results written after the last checkpoint need reading
+        f.seek(offset)
+        for line in f:
+            row = json.loads(line)["row"]
+            if row >= start:
+                done.add(row)
+    return start, done
+
+
+class Checkpointer:
+    """Appends results to the output and periodically records how far the manifest is done"""
+
+    def __init__(self, output_path, start, done, interval_seconds):
+        self.path = output_path + ".checkpoint"
+        self.interval_seconds = interval_seconds
+        self.next_row = start
+        # Finished rows past next_row; they are skipped on resume
+        self._ahead = set(done)
+        self._output = open(output_path, "a", encoding="utf-8")
+        self._saved_at = time.monotonic()
+
+    def write(self, record):
+        self._output.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._ahead.add(record["row"])
+
+    def advance(self, next_row):
+        """Rows before next_row are all written; saved at most once per interval"""
+        self.next_row = next_row
+        if time.monotonic() - self._saved_at >= self.interval_seconds:
+            self.save()
+
+    def save(self):
+        # Results must be on disk before the checkpoint that skips them
+        self._output.flush()
+        os.fsync(self._output.fileno())
+        self._ahead = {row for row in self._ahead if row >= self.next_row}
+        temporary = self.path + ".tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            json.dump({"next_row": self.next_row, "output_bytes": self._output.tell(), "done": sorted(self._ahead)}, f)
+        os.replace(temporary, self.path)
+        self._saved_at = time.monotonic()
+
+    def close(self):
+        self.save()
+        self._output.close()
+
+
+def _analyse(pipeline, item, timeout):
+    deadline = time.monotonic() + timeout
+    if item.get("url"):
+        return pipeline.generate_from_image_url(item["url"], deadline=deadline)
+    if item.get("path"):
+        return _analyse_file(pipeline, item["path"], deadline)
+    raise AnalysisError(grpc.StatusCode.INVALID_ARGUMENT, "Manifest row has no path or url")
+
+
+async def _analyse_file(pipeline, path, deadline):
+    try:
+        image_bytes = await asyncio.get_running_loop().run_in_executor(None, _read_file, path)
+    except OSError as e:
+        raise AnalysisError(grpc.StatusCode.INVALID_ARGUMENT, f"Could not read {path}: {e.strerror}")
+    content_type, _ = mimetypes.guess_type(path)
+    return await pipeline.generate_from_image(
+        image_bytes, os.path.basename(path), content_type or "image/jpeg", deadline=deadline
+    )
+
+
+def _read_file(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+async def process(pipeline, item, args):
+    """Result dict or final AnalysisError for one row; overload and model errors are retried"""
+    for attempt in range(1, args.max_attempts + 1):
+        try:
+            # The deadline alone only reaches admission; a stalled model call is cancelled here
+            return await asyncio.wait_for(_analyse(pipeline, item, args.timeout), args.timeout), None
+        except asyncio.TimeoutError:
+            error = AnalysisError(grpc.StatusCode.DEADLINE_EXCEEDED, f"Attempt timed out after {args.timeout:.0f}s")
+        except AnalysisError as e:
+            error = e
+        except Exception as e:
+            return None, AnalysisError(grpc.StatusCode.INTERNAL, f"Unexpected error: {str(e)}")
+        if error.code not in RETRYABLE_CODES or attempt == args.max_attempts:
+            return None, error
+        await asyncio.sleep(args.retry_seconds * 2 ** (attempt - 1) * random.uniform(0.5, 1.0))
+
+
+async def run(args):
+    start, done = load_checkpoint(args.output)
+    checkpoint = Checkpointer(args.output, start, done, args.checkpoint_seconds)
+    pipeline = AnalysisPipeline()
+    counts = {"succeeded": 0, "failed": 0, "skipped": len(done)}
+    in_flight = {}
+    rows = read_manifest(args.manifest, start)
+    next_row = start
+    started = time.monotonic()
+
+    def record(row, item, result, error):
+        entry = {"row": row, "id": item.get("id"), "source": item.get("url") or item.get("path")}
+        if error is None:
+            entry["result"] = result
+            counts["succeeded"] += 1
+        else:
+            entry["error"] = {"code": error.code.name, "message": error.details}
+            counts["failed"] += 1
+        checkpoint.write(entry)
+
+    try:
+        exhausted = False
+        while not exhausted or in_flight:
+            while not exhausted and len(in_flight) < args.concurrency:
+                try:
+                    row, item = next(rows)
+                except StopIteration:
+                    exhausted = True
+                    break
+                next_row = row + 1
+                if row in done:
+                    done.discard(row)
+                    continue
+                in_flight[asyncio.ensure_future(process(pipeline, item, args))] = (row, item)
+            if not in_flight:
+                continue
+            finished, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            for task in finished:
+                row, item = in_flight.pop(task)
+                record(row, item, *task.result())
+            # Everything before the oldest row still running is in the output
+            checkpoint.advance(min((row for row, _ in in_flight.values()), default=next_row))
+            if args.progress and (counts["succeeded"] + counts["failed"]) % args.progress == 0:
+                _print_progress(counts, started)
+    finally:
+        for task in in_flight:
+            task.cancel()
+        await asyncio.gather(*in_flight, return_exceptions=True)
+        checkpoint.close()
+        await pipeline.clients.aclose()
+    _print_progress(counts, started)
+    return counts
+
+
+def _print_progress(counts, started):
+    elapsed = time.monotonic() - started
+    processed = counts["succeeded"] + counts["failed"]
+    print(f"{processed} işlendi ({counts['succeeded']} başarılı, {counts['failed']} hatalı, "
+          f"{counts['skipped']} atlandı), {processed / max(elapsed, 1e-9):.1f} öğe/sn", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyse a catalog manifest (JSONL or CSV) into a JSONL file")
+    parser.add_argument("manifest", help="JSONL or CSV with path/url and optional id per row")
+    parser.add_argument("--output", "-o", required=True, help="results JSONL; an existing one is resumed")
+    parser.add_argument("--concurrency", type=int, default=BATCH_MAX_CONCURRENCY, help="items in flight")
+    parser.add_argument("--timeout", type=float, default=300.0, help="deadline per attempt in seconds")
+    parser.add_argument("--max-attempts", type=int, default=3, help="attempts for overload and model errors")
+    parser.add_argument("--retry-seconds", type=float, default=5.0, help="first retry delay, doubled each time")
+    parser.add_argument("--checkpoint-seconds", type=float, default=10.0, help="how often progress is saved")
+    parser.add_argument("--progress", type=int, default=100, help="print progress every N items (0 = off)")
+    args = parser.parse_args()
+    try:
+        counts = asyncio.run(run(args))
+    except KeyboardInterrupt:
+        print("Durduruldu; aynı komutla kaldığı yerden devam eder.", file=sys.stderr)
+        sys.exit(130)
+    sys.exit(1 if counts["failed"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Process-wide pooled clients for Gemini and image downloads.
+
+Building a genai.Client or an HTTP client per request throws away the
+connection pool, so every call pays DNS, TCP and TLS setup again. The pool
+here is created once per process and shared by every request; HTTP/2 is used
+when the optional `h2` package is installed. There is one genai client per
+configured API key, scheduled by `key_pool.KeyPool`.
+"""
+import importlib.util
+import os
+import threading
+from contextlib import asynccontextmanager
+
+import httpx
+from google import genai
+from google.genai import types
+from dotenv import load_dotenv
+
+from key_pool import ApiKey, KeyPool
+load_dotenv()
+
+HTTP_POOL_MAX_CONNECTIONS = int(os.getenv("HTTP_POOL_MAX_CONNECTIONS", "100"))
+HTTP_POOL_MAX_KEEPALIVE = int(os.getenv("HTTP_POOL_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "true").lower() == "true" and importlib.util.find_spec("h2") is not None
+# 429/5xx dönen anahtar bu kadar saniye devre dışı kalır; ardışık hatalarda süre ikiye katlanır
+GEMINI_KEY_EJECT_SECONDS = float(os.getenv("GEMINI_KEY_EJECT_SECONDS", "10"))
+GEMINI_KEY_EJECT_MAX_SECONDS = float(os.getenv("GEMINI_KEY_EJECT_MAX_SECONDS", "300"))
+
+
+class ClientPool:
+    """Shared genai clients (one per API key) and httpx connection pool with utilisation counters"""
+
+    def __init__(self, api_keys, max_connections=HTTP_POOL_MAX_CONNECTIONS,
+                 max_keepalive=HTTP_POOL_MAX_KEEPALIVE, keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+                 http2=HTTP2_ENABLED):
+        self.max_connections = max_connections
+        self.http2 = http2
+        limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self._client_args = {"limits": limits, "http2": http2}
+        self.keys = KeyPool(
+            [
+                ApiKey(f"key{index}", self._genai_client(spec.key), spec.rpm, spec.tpm)
+                for index, spec in enumerate(api_keys)
+            ],
+            eject_base_seconds=GEMINI_KEY_EJECT_SECONDS,
+            eject_max_seconds=GEMINI_KEY_EJECT_MAX_SECONDS,
+        )
+        self._http = None
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def _genai_client(self, api_key):
+        return genai.Client(
+            api_key=api_key,
+            http_options=types.HttpOptions(
+                client_args=dict(self._client_args),
+                async_client_args=dict(self._client_args),
+            ),
+        )
+
+    @property
+    def http(self):
+        """Async HTTP client for image downloads, created on first use"""
+        if self._http is None:
+            with self._lock:
+                if self._http is None:
+                    self._http = httpx.AsyncClient(follow_redirects=True, **self._client_args)
+        return self._http
+
+    @asynccontextmanager
+    async def track(self, name):
+        """Count a request against the named pool while it is in flight"""
+        with self._lock:
+            stats = self._stats.setdefault(name, {"in_flight": 0, "peak_in_flight": 0, "requests_total": 0})
+            stats["in_flight"] += 1
+            stats["requests_total"] += 1
+            stats["peak_in_flight"] = max(stats["peak_in_flight"], stats["in_flight"])
+        try:
+            yield
+        finally:
+            with self._lock:
+                stats["in_flight"] -= 1
+
+    def stats(self):
+        """Per-pool in-flight, peak and total request counts plus utilisation of the connection limit"""
+        with self._lock:
+            snapshot = {}
+            for name, stats in self._stats.items():
+                snapshot[name] = dict(
+                    stats,
+                    max_connections=self.max_connections,
+                    utilisation=stats["in_flight"] / self.max_connections,
+                )
+            return snapshot
+
+    async def aclose(self):
+        if self._http is not None:
+            await self._http.aclose()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_client_pool(api_keys):
+    """Return the process-wide ClientPool for a list of KeySpecs, creating it on first call"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ClientPool(api_keys)
+    return _pool
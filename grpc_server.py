@@ -3,313 +3,543 @@ from concurrent import futures
 import product_analyzer_pb2
 import product_analyzer_pb2_grpc
 import os
-import base64
-from google import genai
-from google.genai import types
-from PIL import Image
-import io
-import requests
+import asyncio
+import queue
+import signal
+import threading
+import time
 from dotenv import load_dotenv
+from grpc_health.v1 import health as grpc_health, health_pb2_grpc
+from analysis_pipeline import (
+    BATCH_MAX_BYTES, MAX_IMAGE_BYTES, PRODUCT_MAX_IMAGES, AnalysisPipeline, AnalysisError, validate_image,
+)
+from job_queue import FAILED, QUEUED, RUNNING, SUCCEEDED, JobQueue, JobRunner
+from health import HealthMonitor
+from supervisor import Supervisor
+from metrics import AsyncMetricsInterceptor, MetricsInterceptor, start_metrics_server
 load_dotenv()
 
-GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-SUPPORTED_FORMATS = {"jpeg", "jpg", "png", "gif", "bmp", "webp"}
-
-# Görsel doğrulama fonksiyonu
-def validate_image(filename, content_type):
-    if not content_type or not content_type.startswith("image/"):
-        return False
-    if filename:
-        extension = filename.lower().split(".")[-1]
-        return extension in SUPPORTED_FORMATS
-    return False
-
-def create_prompt():
-    return """
-<prompt>
-  <role>Bir e-ticaret içerik uzmanı ve pazar araştırmacısı olarak çalışıyorsun. Amacın, görseldeki ürünü analiz ederek SEO uyumlu, profesyonel ve satışa yönelik bir ürün tanıtımı hazırlamak.</role>
-
-  <workflow>
-    <step index="1">Görseli incele ve ürünü doğru şekilde tanımla (model/seri, malzeme, renk, form, ayırt edici detaylar).</step>
-    <step index="2">Zorunlu web araması yap: güncel pazar bilgilerini topla (fiyat aralıkları, rakip/benzer ürünler, teknik özellikler, trendler, talep/yorum içgörüleri).</step>
-    <step index="3">En az 3 benzer ürünü fiyat aralığı ve öne çıkan özelliklerle özetle; mümkünse bölge/para birimini belirt.</step>
-    <step index="4">Toplanan verileri kullanarak yalnızca belirtilen JSON formatında yanıt ver.</step>
-  </workflow>
-
-  <web_search required="true">
-    <must_include>Fiyat aralıkları; benzer ürünlerin marka/modeli; temel özellikler; en az 3 kaynak URL.</must_include>
-    <freshness>Güncel bilgiye öncelik ver (son 12 ay).</freshness>
-    <disclaimer>Varsayım yapma; belirsizse "bilgi yetersiz" de.</disclaimer>
-  </web_search>
-
-  <output>
-    <format>JSON</format>
-    <constraints>
-      <title max_chars="60"/>
-      <description word_count_min="150" word_count_max="300"/>
-      <language>Turkish</language>
-      <return_only_json>true</return_only_json>
-    </constraints>
-    <json_template><![CDATA[
-{
-  "title": "SEO uyumlu ürün başlığı (en fazla 60 karakter)",
-  "description": "150-300 kelime: görsel özellikler, kullanım alanları, hedef kitle ve pazardan güncel bulgularla desteklenen, profesyonel ve ikna edici açıklama. Doğal SEO anahtar kelimeleri kullan.",
-  "search_info": "Web aramasından elde edilen özet bulgular + kısa kaynak listesi (URL'lerle)."
+GRPC_PORT = int(os.getenv("GRPC_PORT", "50071"))
+# "thread": klasik ThreadPoolExecutor sunucusu, "aio": grpc.aio tabanlı asyncio sunucusu
+GRPC_SERVER_MODE = os.getenv("GRPC_SERVER_MODE", "thread")
+GRPC_MAX_WORKERS = int(os.getenv("GRPC_MAX_WORKERS", "10"))
+# aio modunda aynı anda işlenebilecek en fazla RPC; fazlası RESOURCE_EXHAUSTED alır
+GRPC_MAX_CONCURRENT_RPCS = int(os.getenv("GRPC_MAX_CONCURRENT_RPCS", "1000"))
+# Aynı portu SO_REUSEPORT ile paylaşan sunucu süreci sayısı (varsayılan: CPU sayısı, 1 = tek süreç);
+# anahtar kotaları ve kabul bütçeleri süreçlere bölünür, önbellekler ve tekil uçuş (single-flight)
+# süreç başınadır. Çekirdek isteği değil bağlantıyı dağıtır: tek kanallı bir istemci tek sürece,
+# dolayısıyla bütçenin 1/N'ine düşer
+GRPC_WORKER_PROCESSES = int(os.getenv("GRPC_WORKER_PROCESSES", str(os.cpu_count() or 1)))
+# SIGTERM sonrası süren isteklerin (ve işlerin) tamamlanması için beklenen en fazla süre
+GRPC_SHUTDOWN_GRACE_SECONDS = float(os.getenv("GRPC_SHUTDOWN_GRACE_SECONDS", "30"))
+# Sunucunun kabul ettiği en büyük istek mesajı (bayt). Sınır her RPC için geçerlidir ve mesaj bütünüyle
+# bellekte tutulur; varsayılan, izin verilen en büyük toplu (BATCH_MAX_BYTES) ya da çoklu görselli ürün
+# isteğini 1MB payla karşılar
+GRPC_MAX_RECEIVE_MESSAGE_BYTES = int(os.getenv(
+    "GRPC_MAX_RECEIVE_MESSAGE_BYTES",
+    str(min(max(BATCH_MAX_BYTES, MAX_IMAGE_BYTES * PRODUCT_MAX_IMAGES) + 1024 * 1024, 2 ** 31 - 1)),
+))
+# Prometheus /metrics için yan port (0 = kapalı); çok süreçli modda i. süreç METRICS_PORT + i kullanır
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9464"))
+
+# SubmitAnalysis işlerinin tutulduğu SQLite dosyası; birden fazla süreç aynı dosyayı paylaşabilir
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", "jobs.db")
+# İşleri çalıştıran eşzamanlı işçi sayısı (0 = bu süreç iş çalıştırmaz, yalnızca kabul eder)
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+# Geçici hatalarda (kota, zaman aşımı, model hatası) yapılacak en fazla deneme
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+# Denemeler arası bekleme her seferinde ikiye katlanır, üst sınırı JOB_RETRY_MAX_SECONDS
+JOB_RETRY_BASE_SECONDS = float(os.getenv("JOB_RETRY_BASE_SECONDS", "30"))
+JOB_RETRY_MAX_SECONDS = float(os.getenv("JOB_RETRY_MAX_SECONDS", "3600"))
+JOB_TIMEOUT_SECONDS = float(os.getenv("JOB_TIMEOUT_SECONDS", "300"))
+# Tamamlanan/başarısız işler bu kadar saniye sonra silinir
+JOB_RETENTION_SECONDS = int(os.getenv("JOB_RETENTION_SECONDS", str(7 * 24 * 3600)))
+JOB_LIST_MAX_PAGE_SIZE = 1000
+
+# grpc.health.v1 hazırlık durumu: yük (uçuştaki RPC/kapasite, kuyruk, hata oranı, model gecikmesi)
+# HEALTH_SATURATED'e ulaşınca NOT_SERVING, HEALTH_RECOVERED'a inince tekrar SERVING olur
+HEALTH_INTERVAL_SECONDS = float(os.getenv("HEALTH_INTERVAL_SECONDS", "1"))
+HEALTH_SATURATED = float(os.getenv("HEALTH_SATURATED", "0.9"))
+HEALTH_RECOVERED = float(os.getenv("HEALTH_RECOVERED", "0.7"))
+# Son HEALTH_WINDOW_SECONDS içinde 429/5xx ile biten Gemini çağrılarının tolere edilen en yüksek oranı
+HEALTH_MAX_ERROR_RATE = float(os.getenv("HEALTH_MAX_ERROR_RATE", "0.5"))
+HEALTH_WINDOW_SECONDS = float(os.getenv("HEALTH_WINDOW_SECONDS", "60"))
+# Beklenen model süresi için üst sınır (saniye, 0 = kullanılmaz)
+HEALTH_MAX_MODEL_LATENCY = float(os.getenv("HEALTH_MAX_MODEL_LATENCY", "0"))
+
+
+_DONE = object()
+
+
+class _EventLoopThread:
+    """Background asyncio loop that lets the thread-pool servicer drive the async pipeline"""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="analysis-loop", daemon=True)
+        self._thread.start()
+
+    def run(self, coro, context):
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        # Client disconnects or deadlines cancel the in-flight model call
+        context.add_callback(future.cancel)
+        try:
+            return future.result()
+        except AnalysisError as e:
+            context.abort(e.code, e.details)
+        except futures.CancelledError:
+            context.abort(grpc.StatusCode.CANCELLED, "Request cancelled")
+
+    def iterate(self, agen, context):
+        """Drain an async generator on the loop and yield its items in the calling thread"""
+        items = queue.Queue()
+
+        async def pump():
+            try:
+                async for item in agen:
+                    items.put((item, None))
+                items.put((_DONE, None))
+            except BaseException as e:
+                items.put((_DONE, e))
+                raise
+
+        future = asyncio.run_coroutine_threadsafe(pump(), self.loop)
+        context.add_callback(future.cancel)
+        try:
+            while True:
+                item, error = items.get()
+                if item is not _DONE:
+                    yield item
+                    continue
+                if isinstance(error, AnalysisError):
+                    context.abort(error.code, error.details)
+                if isinstance(error, asyncio.CancelledError):
+                    context.abort(grpc.StatusCode.CANCELLED, "Request cancelled")
+                if error is not None:
+                    raise error
+                return
+        finally:
+            future.cancel()
+
+
+def _deadline(context):
+    """The RPC deadline as a time.monotonic() value, or None when the client set none"""
+    remaining = context.time_remaining()
+    # The thread-pool server reports a huge number instead of None when there is no deadline
+    if remaining is None or remaining > 10 ** 9:
+        return None
+    return time.monotonic() + remaining
+
+
+def _batch_items(request):
+    return _source_items(request.items)
+
+
+def _source_items(messages):
+    """BatchImageItem messages as (kind, args) pipeline items"""
+    items = []
+    for item in messages:
+        kind = item.WhichOneof("source")
+        if kind == "image":
+            items.append((kind, (item.image.image, item.image.filename, item.image.content_type)))
+        elif kind == "image_url":
+            items.append((kind, (item.image_url.image_url,)))
+        else:
+            items.append((kind, ()))
+    return items
+
+
+def _batch_result(index, result, error):
+    if error is not None:
+        return product_analyzer_pb2.BatchImageResult(
+            index=index,
+            error=product_analyzer_pb2.BatchItemError(code=error.code.value[0], message=error.details),
+        )
+    return product_analyzer_pb2.BatchImageResult(
+        index=index, response=product_analyzer_pb2.ImageResponse(**result)
+    )
+
+
+def _analysis_event(kind, payload):
+    if kind == "text_delta":
+        return product_analyzer_pb2.AnalysisEvent(text_delta=payload)
+    if kind == "field":
+        name, value = payload
+        return product_analyzer_pb2.AnalysisEvent(field=product_analyzer_pb2.FieldValue(name=name, value=value))
+    return product_analyzer_pb2.AnalysisEvent(result=product_analyzer_pb2.ImageResponse(**payload))
+
+
+_JOB_STATES = {
+    QUEUED: product_analyzer_pb2.JOB_STATE_QUEUED,
+    RUNNING: product_analyzer_pb2.JOB_STATE_RUNNING,
+    SUCCEEDED: product_analyzer_pb2.JOB_STATE_SUCCEEDED,
+    FAILED: product_analyzer_pb2.JOB_STATE_FAILED,
 }
-    ]]></json_template>
-  </output>
-
-  <style>
-    <tone>Profesyonel, ikna edici, satış odaklı</tone>
-    <seo>Doğal anahtar kelimeler; başlıkta birincil anahtar kelime; açıklamada semantik varyasyonlar</seo>
-  </style>
-
-  <rules>
-    <rule>Görselden gözlemlenebilir özellikleri (malzeme, tasarım, renk, boyut izlenimi) açıkça belirt.</rule>
-    <rule>Web aramasından öğrendiğin güncel bilgileri açıklamaya entegre et.</rule>
-    <rule>Kullanım alanlarını ve hedef kitleyi netleştir.</rule>
-    <rule>Genellemeden kaçın; veriye dayalı yaz.</rule>
-    <rule>Çıktıyı yalnızca belirtilen JSON formatında üret; JSON dışına çıkma.</rule>
-  </rules>
-</prompt>
-"""
+_JOB_STATE_NAMES = {value: name for name, value in _JOB_STATES.items()}
+
+
+def _analysis_job(job):
+    message = product_analyzer_pb2.AnalysisJob(
+        job_id=job["id"],
+        state=_JOB_STATES[job["state"]],
+        attempts=job["attempts"],
+        created_at=job["created_at"],
+        updated_at=job["updated_at"],
+        idempotency_key=job["idempotency_key"] or "",
+    )
+    if job["result"] is not None:
+        message.response.CopyFrom(product_analyzer_pb2.ImageResponse(**job["result"]))
+    if job["error_code"] is not None:
+        message.error.CopyFrom(product_analyzer_pb2.BatchItemError(code=job["error_code"], message=job["error_message"]))
+    return message
+
+
+def _submit_job(jobs, request):
+    """Validate a SubmitAnalysis request up front, so only analysable items are queued"""
+    if jobs is None:
+        raise AnalysisError(grpc.StatusCode.UNIMPLEMENTED, "Job queue is disabled")
+    kind, args = _batch_items(product_analyzer_pb2.BatchImageRequest(items=[request.item]))[0]
+    if kind == "image":
+        image_bytes = args[0]
+        if len(image_bytes) > MAX_IMAGE_BYTES:
+            raise AnalysisError(grpc.StatusCode.INVALID_ARGUMENT, "Resim dosyası çok büyük. Maksimum 10MB desteklenir.")
+        validate_image(image_bytes)
+    elif kind == "image_url":
+        if not args[0]:
+            raise AnalysisError(grpc.StatusCode.INVALID_ARGUMENT, "Image URL is required")
+    else:
+        raise AnalysisError(grpc.StatusCode.INVALID_ARGUMENT, "Item has neither an image nor an image URL")
+    return _analysis_job(jobs.submit(kind, args, request.idempotency_key))
+
+
+def _get_job(jobs, request):
+    if jobs is None:
+        raise AnalysisError(grpc.StatusCode.UNIMPLEMENTED, "Job queue is disabled")
+    job = jobs.queue.get(request.job_id)
+    if job is None:
+        raise AnalysisError(grpc.StatusCode.NOT_FOUND, f"Job not found: {request.job_id}")
+    return _analysis_job(job)
+
+
+def _list_jobs(jobs, request):
+    if jobs is None:
+        raise AnalysisError(grpc.StatusCode.UNIMPLEMENTED, "Job queue is disabled")
+    try:
+        after = int(request.page_token or "0")
+    except ValueError:
+        raise AnalysisError(grpc.StatusCode.INVALID_ARGUMENT, "Invalid page token")
+    page_size = min(request.page_size or 100, JOB_LIST_MAX_PAGE_SIZE)
+    found, next_after = jobs.queue.list(_JOB_STATE_NAMES.get(request.state), page_size, after)
+    return product_analyzer_pb2.ListAnalysesResponse(
+        jobs=[_analysis_job(job) for job in found], next_page_token=str(next_after) if next_after else ""
+    )
+
+
+def create_job_runner(pipeline):
+    """Job queue and workers for the SubmitAnalysis RPCs; None when JOB_DB_PATH is empty"""
+    if not JOB_DB_PATH:
+        return None
+    queue = JobQueue(
+        JOB_DB_PATH,
+        # A lease outlives the attempt, so only jobs of dead workers are taken over
+        lease_seconds=JOB_TIMEOUT_SECONDS + 60,
+        retention_seconds=JOB_RETENTION_SECONDS,
+        max_attempts=JOB_MAX_ATTEMPTS,
+        retry_base_seconds=JOB_RETRY_BASE_SECONDS,
+        retry_max_seconds=JOB_RETRY_MAX_SECONDS,
+    )
+    return JobRunner(
+        queue,
+        pipeline,
+        workers=JOB_WORKERS,
+        timeout_seconds=JOB_TIMEOUT_SECONDS,
+        max_attempts=JOB_MAX_ATTEMPTS,
+        retry_base_seconds=JOB_RETRY_BASE_SECONDS,
+        retry_max_seconds=JOB_RETRY_MAX_SECONDS,
+    )
+
+
+def create_health_monitor(pipeline, capacity):
+    return HealthMonitor(
+        pipeline,
+        capacity,
+        saturated=HEALTH_SATURATED,
+        recovered=HEALTH_RECOVERED,
+        max_error_rate=HEALTH_MAX_ERROR_RATE,
+        max_model_latency=HEALTH_MAX_MODEL_LATENCY,
+        window_seconds=HEALTH_WINDOW_SECONDS,
+    )
+
+
+def _health_status(health):
+    return "healthy" if health is None or health.serving else "not_serving"
+
 
 class ProductImageAnalyzerServicer(product_analyzer_pb2_grpc.ProductAnalyzerServicer):
+    def __init__(self, pipeline=None, jobs=None, health=None):
+        self._loop_thread = _EventLoopThread()
+        self.pipeline = pipeline or AnalysisPipeline()
+        self.jobs = jobs
+        self.health = health
+        if jobs is not None:
+            jobs.start(self._loop_thread.loop)
+
     def GenerateFromImage(self, request, context):
-        # Görsel doğrulama
-        if not validate_image(request.filename, request.content_type):
-            context.abort(grpc.StatusCode.INVALID_ARGUMENT, "Geçersiz resim formatı.")
-        image_bytes = request.image
-        if len(image_bytes) > 10 * 1024 * 1024:
-            context.abort(grpc.StatusCode.INVALID_ARGUMENT, "Resim dosyası çok büyük. Maksimum 10MB desteklenir.")
-        try:
-            pil_image = Image.open(io.BytesIO(image_bytes))
-            if pil_image.mode != 'RGB':
-                pil_image = pil_image.convert('RGB')
-        except Exception as e:
-            context.abort(grpc.StatusCode.INVALID_ARGUMENT, f"Resim dosyası işlenirken hata: {str(e)}")
-        prompt = create_prompt()
-        image_base64 = base64.b64encode(image_bytes).decode('utf-8')
-        client = genai.Client(api_key=GOOGLE_API_KEY)
-        contents = [
-            types.Content(
-                role="user",
-                parts=[
-                    types.Part.from_text(text=prompt),
-                    types.Part.from_bytes(
-                        data=image_bytes,
-                        mime_type=request.content_type
-                    ),
-                ],
-            ),
-        ]
-        tools = [
-            types.Tool(url_context=types.UrlContext()),
-            types.Tool(googleSearch=types.GoogleSearch())
-            ]
-        generate_content_config = types.GenerateContentConfig(
-            temperature=0.7,
-            thinking_config=types.ThinkingConfig(thinking_budget=-1),
-            safety_settings=[
-            types.SafetySetting(
-                category="HARM_CATEGORY_HARASSMENT",
-                threshold="BLOCK_ONLY_HIGH",  # Block few
-            ),
-            types.SafetySetting(
-                category="HARM_CATEGORY_HATE_SPEECH",
-                threshold="BLOCK_ONLY_HIGH",  # Block few
-            ),
-            types.SafetySetting(
-                category="HARM_CATEGORY_SEXUALLY_EXPLICIT",
-                threshold="BLOCK_ONLY_HIGH",  # Block few
-            ),
-            types.SafetySetting(
-                category="HARM_CATEGORY_DANGEROUS_CONTENT",
-                threshold="BLOCK_ONLY_HIGH",  # Block few
+        result = self._loop_thread.run(
+            self.pipeline.generate_from_image(
+                request.image, request.filename, request.content_type, deadline=_deadline(context)
             ),
-        ],
-            tools=tools,
-        ),
-        
-        response_text = ""
-        try:
-            for chunk in client.models.generate_content_stream(
-                model="gemini-2.5-pro",
-                contents=contents,
-                config=generate_content_config,
-            ):
-                response_text += chunk.text
-        except Exception as e:
-            context.abort(grpc.StatusCode.INTERNAL, f"Gemini API hatası: {str(e)}")
-        # Parse the response using the improved parsing logic
-        title, description = self._parse_gemini_response(response_text, context)
-        return product_analyzer_pb2.ImageResponse(title=title, description=description, search_info="")
+            context,
+        )
+        return product_analyzer_pb2.ImageResponse(**result)
 
     def GenerateFromImageUrl(self, request, context):
         """Generate product information from image URL"""
-        image_url = request.image_url
-        
-        if not image_url:
-            context.abort(grpc.StatusCode.INVALID_ARGUMENT, "Image URL is required")
-        
+        result = self._loop_thread.run(
+            self.pipeline.generate_from_image_url(request.image_url, deadline=_deadline(context)), context
+        )
+        return product_analyzer_pb2.ImageResponse(**result)
+
+    def GenerateFromImages(self, request, context):
+        """Analyse a batch of images, streaming per-item results as they complete"""
+        batch = self.pipeline.generate_batch(_batch_items(request), deadline=_deadline(context))
+        for index, result, error in self._loop_thread.iterate(batch, context):
+            yield _batch_result(index, result, error)
+
+    def GenerateFromProductImages(self, request, context):
+        """Analyse several photos of one product in a single model call"""
+        result = self._loop_thread.run(
+            self.pipeline.generate_from_product_images(_source_items(request.images), deadline=_deadline(context)),
+            context,
+        )
+        return product_analyzer_pb2.ImageResponse(**result)
+
+    def GenerateFromImageStream(self, request, context):
+        """Stream model output as it arrives, then the parsed result"""
+        events = self.pipeline.generate_from_image_stream(
+            request.image, request.filename, request.content_type, deadline=_deadline(context)
+        )
+        for kind, payload in self._loop_thread.iterate(events, context):
+            yield _analysis_event(kind, payload)
+
+    def SubmitAnalysis(self, request, context):
+        """Queue an analysis; the result is fetched later with GetAnalysis"""
         try:
-            # Download image from URL
-            response = requests.get(image_url, timeout=30)
-            response.raise_for_status()
-            
-            # Check if response is actually an image
-            content_type = response.headers.get('content-type', '')
-            if not content_type.startswith('image/'):
-                context.abort(grpc.StatusCode.INVALID_ARGUMENT, f"URL does not point to an image. Content-Type: {content_type}")
-            
-            image_bytes = response.content
-            
-            # Check file size
-            if len(image_bytes) > 10 * 1024 * 1024:
-                context.abort(grpc.StatusCode.INVALID_ARGUMENT, "Image file is too large. Maximum 10MB supported.")
-            
-            # Validate image can be processed
-            try:
-                pil_image = Image.open(io.BytesIO(image_bytes))
-                if pil_image.mode != 'RGB':
-                    pil_image = pil_image.convert('RGB')
-            except Exception as e:
-                context.abort(grpc.StatusCode.INVALID_ARGUMENT, f"Error processing image: {str(e)}")
-            
-        except requests.RequestException as e:
-            context.abort(grpc.StatusCode.INVALID_ARGUMENT, f"Error downloading image from URL: {str(e)}")
-        except Exception as e:
-            context.abort(grpc.StatusCode.INTERNAL, f"Unexpected error: {str(e)}")
-        
-        # Use the same AI processing logic as the file upload method
-        prompt = create_prompt()
-        client = genai.Client(api_key=GOOGLE_API_KEY)
-        
-        contents = [
-            types.Content(
-                role="user",
-                parts=[
-                    types.Part.from_text(text=prompt),
-                    types.Part.from_bytes(
-                        data=image_bytes,
-                        mime_type=content_type
-                    ),
-                ],
-            ),
-        ]
-        
-        tools = [types.Tool(googleSearch=types.GoogleSearch())]
-        generate_content_config = types.GenerateContentConfig(
-            thinking_config=types.ThinkingConfig(thinking_budget=-1),
-            tools=tools,
+            return _submit_job(self.jobs, request)
+        except AnalysisError as e:
+            context.abort(e.code, e.details)
+
+    def GetAnalysis(self, request, context):
+        try:
+            return _get_job(self.jobs, request)
+        except AnalysisError as e:
+            context.abort(e.code, e.details)
+
+    def ListAnalyses(self, request, context):
+        try:
+            return _list_jobs(self.jobs, request)
+        except AnalysisError as e:
+            context.abort(e.code, e.details)
+
+    def HealthCheck(self, request, context):
+        """Health check endpoint; grpc.health.v1 is the protocol load balancers should use"""
+        return product_analyzer_pb2.HealthCheckResponse(
+            status=_health_status(self.health),
+            service="ProductAnalyzer"
         )
-        
-        response_text = ""
+
+
+class AsyncProductImageAnalyzerServicer(product_analyzer_pb2_grpc.ProductAnalyzerServicer):
+    """grpc.aio servicer: every request is a coroutine, so in-flight model calls don't pin threads"""
+
+    def __init__(self, pipeline=None, jobs=None, health=None):
+        self.pipeline = pipeline or AnalysisPipeline()
+        self.jobs = jobs
+        self.health = health
+        if jobs is not None:
+            jobs.start(asyncio.get_running_loop())
+
+    async def GenerateFromImage(self, request, context):
+        try:
+            result = await self.pipeline.generate_from_image(
+                request.image, request.filename, request.content_type, deadline=_deadline(context)
+            )
+        except AnalysisError as e:
+            await context.abort(e.code, e.details)
+        return product_analyzer_pb2.ImageResponse(**result)
+
+    async def GenerateFromImageUrl(self, request, context):
+        """Generate product information from image URL"""
         try:
-            for chunk in client.models.generate_content_stream(
-                model="gemini-2.5-pro",
-                contents=contents,
-                config=generate_content_config,
+            result = await self.pipeline.generate_from_image_url(request.image_url, deadline=_deadline(context))
+        except AnalysisError as e:
+            await context.abort(e.code, e.details)
+        return product_analyzer_pb2.ImageResponse(**result)
+
+    async def GenerateFromImages(self, request, context):
+        """Analyse a batch of images, streaming per-item results as they complete"""
+        try:
+            async for index, result, error in self.pipeline.generate_batch(
+                _batch_items(request), deadline=_deadline(context)
             ):
-                response_text += chunk.text
-        except Exception as e:
-            context.abort(grpc.StatusCode.INTERNAL, f"Gemini API error: {str(e)}")
-        
-        # Parse the response with improved error handling
-        title, description = self._parse_gemini_response(response_text, context)
-        return product_analyzer_pb2.ImageResponse(title=title, description=description, search_info="")
-    
-    def _parse_gemini_response(self, response_text, context):
-        """Parse Gemini API response and extract title and description"""
-        import json
-        import re
-        
-        # First, try to find JSON in the response
-        json_pattern = r'\{.*?"title".*?"description".*?\}'
-        json_matches = re.findall(json_pattern, response_text, re.DOTALL)
-        
-        for json_match in json_matches:
-            try:
-                result = json.loads(json_match)
-                title = result.get("title", "").strip()
-                description = result.get("description", "").strip()
-                if title and description:
-                    return title, description
-            except json.JSONDecodeError:
-                continue
-        
-        # If JSON parsing fails, try manual extraction with improved regex
-        title_patterns = [
-            r'"title"\s*:\s*"([^"]+)"',
-            r'"title"\s*:\s*\'([^\']+)\'',
-            r'title:\s*"([^"]+)"',
-            r'title:\s*\'([^\']+)\'',
-        ]
-        
-        description_patterns = [
-            r'"description"\s*:\s*"([^"]+)"',
-            r'"description"\s*:\s*\'([^\']+)\'', 
-            r'description:\s*"([^"]+)"',
-            r'description:\s*\'([^\']+)\'',
-        ]
-        
-        title = ""
-        description = ""
-        
-        for pattern in title_patterns:
-            match = re.search(pattern, response_text, re.IGNORECASE | re.DOTALL)
-            if match:
-                title = match.group(1).strip()
-                break
-                
-        for pattern in description_patterns:
-            match = re.search(pattern, response_text, re.IGNORECASE | re.DOTALL)
-            if match:
-                description = match.group(1).strip()
-                break
-        
-        # If still no results, try even simpler line-by-line parsing
-        if not title or not description:
-            lines = response_text.split('\n')
-            for line in lines:
-                line = line.strip()
-                if not title and any(keyword in line.lower() for keyword in ['title', 'başlık']):
-                    # Extract anything that looks like a title
-                    colon_split = line.split(':', 1)
-                    if len(colon_split) > 1:
-                        title = colon_split[1].strip().strip('",\'')
-                elif not description and any(keyword in line.lower() for keyword in ['description', 'açıklama']):
-                    # Extract anything that looks like a description  
-                    colon_split = line.split(':', 1)
-                    if len(colon_split) > 1:
-                        description = colon_split[1].strip().strip('",\'')
-        
-        # Final fallback - if we still don't have both, provide debug info
-        if not title or not description:
-            # Log the actual response for debugging (truncated)
-            debug_response = response_text[:500] + "..." if len(response_text) > 500 else response_text
-            context.abort(grpc.StatusCode.INTERNAL, 
-                         f"Could not parse Gemini response. Found title: {'Yes' if title else 'No'}, "
-                         f"Found description: {'Yes' if description else 'No'}. "
-                         f"Response preview: {debug_response}")
-        
-        return title, description
+                yield _batch_result(index, result, error)
+        except AnalysisError as e:
+            await context.abort(e.code, e.details)
 
-    def HealthCheck(self, request, context):
-        """Health check endpoint"""
+    async def GenerateFromProductImages(self, request, context):
+        """Analyse several photos of one product in a single model call"""
+        try:
+            result = await self.pipeline.generate_from_product_images(
+                _source_items(request.images), deadline=_deadline(context)
+            )
+        except AnalysisError as e:
+            await context.abort(e.code, e.details)
+        return product_analyzer_pb2.ImageResponse(**result)
+
+    async def GenerateFromImageStream(self, request, context):
+        """Stream model output as it arrives, then the parsed result"""
+        try:
+            async for kind, payload in self.pipeline.generate_from_image_stream(
+                request.image, request.filename, request.content_type, deadline=_deadline(context)
+            ):
+                yield _analysis_event(kind, payload)
+        except AnalysisError as e:
+            await context.abort(e.code, e.details)
+
+    async def SubmitAnalysis(self, request, context):
+        """Queue an analysis; the result is fetched later with GetAnalysis"""
+        try:
+            # SQLite writes and image validation block; keep them off the event loop
+            return await asyncio.to_thread(_submit_job, self.jobs, request)
+        except AnalysisError as e:
+            await context.abort(e.code, e.details)
+
+    async def GetAnalysis(self, request, context):
+        try:
+            return await asyncio.to_thread(_get_job, self.jobs, request)
+        except AnalysisError as e:
+            await context.abort(e.code, e.details)
+
+    async def ListAnalyses(self, request, context):
+        try:
+            return await asyncio.to_thread(_list_jobs, self.jobs, request)
+        except AnalysisError as e:
+            await context.abort(e.code, e.details)
+
+    async def HealthCheck(self, request, context):
+        """Health check endpoint; grpc.health.v1 is the protocol load balancers should use"""
         return product_analyzer_pb2.HealthCheckResponse(
-            status="healthy",
+            status=_health_status(self.health),
             service="ProductAnalyzer"
         )
 
-def serve():
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
+
+SERVER_OPTIONS = [
+    # Every process binds the same port; the kernel balances connections between them
+    ("grpc.so_reuseport", 1),
+    # gRPC's 4 MiB default would reject batch and multi-image requests before they reach the servicer
+    ("grpc.max_receive_message_length", GRPC_MAX_RECEIVE_MESSAGE_BYTES),
+]
+
+
+def _on_stop_signal(callback, loop=None):
+    """Run callback on SIGTERM/SIGINT; signal handlers can only be installed from the main thread"""
+    if threading.current_thread() is not threading.main_thread():
+        return
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        if loop is not None:
+            loop.add_signal_handler(signum, callback)
+        else:
+            signal.signal(signum, lambda *_: callback())
+
+
+async def serve_async(metrics_port=METRICS_PORT):
+    pipeline = AnalysisPipeline()
+    jobs = create_job_runner(pipeline)
+    health = create_health_monitor(pipeline, GRPC_MAX_CONCURRENT_RPCS)
+    health_servicer = grpc_health.aio.HealthServicer()
+    server = grpc.aio.server(
+        interceptors=[AsyncMetricsInterceptor()],
+        maximum_concurrent_rpcs=GRPC_MAX_CONCURRENT_RPCS,
+        options=SERVER_OPTIONS,
+    )
     product_analyzer_pb2_grpc.add_ProductAnalyzerServicer_to_server(
-        ProductImageAnalyzerServicer(), server)
-    server.add_insecure_port('[::]:50071')
-    print("gRPC sunucusu başlatıldı. Port: 50071")
+        AsyncProductImageAnalyzerServicer(pipeline, jobs, health), server)
+    health_pb2_grpc.add_HealthServicer_to_server(health_servicer, server)
+    server.add_insecure_port(f'[::]:{GRPC_PORT}')
+    start_metrics_server(metrics_port, pipeline, jobs, health)
+    print(f"gRPC asyncio sunucusu başlatıldı. Port: {GRPC_PORT}, metrikler: {metrics_port}, pid: {os.getpid()}")
+    stop = asyncio.Event()
+    _on_stop_signal(stop.set, asyncio.get_running_loop())
+    await server.start()
+    health_task = asyncio.ensure_future(health.run_async(health_servicer, HEALTH_INTERVAL_SECONDS))
+    await stop.wait()
+
+    # Drain: load balancers see NOT_SERVING first, new RPCs are refused, in-flight ones get the grace period
+    health_task.cancel()
+    health.drain()
+    await health_servicer.enter_graceful_shutdown()
+    draining = [server.stop(GRPC_SHUTDOWN_GRACE_SECONDS)]
+    if jobs is not None:
+        draining.append(jobs.stop(GRPC_SHUTDOWN_GRACE_SECONDS))
+    await asyncio.gather(*draining)
+    print(f"gRPC sunucusu durduruldu. pid: {os.getpid()}")
+
+
+def serve_threads(metrics_port=METRICS_PORT):
+    pipeline = AnalysisPipeline()
+    jobs = create_job_runner(pipeline)
+    health = create_health_monitor(pipeline, GRPC_MAX_WORKERS)
+    health_servicer = grpc_health.HealthServicer()
+    server = grpc.server(
+        futures.ThreadPoolExecutor(max_workers=GRPC_MAX_WORKERS),
+        interceptors=[MetricsInterceptor()],
+        options=SERVER_OPTIONS,
+    )
+    product_analyzer_pb2_grpc.add_ProductAnalyzerServicer_to_server(
+        ProductImageAnalyzerServicer(pipeline, jobs, health), server)
+    health_pb2_grpc.add_HealthServicer_to_server(health_servicer, server)
+    server.add_insecure_port(f'[::]:{GRPC_PORT}')
+    start_metrics_server(metrics_port, pipeline, jobs, health)
+    print(f"gRPC sunucusu başlatıldı. Port: {GRPC_PORT}, metrikler: {metrics_port}, pid: {os.getpid()}")
+    stop = threading.Event()
+    _on_stop_signal(stop.set)
     server.start()
-    server.wait_for_termination()
+    health.run_in_thread(health_servicer, HEALTH_INTERVAL_SECONDS)
+    stop.wait()
+
+    # Drain: load balancers see NOT_SERVING first, new RPCs are refused, in-flight ones get the grace period
+    health.drain()
+    health_servicer.enter_graceful_shutdown()
+    stopped = server.stop(GRPC_SHUTDOWN_GRACE_SECONDS)
+    if jobs is not None:
+        jobs.shutdown(GRPC_SHUTDOWN_GRACE_SECONDS)
+    stopped.wait()
+    print(f"gRPC sunucusu durduruldu. pid: {os.getpid()}")
+
+
+def serve_worker(index):
+    """Entry point of one supervised worker process"""
+    serve_process(METRICS_PORT + index if METRICS_PORT > 0 else 0)
+
+
+def serve_process(metrics_port=METRICS_PORT):
+    if GRPC_SERVER_MODE == "aio":
+        asyncio.run(serve_async(metrics_port))
+    else:
+        serve_threads(metrics_port)
+
+
+def serve():
+    if GRPC_WORKER_PROCESSES <= 1:
+        serve_process()
+        return
+    # Processes already use every core; a preprocessing pool in each would oversubscribe them
+    os.environ.setdefault("PREPROCESS_WORKERS", "0")
+    # Workers import the pipeline afresh (spawn), so each one sizes its key quotas and admission to its share
+    os.environ["GEMINI_QUOTA_SHARES"] = str(GRPC_WORKER_PROCESSES * int(os.getenv("GEMINI_QUOTA_SHARES", "1")))
+    print(f"gRPC süpervizörü başlatıldı. {GRPC_WORKER_PROCESSES} süreç, port: {GRPC_PORT}")
+    Supervisor(serve_worker, GRPC_WORKER_PROCESSES, grace_seconds=GRPC_SHUTDOWN_GRACE_SECONDS).run()
 
 if __name__ == "__main__":
-    serve()
\ No newline at end of file
+    serve()
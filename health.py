@@ -0,0 +1,142 @@
+"""
+Readiness for the standard grpc.health.v1 protocol.
+
+The server reports NOT_SERVING while it is saturated, so a load balancer
+stops routing to it, and SERVING once it has recovered. Saturation is the
+highest of several loads, each 1.0 at its limit:
+
+- analysis RPCs in flight against the server's capacity (worker threads or
+  the aio concurrency limit)
+- model calls queued in admission control against the queue limit
+- the share of Gemini calls that failed with 429/5xx over the last window,
+  against the highest tolerated rate
+- the expected model latency against a ceiling, when one is configured
+
+The status flips to NOT_SERVING at the `saturated` load and back only once
+the load has dropped to `recovered`, so a server near its limit does not
+flap in and out of the pool. In thread mode the loads are read from another
+thread than the event loop's, so every stats() it calls is safe to read
+concurrently; a failed update is logged and retried on the next tick.
+"""
+import asyncio
+import collections
+import logging
+import threading
+import time
+
+from grpc_health.v1 import health_pb2
+
+from metrics import rpcs_in_flight
+
+logger = logging.getLogger(__name__)
+
+# "" is the whole server; clients may also ask for the service by name
+SERVICES = ("", "productanalyzer.ProductAnalyzer")
+
+
+class HealthMonitor:
+    def __init__(self, pipeline, capacity, saturated=0.9, recovered=0.7, max_error_rate=0.5,
+                 max_model_latency=0.0, window_seconds=60.0, min_requests=10):
+        self.pipeline = pipeline
+        self.capacity = capacity
+        self.saturated = saturated
+        self.recovered = recovered
+        self.max_error_rate = max_error_rate
+        self.max_model_latency = max_model_latency
+        self.window_seconds = window_seconds
+        self.min_requests = min_requests
+        self.serving = True
+        self.draining = False
+        self.loads = {}
+        self._samples = collections.deque()  # (time, requests, failures) of the key pool
+        self._stats = {"transitions": 0, "update_errors": 0}
+
+    @property
+    def status(self):
+        return health_pb2.HealthCheckResponse.SERVING if self.serving else health_pb2.HealthCheckResponse.NOT_SERVING
+
+    def drain(self):
+        """Report NOT_SERVING for good: the server is shutting down"""
+        self.draining = True
+        self.serving = False
+
+    def update(self):
+        """Re-evaluate the loads; returns True when the status changed"""
+        if self.draining:
+            return False
+        admission = self.pipeline.admission.stats()
+        loads = {
+            "in_flight": rpcs_in_flight() / max(self.capacity, 1),
+            "queue": admission["waiting"] / max(self.pipeline.admission.max_queue, 1),
+            "error_rate": self._error_rate() / self.max_error_rate if self.max_error_rate > 0 else 0.0,
+        }
+        if self.max_model_latency > 0:
+            loads["model_latency"] = admission["expected_latency"] / self.max_model_latency
+        # Published whole: the metrics thread iterates it
+        self.loads = loads
+        load = max(loads.values())
+        if self.serving and load >= self.saturated:
+            self.serving = False
+        elif not self.serving and load <= self.recovered:
+            self.serving = True
+        else:
+            return False
+        self._stats["transitions"] += 1
+        logger.warning("Health status %s (%s)", "SERVING" if self.serving else "NOT_SERVING",
+                       ", ".join(f"{name}={value:.2f}" for name, value in self.loads.items()))
+        return True
+
+    def stats(self):
+        stats = dict(self._stats, serving=int(self.serving), draining=int(self.draining))
+        stats.update((f"load_{name}", value) for name, value in self.loads.items())
+        return stats
+
+    def run_in_thread(self, servicer, interval_seconds=1.0):
+        """Keep a grpc_health HealthServicer up to date from a daemon thread"""
+        def loop():
+            while True:
+                if self._update():
+                    for service in SERVICES:
+                        servicer.set(service, self.status)
+                time.sleep(interval_seconds)
+
+        for service in SERVICES:
+            servicer.set(service, self.status)
+        threading.Thread(target=loop, name="health-monitor", daemon=True).start()
+
+    async def run_async(self, servicer, interval_seconds=1.0):
+        """Keep a grpc_health aio HealthServicer up to date; runs until cancelled"""
+        for service in SERVICES:
+            await servicer.set(service, self.status)
+        while True:
+            await asyncio.sleep(interval_seconds)
+            if self._update():
+                for service in SERVICES:
+                    await servicer.set(service, self.status)
+
+    def _update(self):
+        """update() for the monitor loops: a failed read is logged and the loop keeps going"""
+        try:
+            return self.update()
+        except Exception:
+            self._stats["update_errors"] += 1
+            logger.exception("Health update failed; keeping status %s", "SERVING" if self.serving else "NOT_SERVING")
+            return False
+
+    def _error_rate(self):
+        """Share of Gemini calls that failed with 429/5xx within the window; 0 with too few calls to tell"""
+        keys = self.pipeline.clients.keys.stats().values()
+        now = time.monotonic()
+        self._samples.append((
+            now,
+            sum(key["requests_total"] for key in keys),
+            sum(key["failures_total"] for key in keys),
+        ))
+        while self._samples[0][0] < now - self.window_seconds:
+            self._samples.popleft()
+        _, requests_then, failures_then = self._samples[0]
+        _, requests_now, failures_now = self._samples[-1]
+        requests = requests_now - requests_then
+        if requests < self.min_requests:
+            return 0.0
+        return (failures_now - failures_then) / requests
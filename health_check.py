@@ -1,27 +1,47 @@
 #!/usr/bin/env python3
 """
-Simple health check script for gRPC server
+Health check script for the gRPC server.
+
+Calls the standard grpc.health.v1 Check RPC with a short deadline and exits
+0 only when the server reports SERVING (readiness). With --live a server
+that answers NOT_SERVING also counts as up (liveness): it is saturated, not
+dead, and should not be restarted.
 """
-import grpc
-import product_analyzer_pb2_grpc
+import argparse
+import os
 import sys
 
-def check_health():
+import grpc
+from grpc_health.v1 import health_pb2, health_pb2_grpc
+
+
+def check_health(target, timeout, service="", live=False):
     try:
-        # Try to connect to the gRPC server
-        channel = grpc.insecure_channel('localhost:50071')
-        stub = product_analyzer_pb2_grpc.ProductAnalyzerStub(channel)
-        
-        # Set a short timeout for health check
-        channel.close()
-        return True
-    except Exception:
-        return False
+        with grpc.insecure_channel(target) as channel:
+            stub = health_pb2_grpc.HealthStub(channel)
+            response = stub.Check(health_pb2.HealthCheckRequest(service=service), timeout=timeout)
+    except grpc.RpcError as e:
+        return False, f"{e.code().name}: {e.details()}"
+    status = health_pb2.HealthCheckResponse.ServingStatus.Name(response.status)
+    if response.status == health_pb2.HealthCheckResponse.SERVING:
+        return True, status
+    return live and response.status == health_pb2.HealthCheckResponse.NOT_SERVING, status
 
-if __name__ == "__main__":
-    if check_health():
-        print("✅ gRPC server is healthy")
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the gRPC server's health")
+    parser.add_argument("--target", default=f"localhost:{os.getenv('GRPC_PORT', '50071')}")
+    parser.add_argument("--timeout", type=float, default=2.0, help="deadline in seconds")
+    parser.add_argument("--service", default="", help="service name; empty means the whole server")
+    parser.add_argument("--live", action="store_true", help="treat NOT_SERVING as alive")
+    args = parser.parse_args()
+    healthy, status = check_health(args.target, args.timeout, args.service, args.live)
+    if healthy:
+        print(f"✅ gRPC server is healthy ({status})")
         sys.exit(0)
-    else:
-        print("❌ gRPC server is not responding")
-        sys.exit(1)
\ No newline at end of file
+    print(f"❌ gRPC server is not healthy ({status})")
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Hedged model calls for tail latency.
+
+If a model stream has not produced its first chunk after the hedge delay
+(the observed p90 of time to first chunk by default), an identical second
+call is started and whichever stream yields first is kept; the other one is
+cancelled. Almost all of Gemini's latency is spent before the first chunk
+(thinking and search), so the first stream to start answering is in practice
+the first to finish, and racing on the first chunk lets the answer keep
+streaming to the client.
+
+Hedges are limited by a budget: every call earns `budget` hedge credits
+(0.05 = at most 5% extra calls) and a hedge spends one.
+"""
+import asyncio
+import collections
+import time
+
+_END = object()
+
+
+async def _first_chunk(stream):
+    try:
+        return await stream.__anext__()
+    except StopAsyncIteration:
+        return _END
+
+
+class Hedger:
+    def __init__(self, enabled=False, quantile=0.9, budget=0.05, min_delay=1.0, min_samples=20,
+                 window=1000, max_credit=10.0):
+        self.enabled = enabled
+        self.quantile = quantile
+        self.budget = budget
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self.max_credit = max_credit
+        self.window = window
+        # Time-to-first-chunk samples per key (the model name), since models answer at very different speeds
+        self._samples = {}
+        self._credit = 0.0
+        self._stats = {"calls": 0, "hedges": 0, "hedge_wins": 0, "budget_denied": 0}
+
+    def delay(self, key=None):
+        """Seconds to wait for the first chunk before hedging, or None until enough calls were observed"""
+        samples = self._samples.get(key, ())
+        if len(samples) < self.min_samples:
+            return None
+        ordered = sorted(samples)
+        return max(self.min_delay, ordered[min(int(len(ordered) * self.quantile), len(ordered) - 1)])
+
+    async def stream(self, start_stream, key=None):
+        """
+        Yield the chunks of start_stream(), hedging with a second start_stream()
+        when the first chunk is late. start_stream returns an async generator;
+        calls with the same key share latency samples.
+        """
+        self._stats["calls"] += 1
+        self._credit = min(self.max_credit, self._credit + self.budget)
+        delay = self.delay(key) if self.enabled else None
+
+        started = time.perf_counter()
+        primary = start_stream()
+        racers = {asyncio.ensure_future(_first_chunk(primary)): (primary, started)}
+        winner = None
+        try:
+            done, _ = await asyncio.wait(racers, timeout=delay)
+            if not done and self._take_credit():
+                hedge = start_stream()
+                racers[asyncio.ensure_future(_first_chunk(hedge))] = (hedge, time.perf_counter())
+                self._stats["hedges"] += 1
+
+            pending = set(racers)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        # Keep waiting on the other stream; fail only if both do
+                        error = error or task.exception()
+                    elif winner is None:
+                        winner = task
+                if winner is not None:
+                    break
+            if winner is None:
+                raise error
+        finally:
+            for task, (stream, _) in racers.items():
+                if task is winner:
+                    continue
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                await stream.aclose()
+
+        stream, stream_started = racers[winner]
+        samples = self._samples.setdefault(key, collections.deque(maxlen=self.window))
+        samples.append(time.perf_counter() - stream_started)
+        if stream is not primary:
+            self._stats["hedge_wins"] += 1
+
+        first = winner.result()
+        if first is _END:
+            return
+        try:
+            yield first
+            async for chunk in stream:
+                yield chunk
+        finally:
+            # Release the winning call's key lease now if the caller stops reading early
+            await stream.aclose()
+
+    def stats(self):
+        delays = [self.delay(key) or 0.0 for key in self._samples]
+        return dict(self._stats, delay=max(delays, default=0.0), credit=self._credit)
+
+    def _take_credit(self):
+        if self._credit < 1:
+            self._stats["budget_denied"] += 1
+            return False
+        self._credit -= 1
+        return True
@@ -0,0 +1,180 @@
+"""
+Streaming, size-capped image downloads with an optional conditional-request cache.
+
+Bodies are streamed and the download is abandoned as soon as the declared or
+received size passes the cap, so an oversized or slow URL cannot hold a worker
+and its memory for the whole timeout. With a cache directory configured,
+fetched images are stored on disk per URL and revalidated with
+If-None-Match / If-Modified-Since, so unchanged images are not downloaded again.
+"""
+import asyncio
+import hashlib
+import io
+import json
+import os
+import tempfile
+import threading
+from urllib.parse import urlsplit, urlunsplit
+
+import httpx
+
+
+def normalize_url(url):
+    """Canonical form used to recognise the same URL: trimmed, lower-case scheme/host, no fragment"""
+    parts = urlsplit(url.strip())
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path, parts.query, ""))
+
+
+class NotAnImage(Exception):
+    def __init__(self, content_type):
+        super().__init__(f"Content-Type: {content_type}")
+        self.content_type = content_type
+
+
+class ImageTooLarge(Exception):
+    pass
+
+
+class ImageFetcher:
+    def __init__(self, clients, max_bytes, connect_timeout=5.0, read_timeout=10.0, total_timeout=30.0,
+                 cache_dir=None, cache_max_bytes=1024 * 1024 * 1024):
+        self.clients = clients
+        self.max_bytes = max_bytes
+        self.timeout = httpx.Timeout(connect=connect_timeout, read=read_timeout, write=read_timeout, pool=connect_timeout)
+        # read_timeout bounds each socket read; total_timeout stops servers that drip bytes just fast enough
+        self.total_timeout = total_timeout
+        self.cache = _DiskCache(cache_dir, cache_max_bytes) if cache_dir else None
+
+    async def fetch(self, url):
+        """Return (image_bytes, content_type) for url"""
+        return await asyncio.wait_for(self._fetch(url), self.total_timeout)
+
+    async def _fetch(self, url):
+        cached = await asyncio.to_thread(self.cache.get_metadata, url) if self.cache else None
+        fetched = await self._download(url, cached)
+        if fetched is None:
+            # Not modified, but the body was evicted after its metadata was read: drop the entry
+            # and download unconditionally
+            await asyncio.to_thread(self.cache.discard, url)
+            fetched = await self._download(url, None)
+        return fetched
+
+    async def _download(self, url, cached):
+        """(image_bytes, content_type), revalidating the cached entry if any; None on a 304 without a cached body"""
+        headers = {}
+        if cached:
+            if cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+
+        async with self.clients.track("http"):
+            async with self.clients.http.stream("GET", url, headers=headers, timeout=self.timeout) as response:
+                if response.status_code == 304 and cached:
+                    body = await asyncio.to_thread(self.cache.get_body, url)
+                    return (body, cached["content_type"]) if body is not None else None
+                response.raise_for_status()
+
+                # Reject by headers before reading any of the body
+                content_type = response.headers.get('content-type', '')
+                if not content_type.startswith('image/'):
+                    raise NotAnImage(content_type)
+                declared = response.headers.get('content-length')
+                if declared and declared.isdigit() and int(declared) > self.max_bytes:
+                    raise ImageTooLarge()
+
+                # BytesIO hands its buffer over in getvalue(), so the body is never held twice
+                buffer = io.BytesIO()
+                async for chunk in response.aiter_bytes():
+                    if buffer.tell() + len(chunk) > self.max_bytes:
+                        raise ImageTooLarge()
+                    buffer.write(chunk)
+                body = buffer.getvalue()
+
+        if self.cache and (response.headers.get("etag") or response.headers.get("last-modified")):
+            metadata = {
+                "url": url,
+                "content_type": content_type,
+                "etag": response.headers.get("etag"),
+                "last_modified": response.headers.get("last-modified"),
+            }
+            await asyncio.to_thread(self.cache.put, url, body, metadata)
+        return body, content_type
+
+
+class _DiskCache:
+    """URL-keyed body + metadata files, trimmed oldest-first past max_bytes"""
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._bytes = sum(
+            entry.stat().st_size for entry in os.scandir(directory) if entry.name.endswith(".bin")
+        )
+
+    def get_metadata(self, url):
+        try:
+            with open(self._path(url, ".json"), encoding="utf-8") as f:
+                metadata = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return metadata if metadata.get("url") == url else None
+
+    def get_body(self, url):
+        try:
+            with open(self._path(url, ".bin"), "rb") as f:
+                body = f.read()
+        except OSError:
+            return None
+        # Touch so eviction treats revalidated entries as recently used
+        os.utime(self._path(url, ".bin"))
+        return body
+
+    def put(self, url, body, metadata):
+        with self._lock:
+            body_path = self._path(url, ".bin")
+            previous = os.path.getsize(body_path) if os.path.exists(body_path) else 0
+            self._write_atomic(body_path, body)
+            self._write_atomic(self._path(url, ".json"), json.dumps(metadata).encode("utf-8"))
+            self._bytes += len(body) - previous
+            if self._bytes > self.max_bytes:
+                self._evict()
+
+    def discard(self, url):
+        with self._lock:
+            for suffix in (".bin", ".json"):
+                path = self._path(url, suffix)
+                try:
+                    size = os.path.getsize(path)
+                    os.remove(path)
+                except OSError:
+                    continue
+                if suffix == ".bin":
+                    self._bytes -= size
+
+    def _evict(self):
+        bodies = sorted(
+            (entry for entry in os.scandir(self.directory) if entry.name.endswith(".bin")),
+            key=lambda entry: entry.stat().st_mtime,
+        )
+        for entry in bodies:
+            if self._bytes <= self.max_bytes * 0.9:
+                break
+            size = entry.stat().st_size
+            for suffix in (".bin", ".json"):
+                try:
+                    os.remove(entry.path[:-len(".bin")] + suffix)
+                except OSError:
+                    pass
+            self._bytes -= size
+
+    def _write_atomic(self, path, data):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _path(self, url, suffix):
+        return os.path.join(self.directory, hashlib.sha256(url.encode("utf-8")).hexdigest() + suffix)
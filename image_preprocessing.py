@@ -0,0 +1,80 @@
+"""
+Bounded-resolution re-encode of product images before they go to the model.
+
+Gemini only needs a modest resolution to identify a product, so uploading the
+original multi-megabyte file wastes bandwidth and input tokens. Images are
+decoded at reduced size where the codec allows it (`Image.draft` for JPEG),
+downscaled to a maximum edge, stripped of metadata and re-encoded compactly.
+
+This module is imported by process-pool workers, so it must stay free of
+gRPC and Gemini imports.
+"""
+import io
+import time
+
+from PIL import Image
+
+from image_validation import BufferReader
+from perceptual_hash import dhash
+
+OUTPUT_MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp"}
+# Formats the model accepts as-is, so a small original can be sent unchanged
+PASSTHROUGH_FORMATS = {"JPEG", "PNG", "WEBP"}
+
+
+def preprocess_image(image_bytes, max_edge=1536, output_format="JPEG", quality=85):
+    """
+    Decode, downscale and re-encode an image.
+
+    Returns (payload_bytes, mime_type, fingerprint, stats). If re-encoding would
+    not make an already small image any smaller, payload_bytes is None and the
+    original should be sent; the caller already holds it, so it is not copied back
+    from a worker process. Raises whatever PIL raises for undecodable input.
+    """
+    started = time.perf_counter()
+    image = Image.open(BufferReader(image_bytes))
+    source_format = image.format
+    original_size = image.size
+    # JPEG can decode directly at 1/2, 1/4 or 1/8 scale, skipping most of the IDCT work
+    image.draft("RGB", (max_edge, max_edge))
+    decoded_bytes = image.size[0] * image.size[1] * len(image.getbands())
+    image = _flatten(image)
+    image.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+    fingerprint = dhash(image)
+    decode_seconds = time.perf_counter() - started
+
+    output = io.BytesIO()
+    # Saving without exif/icc_profile drops the source metadata
+    image.save(output, format=output_format, quality=quality, optimize=True)
+    payload = output.getvalue()
+    mime_type = OUTPUT_MIME_TYPES[output_format]
+    payload_bytes = len(payload)
+    if payload_bytes >= len(image_bytes) and image.size == original_size and source_format in PASSTHROUGH_FORMATS:
+        payload = None
+        payload_bytes = len(image_bytes)
+        mime_type = Image.MIME.get(source_format, mime_type)
+
+    stats = {
+        "original_bytes": len(image_bytes),
+        "payload_bytes": payload_bytes,
+        "bytes_saved": len(image_bytes) - payload_bytes,
+        # Bitmap size at the decode scale, before the downscale and the RGB copy
+        "decoded_bytes": decoded_bytes,
+        "decode_seconds": decode_seconds,
+        "total_seconds": time.perf_counter() - started,
+        "original_size": original_size,
+        "payload_size": image.size,
+    }
+    return payload, mime_type, fingerprint, stats
+
+
+def _flatten(image):
+    """Convert to RGB, compositing transparent pixels onto white instead of black"""
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel("A"))
+        return background
+    if image.mode != "RGB":
+        return image.convert("RGB")
+    return image
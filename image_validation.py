@@ -0,0 +1,101 @@
+"""
+Header-only image validation.
+
+The format is sniffed from the file's magic bytes and cross-checked by PIL's
+header parser, which reads the dimensions without decoding any pixels. A
+renamed non-image file, or a small file declaring a huge canvas (a
+decompression bomb), is therefore rejected before a decoder allocates its
+bitmap, whatever filename and content type the client claimed.
+
+Like image_preprocessing, this module is imported by process-pool workers,
+so it must stay free of gRPC and Gemini imports.
+"""
+import io
+from collections import namedtuple
+
+from PIL import Image
+
+# (offset, magic bytes, PIL format)
+_SIGNATURES = (
+    (0, b"\xff\xd8\xff", "JPEG"),
+    (0, b"\x89PNG\r\n\x1a\n", "PNG"),
+    (0, b"GIF87a", "GIF"),
+    (0, b"GIF89a", "GIF"),
+    (0, b"BM", "BMP"),
+    (8, b"WEBP", "WEBP"),
+)
+MIME_TYPES = {"JPEG": "image/jpeg", "PNG": "image/png", "GIF": "image/gif", "BMP": "image/bmp", "WEBP": "image/webp"}
+
+ImageInfo = namedtuple("ImageInfo", "format mime_type width height bands")
+
+
+class InvalidImage(Exception):
+    """Not an image in a supported format, or a header PIL cannot parse"""
+
+
+class DecompressionBomb(InvalidImage):
+    """The header declares more pixels than the limit allows"""
+
+
+class BufferReader(io.RawIOBase):
+    """Seekable file object over any bytes-like buffer; reads slice a memoryview instead of copying the buffer"""
+
+    def __init__(self, buffer):
+        self._view = memoryview(buffer).cast("B")
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, target):
+        chunk = self._view[self._position:self._position + len(target)]
+        target[:len(chunk)] = chunk
+        self._position += len(chunk)
+        return len(chunk)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += len(self._view)
+        self._position = max(0, offset)
+        return self._position
+
+    def tell(self):
+        return self._position
+
+
+def sniff_format(data):
+    """PIL format name from the magic bytes, or None"""
+    head = bytes(memoryview(data)[:16])
+    for offset, magic, image_format in _SIGNATURES:
+        if head[offset:offset + len(magic)] == magic:
+            if image_format == "WEBP" and not head.startswith(b"RIFF"):
+                continue
+            return image_format
+    return None
+
+
+def inspect_image(data, max_pixels):
+    """
+    ImageInfo from the header alone. Raises InvalidImage for unknown or
+    malformed files and DecompressionBomb when the declared size exceeds max_pixels.
+    """
+    image_format = sniff_format(data)
+    if image_format is None:
+        raise InvalidImage("unrecognised file signature")
+    try:
+        # Only the plugin the signature names may parse it, so a polyglot can't pick another decoder
+        with Image.open(BufferReader(data), formats=[image_format]) as image:
+            width, height = image.size
+            bands = len(image.getbands())
+    except Image.DecompressionBombError as e:
+        raise DecompressionBomb(str(e))
+    except Exception as e:
+        raise InvalidImage(str(e))
+    if width * height > max_pixels:
+        raise DecompressionBomb(f"{width}x{height} pixels")
+    return ImageInfo(image_format, MIME_TYPES[image_format], width, height, bands)
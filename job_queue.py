@@ -0,0 +1,388 @@
+"""
+Persistent job queue behind the SubmitAnalysis/GetAnalysis/ListAnalyses RPCs.
+
+Jobs live in SQLite (WAL mode), so a restart loses nothing: a job that was
+running when its process died is queued again, with backoff, once its lease
+expires, and fails for good once it has used up its attempts.
+Several server processes can share one database; claiming a job is a single
+write transaction. A fixed pool of asyncio workers drains the queue through
+the analysis pipeline, so throughput is set by JOB_WORKERS rather than by how
+many clients are connected. Failed attempts are retried with exponential
+backoff; finished jobs are kept for a retention period and then deleted.
+"""
+import asyncio
+import json
+import logging
+import random
+import sqlite3
+import threading
+import time
+import uuid
+
+import grpc
+
+from analysis_pipeline import AnalysisError
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+STATES = (QUEUED, RUNNING, SUCCEEDED, FAILED)
+
+# Failures another attempt can fix: overload, timeouts and model/parse errors
+RETRYABLE_CODES = frozenset({
+    grpc.StatusCode.RESOURCE_EXHAUSTED,
+    grpc.StatusCode.UNAVAILABLE,
+    grpc.StatusCode.DEADLINE_EXCEEDED,
+    grpc.StatusCode.INTERNAL,
+    grpc.StatusCode.UNKNOWN,
+})
+
+_COLUMNS = (
+    "seq, id, idempotency_key, kind, filename, content_type, image_url, state, attempts, "
+    "result, error_code, error_message, created_at, updated_at"
+)
+
+
+def retry_delay(attempts, base_seconds, max_seconds):
+    """Seconds to wait after failed attempt number `attempts`: doubling from base_seconds up to max_seconds"""
+    # Jitter keeps a burst of failed jobs from coming back at the same moment
+    return min(max_seconds, base_seconds * 2 ** (attempts - 1)) * random.uniform(0.5, 1.0)
+
+
+class JobQueue:
+    """SQLite-backed job store; all methods are thread-safe and short"""
+
+    def __init__(self, db_path, lease_seconds=360.0, retention_seconds=7 * 24 * 3600, max_attempts=5,
+                 retry_base_seconds=30.0, retry_max_seconds=3600.0):
+        self.lease_seconds = lease_seconds
+        self.retention_seconds = retention_seconds
+        # Applied to jobs whose lease expired, e.g. ones that crash their worker process
+        self.max_attempts = max_attempts
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self._lock = threading.Lock()
+        # Autocommit; claims open their own IMMEDIATE transaction so other processes wait instead of racing
+        self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None, timeout=5)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "seq INTEGER PRIMARY KEY AUTOINCREMENT, id TEXT NOT NULL UNIQUE, idempotency_key TEXT UNIQUE, "
+            "kind TEXT NOT NULL, image BLOB, filename TEXT, content_type TEXT, image_url TEXT, "
+            "state TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, next_attempt_at REAL NOT NULL, "
+            "lease_until REAL, result TEXT, error_code INTEGER, error_message TEXT, "
+            "created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_due ON jobs (state, next_attempt_at)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_updated ON jobs (state, updated_at)")
+
+    def submit(self, kind, args, idempotency_key=None):
+        """
+        Queue an analysis of ("image", (bytes, filename, content_type)) or ("image_url", (url,)).
+        A known idempotency key returns the job it was first used for instead of queueing a new one.
+        """
+        image, filename, content_type, image_url = None, None, None, None
+        if kind == "image":
+            image, filename, content_type = args
+        else:
+            image_url = args[0]
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR IGNORE INTO jobs (id, idempotency_key, kind, image, filename, content_type, image_url, "
+                "state, next_attempt_at, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (uuid.uuid4().hex, idempotency_key or None, kind, image, filename, content_type, image_url,
+                 QUEUED, now, now, now),
+            )
+            if idempotency_key:
+                row = self._db.execute(
+                    f"SELECT {_COLUMNS} FROM jobs WHERE idempotency_key = ?", (idempotency_key,)
+                ).fetchone()
+            else:
+                row = self._db.execute(f"SELECT {_COLUMNS} FROM jobs WHERE seq = last_insert_rowid()").fetchone()
+        return _job(row)
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._db.execute(f"SELECT {_COLUMNS} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return _job(row) if row is not None else None
+
+    def list(self, state=None, limit=100, after=0):
+        """Jobs in submission order after the `after` cursor; returns (jobs, next cursor or 0 at the end)"""
+        query = f"SELECT {_COLUMNS} FROM jobs WHERE seq > ?"
+        params = [after]
+        if state:
+            query += " AND state = ?"
+            params.append(state)
+        query += " ORDER BY seq LIMIT ?"
+        params.append(limit + 1)
+        with self._lock:
+            rows = self._db.execute(query, params).fetchall()
+        jobs = [_job(row) for row in rows[:limit]]
+        return jobs, (jobs[-1]["seq"] if len(rows) > limit else 0)
+
+    def claim(self):
+        """
+        Lease the next due job to the caller. Returns (job, args) or None when nothing is due.
+
+        A job whose lease expired (its worker died, possibly because of the job) counts as a
+        failed attempt: it is queued again with backoff, or fails once it has used up max_attempts.
+        """
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                while True:
+                    row = self._db.execute(
+                        "SELECT seq, id, state, attempts FROM jobs "
+                        "WHERE (state = ? AND next_attempt_at <= ?) OR (state = ? AND lease_until < ?) "
+                        "ORDER BY next_attempt_at LIMIT 1",
+                        (QUEUED, now, RUNNING, now),
+                    ).fetchone()
+                    if row is None:
+                        self._db.execute("COMMIT")
+                        return None
+                    if row["state"] == QUEUED:
+                        break
+                    self._expire(row, now)
+                self._db.execute(
+                    "UPDATE jobs SET state = ?, attempts = attempts + 1, lease_until = ?, updated_at = ? WHERE seq = ?",
+                    (RUNNING, now + self.lease_seconds, now, row["seq"]),
+                )
+                claimed = self._db.execute(
+                    f"SELECT {_COLUMNS}, image FROM jobs WHERE seq = ?", (row["seq"],)
+                ).fetchone()
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        job = _job(claimed)
+        if job["kind"] == "image":
+            args = (claimed["image"], job["filename"], job["content_type"])
+        else:
+            args = (job["image_url"],)
+        return job, args
+
+    def complete(self, job, result):
+        """Store the result and drop the image, unless the lease was lost to another worker meanwhile"""
+        self._finish(job, SUCCEEDED, json.dumps(result, ensure_ascii=False), None, None)
+
+    def fail(self, job, code, message, retry_at=None):
+        """Record a failed attempt; with retry_at the job is queued again for then, otherwise it fails for good"""
+        if retry_at is None:
+            self._finish(job, FAILED, None, code.value[0], message)
+            return
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET state = ?, next_attempt_at = ?, lease_until = NULL, error_code = ?, error_message = ?, "
+                "updated_at = ? WHERE seq = ? AND state = ? AND attempts = ?",
+                (QUEUED, retry_at, code.value[0], message, time.time(), job["seq"], RUNNING, job["attempts"]),
+            )
+
+    def release(self, job):
+        """Hand a job back untouched, e.g. at shutdown; the attempt does not count"""
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET state = ?, attempts = attempts - 1, lease_until = NULL, updated_at = ? "
+                "WHERE seq = ? AND state = ? AND attempts = ?",
+                (QUEUED, time.time(), job["seq"], RUNNING, job["attempts"]),
+            )
+
+    def purge(self):
+        """Delete finished jobs older than the retention period; returns how many"""
+        cutoff = time.time() - self.retention_seconds
+        with self._lock:
+            cursor = self._db.execute(
+                "DELETE FROM jobs WHERE state IN (?, ?) AND updated_at < ?", (SUCCEEDED, FAILED, cutoff)
+            )
+        return cursor.rowcount
+
+    def stats(self):
+        with self._lock:
+            rows = self._db.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall()
+        counts = dict.fromkeys(STATES, 0)
+        counts.update({state: count for state, count in rows})
+        return counts
+
+    def _expire(self, row, now):
+        """Settle the attempt of a job whose lease ran out; caller holds the claim transaction"""
+        message = f"Lease expired on attempt {row['attempts']}; the worker stopped before finishing"
+        if row["attempts"] >= self.max_attempts:
+            self._db.execute(
+                "UPDATE jobs SET state = ?, image = NULL, lease_until = NULL, error_code = ?, error_message = ?, "
+                "updated_at = ? WHERE seq = ?",
+                (FAILED, grpc.StatusCode.INTERNAL.value[0], message, now, row["seq"]),
+            )
+            logger.warning("Job %s failed: %s", row["id"], message)
+            return
+        retry_at = now + retry_delay(row["attempts"], self.retry_base_seconds, self.retry_max_seconds)
+        self._db.execute(
+            "UPDATE jobs SET state = ?, next_attempt_at = ?, lease_until = NULL, error_code = ?, error_message = ?, "
+            "updated_at = ? WHERE seq = ?",
+            (QUEUED, retry_at, grpc.StatusCode.INTERNAL.value[0], message, now, row["seq"]),
+        )
+
+    def _finish(self, job, state, result, error_code, error_message):
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET state = ?, result = ?, error_code = ?, error_message = ?, image = NULL, "
+                "lease_until = NULL, updated_at = ? WHERE seq = ? AND state = ? AND attempts = ?",
+                (state, result, error_code, error_message, time.time(), job["seq"], RUNNING, job["attempts"]),
+            )
+
+
+def _job(row):
+    job = dict(row)
+    job.pop("image", None)
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    return job
+
+
+class JobRunner:
+    """Pool of asyncio workers running queued jobs through the pipeline"""
+
+    def __init__(self, queue, pipeline, workers=4, timeout_seconds=300.0, max_attempts=5,
+                 retry_base_seconds=30.0, retry_max_seconds=3600.0, poll_seconds=1.0, purge_seconds=3600.0):
+        self.queue = queue
+        self.pipeline = pipeline
+        self.workers = workers
+        self.timeout_seconds = timeout_seconds
+        self.max_attempts = max_attempts
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self.poll_seconds = poll_seconds
+        self.purge_seconds = purge_seconds
+        self._loop = None
+        self._wakeup = asyncio.Event()
+        self._tasks = []
+        self._purge_task = None
+        self._stopping = False
+        self._stats = {"succeeded": 0, "failed": 0, "retried": 0, "purged": 0, "busy": 0}
+
+    def start(self, loop):
+        """Start the workers on loop; safe to call from any thread, including the loop's own"""
+        self._loop = loop
+        loop.call_soon_threadsafe(self._start)
+
+    def submit(self, kind, args, idempotency_key=None):
+        job = self.queue.submit(kind, args, idempotency_key)
+        self.notify()
+        return job
+
+    def notify(self):
+        """Wake idle workers; callable from any thread"""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def stop(self, grace_seconds=0.0):
+        """
+        Stop claiming jobs and give the running ones grace_seconds to finish; jobs still
+        running then are cancelled and handed back to the queue for another worker
+        """
+        self._stopping = True
+        self._wakeup.set()
+        if self._purge_task is not None:
+            self._purge_task.cancel()
+        if self._tasks:
+            _, pending = await asyncio.wait(self._tasks, timeout=grace_seconds)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def shutdown(self, grace_seconds=0.0):
+        """stop() from a thread other than the loop's; blocks until the workers are done"""
+        if self._loop is not None:
+            asyncio.run_coroutine_threadsafe(self.stop(grace_seconds), self._loop).result()
+
+    def stats(self):
+        stats = dict(self._stats, workers=self.workers)
+        stats.update((f"jobs_{state}", count) for state, count in self.queue.stats().items())
+        return stats
+
+    def _start(self):
+        self._tasks = [self._loop.create_task(self._work()) for _ in range(self.workers)]
+        self._purge_task = self._loop.create_task(self._purge())
+
+    async def _work(self):
+        while not self._stopping:
+            claimed = await self._claim()
+            if claimed is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            job, args = claimed
+            self._stats["busy"] += 1
+            try:
+                await self._run(job, args)
+            except asyncio.CancelledError:
+                # Synchronous on purpose: a cancelled task cannot reliably await, and the update is one row
+                self.queue.release(job)
+                raise
+            finally:
+                self._stats["busy"] -= 1
+
+    async def _run(self, job, args):
+        try:
+            # The deadline alone only reaches admission; a hung model call must not outlive the lease,
+            # or another worker takes the job over and runs it twice
+            result = await asyncio.wait_for(self._attempt(job, args), self.timeout_seconds)
+        except asyncio.TimeoutError:
+            await self._fail(job, AnalysisError(
+                grpc.StatusCode.DEADLINE_EXCEEDED, f"Attempt timed out after {self.timeout_seconds:.0f}s"
+            ))
+            return
+        except AnalysisError as e:
+            await self._fail(job, e)
+            return
+        except Exception as e:
+            logger.exception("Job %s failed unexpectedly", job["id"])
+            await asyncio.to_thread(self.queue.fail, job, grpc.StatusCode.INTERNAL, str(e))
+            self._stats["failed"] += 1
+            return
+        await asyncio.to_thread(self.queue.complete, job, result)
+        self._stats["succeeded"] += 1
+
+    async def _attempt(self, job, args):
+        deadline = time.monotonic() + self.timeout_seconds
+        if job["kind"] == "image":
+            return await self.pipeline.generate_from_image(*args, deadline=deadline)
+        return await self.pipeline.generate_from_image_url(*args, deadline=deadline)
+
+    async def _claim(self):
+        """queue.claim() off the event loop; a claim that lands after the worker was cancelled is handed back"""
+        claim = asyncio.ensure_future(asyncio.to_thread(self.queue.claim))
+        try:
+            return await asyncio.shield(claim)
+        except asyncio.CancelledError:
+            claim.add_done_callback(self._release_late_claim)
+            raise
+
+    def _release_late_claim(self, claim):
+        if not claim.cancelled() and claim.exception() is None and claim.result() is not None:
+            self.queue.release(claim.result()[0])
+
+    async def _fail(self, job, e):
+        """Record a failed attempt, queueing the job again while the error is retryable and attempts remain"""
+        if e.code in RETRYABLE_CODES and job["attempts"] < self.max_attempts:
+            retry_at = time.time() + retry_delay(job["attempts"], self.retry_base_seconds, self.retry_max_seconds)
+            await asyncio.to_thread(self.queue.fail, job, e.code, e.details, retry_at)
+            self._stats["retried"] += 1
+        else:
+            await asyncio.to_thread(self.queue.fail, job, e.code, e.details)
+            self._stats["failed"] += 1
+
+    async def _purge(self):
+        while True:
+            try:
+                self._stats["purged"] += await asyncio.to_thread(self.queue.purge)
+            except sqlite3.Error as e:
+                logger.warning("Could not purge old jobs: %s", e)
+            await asyncio.sleep(self.purge_seconds)
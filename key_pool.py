@@ -0,0 +1,188 @@
+"""
+Scheduling of model calls across several Gemini API keys.
+
+Each key (typically one per Google Cloud project) has its own requests-per-
+minute and tokens-per-minute quota. Calls go to the healthy key with the most
+headroom in a sliding one-minute window. A call that fails with 429 or 5xx is
+retried on another key, but only a 429 (the key's own quota is used up)
+ejects the key for an exponentially growing cool-down: a 5xx or "overloaded"
+error is model-wide and says nothing about the key. The last healthy key is
+never ejected, so a single-key deployment keeps serving through a 429 burst
+instead of failing every request for the whole cool-down.
+"""
+import collections
+import threading
+import time
+from collections import namedtuple
+
+from admission import is_overload_error
+
+QUOTA_MARKERS = ("429", "RESOURCE_EXHAUSTED")
+
+WINDOW_SECONDS = 60.0
+
+# One configured key: the secret and its per-minute quotas
+KeySpec = namedtuple("KeySpec", "key rpm tpm")
+
+
+def parse_api_keys(spec, default_rpm, default_tpm):
+    """
+    Parse "key1,key2:rpm:tpm,..." into KeySpecs; quotas left out use the defaults.
+    Empty entries are skipped, so a single plain key works unchanged.
+    """
+    keys = []
+    for entry in spec.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        key, _, quotas = entry.partition(":")
+        rpm, _, tpm = quotas.partition(":")
+        keys.append(KeySpec(key, int(rpm) if rpm else default_rpm, int(tpm) if tpm else default_tpm))
+    return keys
+
+
+def split_quota(keys, shares):
+    """Each of `shares` processes using the same keys gets an equal slice of every key's quota"""
+    return [KeySpec(spec.key, max(1, spec.rpm // shares), max(1, spec.tpm // shares)) for spec in keys]
+
+
+def is_key_failure(error):
+    """Errors worth retrying on another key: quota (429) and server-side (5xx) failures"""
+    code = getattr(error, "code", None)
+    if isinstance(code, int) and (code == 429 or 500 <= code < 600):
+        return True
+    return is_overload_error(error)
+
+
+def is_quota_error(error):
+    """A 429: this key's quota is exhausted, unlike a 5xx that any key would get"""
+    code = getattr(error, "code", None)
+    if isinstance(code, int):
+        return code == 429
+    message = str(error)
+    return any(marker in message for marker in QUOTA_MARKERS)
+
+
+class NoKeyAvailable(Exception):
+    pass
+
+
+class ApiKey:
+    def __init__(self, label, client, rpm, tpm):
+        self.label = label
+        self.client = client
+        self.rpm = rpm
+        self.tpm = tpm
+        self.in_flight = 0
+        self.ejected_until = 0.0
+        self.consecutive_failures = 0
+        self._window = collections.deque()  # [started_at, tokens] per call in the last minute
+        self._stats = {
+            "requests_total": 0, "tokens_total": 0, "failures_total": 0, "ejections_total": 0, "ejections_skipped": 0,
+        }
+
+    def usage(self, now):
+        """(requests, tokens) charged to this key in the last minute; caller holds the pool's lock"""
+        while self._window and self._window[0][0] <= now - WINDOW_SECONDS:
+            self._window.popleft()
+        return len(self._window), sum(entry[1] for entry in self._window)
+
+    def headroom(self, now, tokens):
+        """Fraction of the tighter quota left after a call of `tokens` tokens; negative means over quota"""
+        requests, used_tokens = self.usage(now)
+        return min(1 - (requests + 1) / self.rpm, 1 - (used_tokens + tokens) / self.tpm)
+
+    def healthy(self, now):
+        return now >= self.ejected_until
+
+
+class KeyLease:
+    """One call charged to a key; `entry` is its slot in the key's usage window"""
+
+    def __init__(self, api_key, entry):
+        self.api_key = api_key
+        self.entry = entry
+
+    @property
+    def client(self):
+        return self.api_key.client
+
+
+class KeyPool:
+    def __init__(self, api_keys, eject_base_seconds=10.0, eject_max_seconds=300.0):
+        self.keys = api_keys
+        self.eject_base_seconds = eject_base_seconds
+        self.eject_max_seconds = eject_max_seconds
+        # Calls are charged on the event loop while metrics and health read stats() from their own threads
+        self._lock = threading.Lock()
+
+    def acquire(self, estimated_tokens, exclude=()):
+        """
+        Charge a call to the healthy key with the most headroom, skipping keys in `exclude`.
+        Raises NoKeyAvailable when every remaining key is ejected or out of quota.
+        """
+        now = time.monotonic()
+        best, best_headroom = None, 0.0
+        with self._lock:
+            for api_key in self.keys:
+                if api_key in exclude or not api_key.healthy(now):
+                    continue
+                headroom = api_key.headroom(now, estimated_tokens)
+                if best is None or (headroom, -api_key.in_flight) > (best_headroom, -best.in_flight):
+                    best, best_headroom = api_key, headroom
+            if best is None or best_headroom < 0:
+                raise NoKeyAvailable("All Gemini API keys are over quota or temporarily ejected")
+
+            entry = [now, estimated_tokens]
+            best._window.append(entry)
+            best.in_flight += 1
+            best._stats["requests_total"] += 1
+        return KeyLease(best, entry)
+
+    def release(self, lease, tokens_used=None, error=None):
+        """Settle a call: replace the token estimate with real usage, and eject the key on a 429"""
+        with self._lock:
+            self._release(lease, tokens_used, error)
+
+    def _release(self, lease, tokens_used, error):
+        api_key = lease.api_key
+        api_key.in_flight -= 1
+        if tokens_used is not None:
+            lease.entry[1] = tokens_used
+        api_key._stats["tokens_total"] += lease.entry[1]
+        if error is None:
+            api_key.consecutive_failures = 0
+            return
+        if not is_key_failure(error):
+            return
+        api_key._stats["failures_total"] += 1
+        if not is_quota_error(error):
+            return
+        now = time.monotonic()
+        if not any(other is not api_key and other.healthy(now) for other in self.keys):
+            # Ejecting the last healthy key would turn a 429 burst into a total outage
+            api_key._stats["ejections_skipped"] += 1
+            return
+        api_key.consecutive_failures += 1
+        cooldown = min(self.eject_max_seconds, self.eject_base_seconds * 2 ** (api_key.consecutive_failures - 1))
+        api_key.ejected_until = now + cooldown
+        api_key._stats["ejections_total"] += 1
+
+    def stats(self):
+        """Per-key utilisation of both quotas, health and totals"""
+        now = time.monotonic()
+        snapshot = {}
+        with self._lock:
+            for api_key in self.keys:
+                requests, tokens = api_key.usage(now)
+                snapshot[api_key.label] = dict(
+                    api_key._stats,
+                    in_flight=api_key.in_flight,
+                    requests_last_minute=requests,
+                    tokens_last_minute=tokens,
+                    rpm_utilisation=requests / api_key.rpm,
+                    tpm_utilisation=tokens / api_key.tpm,
+                    ejected=int(not api_key.healthy(now)),
+                    ejected_seconds_left=max(api_key.ejected_until - now, 0.0),
+                )
+        return snapshot
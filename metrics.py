@@ -0,0 +1,290 @@
+"""
+Prometheus metrics for the analyzer.
+
+Per-stage latency histograms are recorded by the pipeline with `stage()`,
+per-model latency and cascade outcomes with `observe_model` and
+`observe_cascade`, per-request memory with `observe_memory`; per-RPC
+latency, in-flight gauges, status codes and message sizes by the gRPC
+interceptors. Counters the pipeline components already keep (result cache,
+near-duplicate index, client pools, API keys, single-flight, preprocessing,
+admission control, hedging, prompt cache, research store, job queue,
+health) are read at scrape time by `PipelineCollector`.
+`start_metrics_server` serves all of it in Prometheus text format on a
+side port.
+"""
+import time
+from contextlib import contextmanager
+
+import grpc
+from prometheus_client import REGISTRY, Counter, Gauge, Histogram, start_http_server
+from prometheus_client.core import GaugeMetricFamily
+
+# Model stages take tens of seconds, local stages milliseconds; one bucket set covers both
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 45, 60, 120)
+SIZE_BUCKETS = tuple(4 ** exponent for exponent in range(4, 13))  # 256 B .. 16 MB
+
+STAGE_SECONDS = Histogram(
+    "analyzer_stage_seconds",
+    "Time spent in each analysis stage",
+    ["stage"],
+    buckets=LATENCY_BUCKETS,
+)
+RPC_SECONDS = Histogram(
+    "analyzer_rpc_seconds",
+    "End-to-end RPC handling time",
+    ["method"],
+    buckets=LATENCY_BUCKETS,
+)
+MODEL_SECONDS = Histogram(
+    "analyzer_model_seconds",
+    "Model call time per model (cascade tier)",
+    ["model"],
+    buckets=LATENCY_BUCKETS,
+)
+CASCADE_OUTCOMES = Counter(
+    "analyzer_cascade_outcomes",
+    "Answers per cascade tier: accepted, or the check that escalated them",
+    ["model", "outcome"],
+)
+REQUEST_MEMORY_BYTES = Histogram(
+    "analyzer_request_memory_bytes",
+    "Bytes held per request: source image, model payload, decoded bitmap and the estimated peak",
+    ["part"],
+    buckets=SIZE_BUCKETS + (64 * 1024 ** 2, 256 * 1024 ** 2),
+)
+RPC_IN_FLIGHT = Gauge("analyzer_rpc_in_flight", "RPCs currently being handled", ["method"])
+RPC_HANDLED = Counter("analyzer_rpc_handled", "Completed RPCs by gRPC status code", ["method", "code"])
+REQUEST_BYTES = Histogram("analyzer_request_bytes", "Serialized request size", ["method"], buckets=SIZE_BUCKETS)
+RESPONSE_BYTES = Histogram(
+    "analyzer_response_bytes",
+    "Serialized response size (summed over the stream for streaming RPCs)",
+    ["method"],
+    buckets=SIZE_BUCKETS,
+)
+
+
+@contextmanager
+def stage(name):
+    """Record the duration of the enclosed block under analyzer_stage_seconds{stage=name}"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(name).observe(time.perf_counter() - started)
+
+
+def observe_stage(name, seconds):
+    STAGE_SECONDS.labels(name).observe(seconds)
+
+
+def observe_model(model, seconds):
+    MODEL_SECONDS.labels(model).observe(seconds)
+
+
+def observe_cascade(model, outcome):
+    CASCADE_OUTCOMES.labels(model, outcome).inc()
+
+
+def observe_memory(part, size):
+    REQUEST_MEMORY_BYTES.labels(part).observe(size)
+
+
+# Health probes do no analysis work, and Watch streams stay open indefinitely
+_PROBE_METHODS = frozenset({"Check", "Watch", "HealthCheck"})
+
+
+def rpcs_in_flight():
+    """Analysis RPCs being handled right now, across all methods"""
+    return sum(
+        sample.value
+        for metric in RPC_IN_FLIGHT.collect()
+        for sample in metric.samples
+        if sample.labels["method"] not in _PROBE_METHODS
+    )
+
+
+class _RpcRecorder:
+    def __init__(self, method, request):
+        self.method = method
+        self.started = time.perf_counter()
+        self.response_bytes = 0
+        REQUEST_BYTES.labels(method).observe(request.ByteSize())
+        RPC_IN_FLIGHT.labels(method).inc()
+
+    def response(self, message):
+        self.response_bytes += message.ByteSize()
+
+    def finish(self, code):
+        RPC_IN_FLIGHT.labels(self.method).dec()
+        RPC_SECONDS.labels(self.method).observe(time.perf_counter() - self.started)
+        RPC_HANDLED.labels(self.method, code).inc()
+        RESPONSE_BYTES.labels(self.method).observe(self.response_bytes)
+
+
+def _status_name(context, error):
+    """Status the RPC ended with: whatever abort/set_code recorded, else OK or UNKNOWN"""
+    code = context.code()
+    if isinstance(code, grpc.StatusCode):
+        return code.name
+    if isinstance(code, int):
+        # grpc.aio reports the numeric code
+        for status in grpc.StatusCode:
+            if status.value[0] == code:
+                return status.name
+    if error is None:
+        return "OK"
+    return "CANCELLED" if isinstance(error, grpc.RpcError) else "UNKNOWN"
+
+
+def _method_name(handler_call_details):
+    return handler_call_details.method.rsplit("/", 1)[-1]
+
+
+class MetricsInterceptor(grpc.ServerInterceptor):
+    """Latency, in-flight, status code and message size metrics for the thread-pool server"""
+
+    def intercept_service(self, continuation, handler_call_details):
+        handler = continuation(handler_call_details)
+        if handler is None or handler.request_streaming:
+            return handler
+        method = _method_name(handler_call_details)
+
+        if handler.response_streaming:
+            def unary_stream(request, context):
+                recorder = _RpcRecorder(method, request)
+                error = None
+                try:
+                    for response in handler.unary_stream(request, context):
+                        recorder.response(response)
+                        yield response
+                except BaseException as e:
+                    error = e
+                    raise
+                finally:
+                    recorder.finish(_status_name(context, error))
+
+            return grpc.unary_stream_rpc_method_handler(
+                unary_stream, handler.request_deserializer, handler.response_serializer
+            )
+
+        def unary_unary(request, context):
+            recorder = _RpcRecorder(method, request)
+            error = None
+            try:
+                response = handler.unary_unary(request, context)
+                recorder.response(response)
+                return response
+            except BaseException as e:
+                error = e
+                raise
+            finally:
+                recorder.finish(_status_name(context, error))
+
+        return grpc.unary_unary_rpc_method_handler(
+            unary_unary, handler.request_deserializer, handler.response_serializer
+        )
+
+
+class AsyncMetricsInterceptor(grpc.aio.ServerInterceptor):
+    """Same metrics as MetricsInterceptor for the grpc.aio server"""
+
+    async def intercept_service(self, continuation, handler_call_details):
+        handler = await continuation(handler_call_details)
+        if handler is None or handler.request_streaming:
+            return handler
+        method = _method_name(handler_call_details)
+
+        if handler.response_streaming:
+            async def unary_stream(request, context):
+                recorder = _RpcRecorder(method, request)
+                error = None
+                try:
+                    async for response in handler.unary_stream(request, context):
+                        recorder.response(response)
+                        yield response
+                except BaseException as e:
+                    error = e
+                    raise
+                finally:
+                    recorder.finish(_status_name(context, error))
+
+            return grpc.unary_stream_rpc_method_handler(
+                unary_stream, handler.request_deserializer, handler.response_serializer
+            )
+
+        async def unary_unary(request, context):
+            recorder = _RpcRecorder(method, request)
+            error = None
+            try:
+                response = await handler.unary_unary(request, context)
+                recorder.response(response)
+                return response
+            except BaseException as e:
+                error = e
+                raise
+            finally:
+                recorder.finish(_status_name(context, error))
+
+        return grpc.unary_unary_rpc_method_handler(
+            unary_unary, handler.request_deserializer, handler.response_serializer
+        )
+
+
+class PipelineCollector:
+    """Exports the pipeline components' own counters at scrape time"""
+
+    def __init__(self, pipeline, jobs=None, health=None):
+        self.pipeline = pipeline
+        self.jobs = jobs
+        self.health = health
+
+    def collect(self):
+        components = {
+            "result_cache": self.pipeline.result_cache.stats(),
+            "near_duplicates": self.pipeline.near_duplicates.stats(),
+            "single_flight": self.pipeline.single_flight.stats(),
+            "preprocess": self.pipeline.preprocess_stats(),
+            "admission": self.pipeline.admission.stats(),
+            "hedging": self.pipeline.hedger.stats(),
+            "prompt_cache": self.pipeline.prompt_cache.stats(),
+            "research_store": self.pipeline.research_store.stats(),
+            "two_stage": self.pipeline.research_stats(),
+            "product_images": self.pipeline.product_stats(),
+        }
+        if self.jobs is not None:
+            components["jobs"] = self.jobs.stats()
+        if self.health is not None:
+            components["health"] = self.health.stats()
+        family = GaugeMetricFamily(
+            "analyzer_component_stat", "Counters and levels reported by pipeline components", labels=["component", "stat"]
+        )
+        for component, stats in components.items():
+            for stat, value in stats.items():
+                if isinstance(value, (int, float)):
+                    family.add_metric([component, stat], value)
+        yield family
+
+        pools = GaugeMetricFamily(
+            "analyzer_client_pool_stat", "Outbound connection pool usage", labels=["pool", "stat"]
+        )
+        for pool, stats in self.pipeline.clients.stats().items():
+            for stat, value in stats.items():
+                pools.add_metric([pool, stat], value)
+        yield pools
+
+        keys = GaugeMetricFamily(
+            "analyzer_api_key_stat", "Per-API-key quota utilisation, health and totals", labels=["key", "stat"]
+        )
+        for key, stats in self.pipeline.clients.keys.stats().items():
+            for stat, value in stats.items():
+                keys.add_metric([key, stat], value)
+        yield keys
+
+
+def start_metrics_server(port, pipeline=None, jobs=None, health=None):
+    """Serve /metrics on a side port; port 0 disables it"""
+    if port <= 0:
+        return
+    if pipeline is not None:
+        REGISTRY.register(PipelineCollector(pipeline, jobs, health))
+    start_http_server(port)
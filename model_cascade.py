@@ -0,0 +1,95 @@
+"""
+Tiered model cascade.
+
+Requests first go to a cheap, fast model with a small thinking budget. Its
+answer is checked against the constraints `create_prompt()` declares (a JSON
+object, a title of at most 60 characters, a Turkish description of 150-300
+words), and only answers that fail a check, or calls that error, are escalated
+to the next tier. The last tier, normally gemini-2.5-pro with dynamic
+thinking, is accepted as it is.
+"""
+import re
+from collections import namedtuple
+
+from google.genai import types
+
+from response_parser import ResponseParseError, parse_gemini_response
+
+TITLE_MAX_CHARS = 60
+DESCRIPTION_MIN_WORDS = 150
+DESCRIPTION_MAX_WORDS = 300
+CHECKS = ("json", "title", "length", "turkish")
+
+# Frequent Turkish function words; a description in another language hardly uses them
+_TURKISH_WORDS = frozenset(
+    "ve bir bu için ile da de çok daha olan olarak en gibi her veya ama kadar sayesinde ise hem".split()
+)
+_TURKISH_LETTERS = re.compile("[çğıöşüÇĞİÖŞÜ]")
+_WORD = re.compile(r"\w+")
+
+# thinking_budget -1 is dynamic thinking, 0 turns thinking off where the model allows it
+Tier = namedtuple("Tier", "model thinking_budget")
+
+
+def configure(config, tier):
+    """Copy of a request config with the tier's thinking budget"""
+    return config.model_copy(update={"thinking_config": types.ThinkingConfig(thinking_budget=tier.thinking_budget)})
+
+
+def parse_tiers(spec, default_model):
+    """
+    Parse "model[:thinking_budget],..." listed cheapest first; a missing budget means dynamic.
+    An empty spec is a single tier: the default model with dynamic thinking.
+    """
+    tiers = []
+    for entry in spec.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        model, _, budget = entry.partition(":")
+        tiers.append(Tier(model, int(budget) if budget else -1))
+    return tiers or [Tier(default_model, -1)]
+
+
+def answer_violations(text, checks=CHECKS):
+    """Parse an answer and list the checks it fails; a result of None means it could not be parsed"""
+    try:
+        result = parse_gemini_response(text, strict="json" in checks)
+    except ResponseParseError:
+        return None, ["json"]
+    violations = []
+    words = _WORD.findall(result["description"])
+    if "title" in checks and len(result["title"]) > TITLE_MAX_CHARS:
+        violations.append("title")
+    if "length" in checks and not DESCRIPTION_MIN_WORDS <= len(words) <= DESCRIPTION_MAX_WORDS:
+        violations.append("length")
+    if "turkish" in checks and not _looks_turkish(result["description"], words):
+        violations.append("turkish")
+    return result, violations
+
+
+def _looks_turkish(text, words):
+    if not _TURKISH_LETTERS.search(text):
+        return False
+    hits = sum(1 for word in words if word.lower() in _TURKISH_WORDS)
+    return hits >= max(3, len(words) // 50)
+
+
+class ModelCascade:
+    def __init__(self, tiers, checks=CHECKS):
+        self.tiers = tiers
+        self.checks = tuple(checks)
+
+    @property
+    def enabled(self):
+        return len(self.tiers) > 1
+
+    @property
+    def name(self):
+        """Identity for cache keys; a plain single tier is just the model name so existing entries stay valid"""
+        if not self.enabled and self.tiers[0].thinking_budget == -1:
+            return self.tiers[0].model
+        return ">".join(f"{tier.model}:{tier.thinking_budget}" for tier in self.tiers) + "|" + ",".join(self.checks)
+
+    def check(self, text):
+        return answer_violations(text, self.checks)
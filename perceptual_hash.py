@@ -0,0 +1,179 @@
+"""
+Perceptual fingerprints and near-duplicate lookup for product images.
+
+`dhash` reduces an image to a 64-bit difference hash that survives resizing,
+re-encoding and light cropping. `NearDuplicateIndex` answers "nearest stored
+fingerprint within Hamming distance k" with multi-index hashing: the hash is
+split into 16-bit chunks and, by the pigeonhole principle, any match within k
+differs from the query by at most k // chunks bits in at least one chunk, so
+only a handful of buckets have to be probed regardless of index size.
+"""
+import itertools
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+
+HASH_BITS = 64
+CHUNK_BITS = 16
+
+
+def dhash(image, hash_size=8):
+    """64-bit difference hash of a PIL image"""
+    small = image.convert("L").resize((hash_size + 1, hash_size), Image.Resampling.LANCZOS)
+    pixels = np.asarray(small, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def hamming_distance(a, b):
+    return (a ^ b).bit_count()
+
+
+class _MultiIndexHash:
+    """Hamming-space index over 64-bit hashes for a single cache scope"""
+
+    def __init__(self):
+        self._chunks = HASH_BITS // CHUNK_BITS
+        self._tables = [{} for _ in range(self._chunks)]  # chunk value -> set of hashes
+        self._values = OrderedDict()  # hash -> cache key, oldest first
+        self._hashes = {}  # cache key -> hash
+
+    def __len__(self):
+        return len(self._values)
+
+    def add(self, fingerprint, value):
+        # A key stored again with another hash, or a hash taken over by another key, drops the old pairing
+        if self._hashes.get(value, fingerprint) != fingerprint:
+            self.remove(value)
+        if fingerprint in self._values:
+            self._hashes.pop(self._values[fingerprint], None)
+            self._values.move_to_end(fingerprint)
+        else:
+            for table, part in zip(self._tables, self._split(fingerprint)):
+                table.setdefault(part, set()).add(fingerprint)
+        self._values[fingerprint] = value
+        self._hashes[value] = fingerprint
+
+    def remove(self, value):
+        """Forget the hash stored for a cache key; False if the key is not indexed"""
+        fingerprint = self._hashes.pop(value, None)
+        if fingerprint is None:
+            return False
+        del self._values[fingerprint]
+        self._unlink(fingerprint)
+        return True
+
+    def pop_oldest(self):
+        fingerprint, value = self._values.popitem(last=False)
+        del self._hashes[value]
+        self._unlink(fingerprint)
+
+    def candidates(self, fingerprint, max_distance):
+        """(cache key, distance) of every stored hash within max_distance, closest first"""
+        radius = max_distance // self._chunks
+        found = []
+        seen = set()
+        for table, part in zip(self._tables, self._split(fingerprint)):
+            for mask in _flip_masks(radius):
+                for candidate in table.get(part ^ mask, ()):
+                    if candidate in seen:
+                        continue
+                    seen.add(candidate)
+                    distance = hamming_distance(candidate, fingerprint)
+                    if distance <= max_distance:
+                        found.append((self._values[candidate], distance))
+        found.sort(key=lambda match: match[1])
+        return found
+
+    def _unlink(self, fingerprint):
+        for table, part in zip(self._tables, self._split(fingerprint)):
+            bucket = table[part]
+            bucket.discard(fingerprint)
+            if not bucket:
+                del table[part]
+
+    def _split(self, fingerprint):
+        mask = (1 << CHUNK_BITS) - 1
+        return [(fingerprint >> (i * CHUNK_BITS)) & mask for i in range(self._chunks)]
+
+
+_FLIP_MASKS = {}
+
+
+def _flip_masks(radius):
+    """All CHUNK_BITS-wide masks with at most `radius` bits set"""
+    masks = _FLIP_MASKS.get(radius)
+    if masks is None:
+        masks = [
+            sum(1 << bit for bit in bits)
+            for r in range(radius + 1)
+            for bits in itertools.combinations(range(CHUNK_BITS), r)
+        ]
+        _FLIP_MASKS[radius] = masks
+    return masks
+
+
+class NearDuplicateIndex:
+    """Maps perceptual fingerprints to result cache keys, partitioned by cache scope"""
+
+    def __init__(self, max_distance=6, max_entries=1_000_000):
+        self.max_distance = max_distance
+        self.max_entries = max_entries
+        self._indexes = {}
+        self._size = 0
+        self._lock = threading.Lock()
+        self._stats = {"lookups": 0, "hits": 0, "stale": 0}
+
+    @property
+    def enabled(self):
+        return self.max_distance >= 0
+
+    def add(self, fingerprint, cache_key, scope):
+        if not self.enabled:
+            return
+        with self._lock:
+            index = self._indexes.setdefault(scope, _MultiIndexHash())
+            before = len(index)
+            index.add(fingerprint, cache_key)
+            self._size += len(index) - before
+            while self._size > self.max_entries:
+                largest = max(self._indexes.values(), key=len)
+                largest.pop_oldest()
+                self._size -= 1
+
+    def remove(self, cache_key, scope):
+        """Forget a cache key, e.g. once the result cache has dropped its entry"""
+        with self._lock:
+            index = self._indexes.get(scope)
+            if index is not None and index.remove(cache_key):
+                self._size -= 1
+
+    def lookup(self, fingerprint, scope, resolve):
+        """
+        Return (cache_key, distance, value) of the closest stored image in scope for which
+        resolve(cache_key) returns a value, or None. Keys that no longer resolve are forgotten
+        and the next closest match is tried.
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            self._stats["lookups"] += 1
+            index = self._indexes.get(scope)
+            matches = index.candidates(fingerprint, self.max_distance) if index else []
+        # resolve runs outside the lock: it reads the result cache, whose evictions call remove()
+        for cache_key, distance in matches:
+            value = resolve(cache_key)
+            if value is not None:
+                with self._lock:
+                    self._stats["hits"] += 1
+                return cache_key, distance, value
+            self.remove(cache_key, scope)
+            with self._lock:
+                self._stats["stale"] += 1
+        return None
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, entries=self._size)
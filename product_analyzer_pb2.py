@@ -14,23 +14,49 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x16product_analyzer.proto\x12\x0fproductanalyzer\"E\n\x0cImageRequest\x12\r\n\x05image\x18\x01 \x01(\x0c\x12\x10\n\x08\x66ilename\x18\x02 \x01(\t\x12\x14\n\x0c\x63ontent_type\x18\x03 \x01(\t\"$\n\x0fImageUrlRequest\x12\x11\n\timage_url\x18\x01 \x01(\t\"H\n\rImageResponse\x12\r\n\x05title\x18\x01 \x01(\t\x12\x13\n\x0b\x64\x65scription\x18\x02 \x01(\t\x12\x13\n\x0bsearch_info\x18\x03 \x01(\t\"\x14\n\x12HealthCheckRequest\"6\n\x13HealthCheckResponse\x12\x0e\n\x06status\x18\x01 \x01(\t\x12\x0f\n\x07service\x18\x02 \x01(\t2\x99\x02\n\x0fProductAnalyzer\x12R\n\x11GenerateFromImage\x12\x1d.productanalyzer.ImageRequest\x1a\x1e.productanalyzer.ImageResponse\x12X\n\x14GenerateFromImageUrl\x12 .productanalyzer.ImageUrlRequest\x1a\x1e.productanalyzer.ImageResponse\x12X\n\x0bHealthCheck\x12#.productanalyzer.HealthCheckRequest\x1a$.productanalyzer.HealthCheckResponseb\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x16product_analyzer.proto\x12\x0fproductanalyzer\"E\n\x0cImageRequest\x12\r\n\x05image\x18\x01 \x01(\x0c\x12\x10\n\x08\x66ilename\x18\x02 \x01(\t\x12\x14\n\x0c\x63ontent_type\x18\x03 \x01(\t\"$\n\x0fImageUrlRequest\x12\x11\n\timage_url\x18\x01 \x01(\t\"H\n\rImageResponse\x12\r\n\x05title\x18\x01 \x01(\t\x12\x13\n\x0b\x64\x65scription\x18\x02 \x01(\t\x12\x13\n\x0bsearch_info\x18\x03 \x01(\t\"\x81\x01\n\x0e\x42\x61tchImageItem\x12.\n\x05image\x18\x01 \x01(\x0b\x32\x1d.productanalyzer.ImageRequestH\x00\x12\x35\n\timage_url\x18\x02 \x01(\x0b\x32 .productanalyzer.ImageUrlRequestH\x00\x42\x08\n\x06source\"C\n\x11\x42\x61tchImageRequest\x12.\n\x05items\x18\x01 \x03(\x0b\x32\x1f.productanalyzer.BatchImageItem\"G\n\x14ProductImagesRequest\x12/\n\x06images\x18\x01 \x03(\x0b\x32\x1f.productanalyzer.BatchImageItem\"/\n\x0e\x42\x61tchItemError\x12\x0c\n\x04\x63ode\x18\x01 \x01(\x05\x12\x0f\n\x07message\x18\x02 \x01(\t\"\x91\x01\n\x10\x42\x61tchImageResult\x12\r\n\x05index\x18\x01 \x01(\x05\x12\x32\n\x08response\x18\x02 \x01(\x0b\x32\x1e.productanalyzer.ImageResponseH\x00\x12\x30\n\x05\x65rror\x18\x03 \x01(\x0b\x32\x1f.productanalyzer.BatchItemErrorH\x00\x42\x08\n\x06result\")\n\nFieldValue\x12\x0c\n\x04name\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\t\"\x8e\x01\n\rAnalysisEvent\x12\x14\n\ntext_delta\x18\x01 \x01(\tH\x00\x12,\n\x05\x66ield\x18\x02 \x01(\x0b\x32\x1b.productanalyzer.FieldValueH\x00\x12\x30\n\x06result\x18\x03 \x01(\x0b\x32\x1e.productanalyzer.ImageResponseH\x00\x42\x07\n\x05\x65vent\"_\n\x15SubmitAnalysisRequest\x12-\n\x04item\x18\x01 \x01(\x0b\x32\x1f.productanalyzer.BatchImageItem\x12\x17\n\x0fidempotency_key\x18\x02 \x01(\t\"\xfc\x01\n\x0b\x41nalysisJob\x12\x0e\n\x06job_id\x18\x01 \x01(\t\x12(\n\x05state\x18\x02 \x01(\x0e\x32\x19.productanalyzer.JobState\x12\x10\n\x08\x61ttempts\x18\x03 \x01(\x05\x12\x30\n\x08response\x18\x04 \x01(\x0b\x32\x1e.productanalyzer.ImageResponse\x12.\n\x05\x65rror\x18\x05 \x01(\x0b\x32\x1f.productanalyzer.BatchItemError\x12\x12\n\ncreated_at\x18\x06 \x01(\x01\x12\x12\n\nupdated_at\x18\x07 \x01(\x01\x12\x17\n\x0fidempotency_key\x18\x08 \x01(\t\"$\n\x12GetAnalysisRequest\x12\x0e\n\x06job_id\x18\x01 \x01(\t\"f\n\x13ListAnalysesRequest\x12(\n\x05state\x18\x01 \x01(\x0e\x32\x19.productanalyzer.JobState\x12\x11\n\tpage_size\x18\x02 \x01(\x05\x12\x12\n\npage_token\x18\x03 \x01(\t\"[\n\x14ListAnalysesResponse\x12*\n\x04jobs\x18\x01 \x03(\x0b\x32\x1c.productanalyzer.AnalysisJob\x12\x17\n\x0fnext_page_token\x18\x02 \x01(\t\"\x14\n\x12HealthCheckRequest\"6\n\x13HealthCheckResponse\x12\x0e\n\x06status\x18\x01 \x01(\t\x12\x0f\n\x07service\x18\x02 \x01(\t*\x81\x01\n\x08JobState\x12\x19\n\x15JOB_STATE_UNSPECIFIED\x10\x00\x12\x14\n\x10JOB_STATE_QUEUED\x10\x01\x12\x15\n\x11JOB_STATE_RUNNING\x10\x02\x12\x17\n\x13JOB_STATE_SUCCEEDED\x10\x03\x12\x14\n\x10JOB_STATE_FAILED\x10\x04\x32\xbf\x06\n\x0fProductAnalyzer\x12R\n\x11GenerateFromImage\x12\x1d.productanalyzer.ImageRequest\x1a\x1e.productanalyzer.ImageResponse\x12X\n\x14GenerateFromImageUrl\x12 .productanalyzer.ImageUrlRequest\x1a\x1e.productanalyzer.ImageResponse\x12]\n\x12GenerateFromImages\x12\".productanalyzer.BatchImageRequest\x1a!.productanalyzer.BatchImageResult0\x01\x12\x62\n\x19GenerateFromProductImages\x12%.productanalyzer.ProductImagesRequest\x1a\x1e.productanalyzer.ImageResponse\x12Z\n\x17GenerateFromImageStream\x12\x1d.productanalyzer.ImageRequest\x1a\x1e.productanalyzer.AnalysisEvent0\x01\x12V\n\x0eSubmitAnalysis\x12&.productanalyzer.SubmitAnalysisRequest\x1a\x1c.productanalyzer.AnalysisJob\x12P\n\x0bGetAnalysis\x12#.productanalyzer.GetAnalysisRequest\x1a\x1c.productanalyzer.AnalysisJob\x12[\n\x0cListAnalyses\x12$.productanalyzer.ListAnalysesRequest\x1a%.productanalyzer.ListAnalysesResponse\x12X\n\x0bHealthCheck\x12#.productanalyzer.HealthCheckRequest\x1a$.productanalyzer.HealthCheckResponseb\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
 _builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'product_analyzer_pb2', _globals)
 if _descriptor._USE_C_DESCRIPTORS == False:
   DESCRIPTOR._options = None
+  _globals['_JOBSTATE']._serialized_start=1551
+  _globals['_JOBSTATE']._serialized_end=1680
   _globals['_IMAGEREQUEST']._serialized_start=43
   _globals['_IMAGEREQUEST']._serialized_end=112
   _globals['_IMAGEURLREQUEST']._serialized_start=114
   _globals['_IMAGEURLREQUEST']._serialized_end=150
   _globals['_IMAGERESPONSE']._serialized_start=152
   _globals['_IMAGERESPONSE']._serialized_end=224
-  _globals['_HEALTHCHECKREQUEST']._serialized_start=226
-  _globals['_HEALTHCHECKREQUEST']._serialized_end=246
-  _globals['_HEALTHCHECKRESPONSE']._serialized_start=248
-  _globals['_HEALTHCHECKRESPONSE']._serialized_end=302
-  _globals['_PRODUCTANALYZER']._serialized_start=305
-  _globals['_PRODUCTANALYZER']._serialized_end=586
+  _globals['_BATCHIMAGEITEM']._serialized_start=227
+  _globals['_BATCHIMAGEITEM']._serialized_end=356
+  _globals['_BATCHIMAGEREQUEST']._serialized_start=358
+  _globals['_BATCHIMAGEREQUEST']._serialized_end=425
+  _globals['_PRODUCTIMAGESREQUEST']._serialized_start=427
+  _globals['_PRODUCTIMAGESREQUEST']._serialized_end=498
+  _globals['_BATCHITEMERROR']._serialized_start=500
+  _globals['_BATCHITEMERROR']._serialized_end=547
+  _globals['_BATCHIMAGERESULT']._serialized_start=550
+  _globals['_BATCHIMAGERESULT']._serialized_end=695
+  _globals['_FIELDVALUE']._serialized_start=697
+  _globals['_FIELDVALUE']._serialized_end=738
+  _globals['_ANALYSISEVENT']._serialized_start=741
+  _globals['_ANALYSISEVENT']._serialized_end=883
+  _globals['_SUBMITANALYSISREQUEST']._serialized_start=885
+  _globals['_SUBMITANALYSISREQUEST']._serialized_end=980
+  _globals['_ANALYSISJOB']._serialized_start=983
+  _globals['_ANALYSISJOB']._serialized_end=1235
+  _globals['_GETANALYSISREQUEST']._serialized_start=1237
+  _globals['_GETANALYSISREQUEST']._serialized_end=1273
+  _globals['_LISTANALYSESREQUEST']._serialized_start=1275
+  _globals['_LISTANALYSESREQUEST']._serialized_end=1377
+  _globals['_LISTANALYSESRESPONSE']._serialized_start=1379
+  _globals['_LISTANALYSESRESPONSE']._serialized_end=1470
+  _globals['_HEALTHCHECKREQUEST']._serialized_start=1472
+  _globals['_HEALTHCHECKREQUEST']._serialized_end=1492
+  _globals['_HEALTHCHECKRESPONSE']._serialized_start=1494
+  _globals['_HEALTHCHECKRESPONSE']._serialized_end=1548
+  _globals['_PRODUCTANALYZER']._serialized_start=1683
+  _globals['_PRODUCTANALYZER']._serialized_end=2514
 # @@protoc_insertion_point(module_scope)
@@ -24,6 +24,36 @@ class ProductAnalyzerStub(object):
                 request_serializer=product__analyzer__pb2.ImageUrlRequest.SerializeToString,
                 response_deserializer=product__analyzer__pb2.ImageResponse.FromString,
                 )
+        self.GenerateFromImages = channel.unary_stream(
+                '/productanalyzer.ProductAnalyzer/GenerateFromImages',
+                request_serializer=product__analyzer__pb2.BatchImageRequest.SerializeToString,
+                response_deserializer=product__analyzer__pb2.BatchImageResult.FromString,
+                )
+        self.GenerateFromProductImages = channel.unary_unary(
+                '/productanalyzer.ProductAnalyzer/GenerateFromProductImages',
+                request_serializer=product__analyzer__pb2.ProductImagesRequest.SerializeToString,
+                response_deserializer=product__analyzer__pb2.ImageResponse.FromString,
+                )
+        self.GenerateFromImageStream = channel.unary_stream(
+                '/productanalyzer.ProductAnalyzer/GenerateFromImageStream',
+                request_serializer=product__analyzer__pb2.ImageRequest.SerializeToString,
+                response_deserializer=product__analyzer__pb2.AnalysisEvent.FromString,
+                )
+        self.SubmitAnalysis = channel.unary_unary(
+                '/productanalyzer.ProductAnalyzer/SubmitAnalysis',
+                request_serializer=product__analyzer__pb2.SubmitAnalysisRequest.SerializeToString,
+                response_deserializer=product__analyzer__pb2.AnalysisJob.FromString,
+                )
+        self.GetAnalysis = channel.unary_unary(
+                '/productanalyzer.ProductAnalyzer/GetAnalysis',
+                request_serializer=product__analyzer__pb2.GetAnalysisRequest.SerializeToString,
+                response_deserializer=product__analyzer__pb2.AnalysisJob.FromString,
+                )
+        self.ListAnalyses = channel.unary_unary(
+                '/productanalyzer.ProductAnalyzer/ListAnalyses',
+                request_serializer=product__analyzer__pb2.ListAnalysesRequest.SerializeToString,
+                response_deserializer=product__analyzer__pb2.ListAnalysesResponse.FromString,
+                )
         self.HealthCheck = channel.unary_unary(
                 '/productanalyzer.ProductAnalyzer/HealthCheck',
                 request_serializer=product__analyzer__pb2.HealthCheckRequest.SerializeToString,
@@ -46,6 +76,47 @@ class ProductAnalyzerServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def GenerateFromImages(self, request, context):
+        """Analyses many images in one call; results stream back as each item completes
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def GenerateFromProductImages(self, request, context):
+        """Analyses several photos of one product in a single model call; returns one title and description
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def GenerateFromImageStream(self, request, context):
+        """Forwards model output as it arrives; the final event carries the parsed result
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def SubmitAnalysis(self, request, context):
+        """Queues an analysis and returns at once; the job survives server restarts
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def GetAnalysis(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def ListAnalyses(self, request, context):
+        """Jobs in submission order, optionally filtered by state
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
     def HealthCheck(self, request, context):
         """Missing associated documentation comment in .proto file."""
         context.set_code(grpc.StatusCode.UNIMPLEMENTED)
@@ -65,6 +136,36 @@ def add_ProductAnalyzerServicer_to_server(servicer, server):
                     request_deserializer=product__analyzer__pb2.ImageUrlRequest.FromString,
                     response_serializer=product__analyzer__pb2.ImageResponse.SerializeToString,
             ),
+            'GenerateFromImages': grpc.unary_stream_rpc_method_handler(
+                    servicer.GenerateFromImages,
+                    request_deserializer=product__analyzer__pb2.BatchImageRequest.FromString,
+                    response_serializer=product__analyzer__pb2.BatchImageResult.SerializeToString,
+            ),
+            'GenerateFromProductImages': grpc.unary_unary_rpc_method_handler(
+                    servicer.GenerateFromProductImages,
+                    request_deserializer=product__analyzer__pb2.ProductImagesRequest.FromString,
+                    response_serializer=product__analyzer__pb2.ImageResponse.SerializeToString,
+            ),
+            'GenerateFromImageStream': grpc.unary_stream_rpc_method_handler(
+                    servicer.GenerateFromImageStream,
+                    request_deserializer=product__analyzer__pb2.ImageRequest.FromString,
+                    response_serializer=product__analyzer__pb2.AnalysisEvent.SerializeToString,
+            ),
+            'SubmitAnalysis': grpc.unary_unary_rpc_method_handler(
+                    servicer.SubmitAnalysis,
+                    request_deserializer=product__analyzer__pb2.SubmitAnalysisRequest.FromString,
+                    response_serializer=product__analyzer__pb2.AnalysisJob.SerializeToString,
+            ),
+            'GetAnalysis': grpc.unary_unary_rpc_method_handler(
+                    servicer.GetAnalysis,
+                    request_deserializer=product__analyzer__pb2.GetAnalysisRequest.FromString,
+                    response_serializer=product__analyzer__pb2.AnalysisJob.SerializeToString,
+            ),
+            'ListAnalyses': grpc.unary_unary_rpc_method_handler(
+                    servicer.ListAnalyses,
+                    request_deserializer=product__analyzer__pb2.ListAnalysesRequest.FromString,
+                    response_serializer=product__analyzer__pb2.ListAnalysesResponse.SerializeToString,
+            ),
             'HealthCheck': grpc.unary_unary_rpc_method_handler(
                     servicer.HealthCheck,
                     request_deserializer=product__analyzer__pb2.HealthCheckRequest.FromString,
@@ -114,6 +215,108 @@ class ProductAnalyzer(object):
             options, channel_credentials,
             insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
 
+    @staticmethod
+    def GenerateFromImages(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_stream(request, target, '/productanalyzer.ProductAnalyzer/GenerateFromImages',
+            product__analyzer__pb2.BatchImageRequest.SerializeToString,
+            product__analyzer__pb2.BatchImageResult.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def GenerateFromProductImages(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(request, target, '/productanalyzer.ProductAnalyzer/GenerateFromProductImages',
+            product__analyzer__pb2.ProductImagesRequest.SerializeToString,
+            product__analyzer__pb2.ImageResponse.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def GenerateFromImageStream(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_stream(request, target, '/productanalyzer.ProductAnalyzer/GenerateFromImageStream',
+            product__analyzer__pb2.ImageRequest.SerializeToString,
+            product__analyzer__pb2.AnalysisEvent.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def SubmitAnalysis(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(request, target, '/productanalyzer.ProductAnalyzer/SubmitAnalysis',
+            product__analyzer__pb2.SubmitAnalysisRequest.SerializeToString,
+            product__analyzer__pb2.AnalysisJob.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def GetAnalysis(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(request, target, '/productanalyzer.ProductAnalyzer/GetAnalysis',
+            product__analyzer__pb2.GetAnalysisRequest.SerializeToString,
+            product__analyzer__pb2.AnalysisJob.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def ListAnalyses(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(request, target, '/productanalyzer.ProductAnalyzer/ListAnalyses',
+            product__analyzer__pb2.ListAnalysesRequest.SerializeToString,
+            product__analyzer__pb2.ListAnalysesResponse.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
     @staticmethod
     def HealthCheck(request,
             target,
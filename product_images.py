@@ -0,0 +1,54 @@
+"""
+Budgeting several photos of one product into a single model request.
+
+Gemini bills an image by 768 px tiles (258 tokens each; an image that fits in
+384 px on both sides is a single 258-token tile), so a handful of full-size
+angles and label close-ups quickly costs more than the prompt itself. The
+photos are deduplicated and every one is downscaled to the same maximum edge,
+the largest tile-aligned edge whose token estimate fits the budget; the
+request then stays one model round trip however many photos a product has.
+"""
+import math
+
+from perceptual_hash import hamming_distance
+
+TILE_EDGE = 768
+SMALL_EDGE = 384
+TOKENS_PER_TILE = 258
+
+
+def scaled_size(width, height, max_edge):
+    """Size after a downscale to max_edge, as Image.thumbnail computes it"""
+    if max(width, height) <= max_edge:
+        return width, height
+    scale = max_edge / max(width, height)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def image_tokens(width, height):
+    """Input tokens the model is billed for one image of this size"""
+    if max(width, height) <= SMALL_EDGE:
+        return TOKENS_PER_TILE
+    return math.ceil(width / TILE_EDGE) * math.ceil(height / TILE_EDGE) * TOKENS_PER_TILE
+
+
+def choose_max_edge(sizes, max_tokens, max_edge):
+    """
+    Largest edge, from max_edge down through the tile boundaries to 384 px, at which
+    images of the given (width, height) sizes fit in max_tokens. Below 384 px every
+    image costs the same, so the smallest step is returned when nothing fits.
+    """
+    edges = [max_edge] + [edge for edge in (4 * TILE_EDGE, 3 * TILE_EDGE, 2 * TILE_EDGE, TILE_EDGE) if edge < max_edge]
+    for edge in edges:
+        if sum(image_tokens(*scaled_size(width, height, edge)) for width, height in sizes) <= max_tokens:
+            return edge
+    return min(max_edge, SMALL_EDGE)
+
+
+def distinct_images(fingerprints, max_distance):
+    """Indices of the images to keep: the first of every group within max_distance of each other"""
+    kept = []
+    for index, fingerprint in enumerate(fingerprints):
+        if max_distance < 0 or all(hamming_distance(fingerprint, fingerprints[other]) > max_distance for other in kept):
+            kept.append(index)
+    return kept
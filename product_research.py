@@ -0,0 +1,168 @@
+"""
+Two-stage analysis: product identification and cached market research.
+
+A cheap call without search identifies the product in the image (brand,
+model, category) and describes what it sees. Market research, the slow
+search-grounded part, is then done once per normalized product identity and
+kept for the prompt's 12-month freshness window, so popular products skip the
+search call entirely. Only a brand or model makes an identity specific enough
+to share research; an unbranded product known only by its category goes
+through the single search-grounded call instead. The final title and description are written from the
+observations plus the research.
+"""
+import hashlib
+import json
+import re
+import unicodedata
+from collections import namedtuple
+
+from response_parser import find_json_object
+
+IDENTIFY_PROMPT = """
+<prompt>
+  <role>Bir e-ticaret ürün uzmanısın. Görseldeki ürünü tanımla; web araması yapma.</role>
+
+  <rules>
+    <rule>Marka ve modeli yalnızca görselde görebiliyor ya da okuyabiliyorsan yaz; tahmin etme, emin değilsen boş bırak.</rule>
+    <rule>Kategori kısa ve genel olsun (ör. "paslanmaz çelik termos", "kablosuz kulaklık").</rule>
+    <rule>Gözlemler yalnızca görselde görülenleri içersin: malzeme, renk, form, boyut izlenimi, ayırt edici detaylar.</rule>
+    <rule>Çıktıyı yalnızca belirtilen JSON formatında üret.</rule>
+  </rules>
+
+  <json_template><![CDATA[
+{
+  "brand": "Marka veya boş",
+  "model": "Model/seri adı ya da numarası veya boş",
+  "category": "Kısa ürün kategorisi",
+  "observations": "Görselde gözlemlenen özellikler (Türkçe, 3-5 cümle)"
+}
+  ]]></json_template>
+</prompt>
+"""
+
+RESEARCH_PROMPT = """
+<prompt>
+  <role>Bir pazar araştırmacısısın. Bu istemin ardından product etiketiyle verilen ürün için güncel pazar bilgilerini topla.</role>
+
+  <web_search required="true">
+    <must_include>Fiyat aralıkları; en az 3 benzer ürünün marka/modeli, fiyatı ve öne çıkan özellikleri; temel teknik özellikler; trendler ve talep/yorum içgörüleri; en az 3 kaynak URL.</must_include>
+    <freshness>Güncel bilgiye öncelik ver (son 12 ay).</freshness>
+    <disclaimer>Varsayım yapma; belirsizse "bilgi yetersiz" de. Mümkünse bölge/para birimini belirt.</disclaimer>
+  </web_search>
+
+  <json_template><![CDATA[
+{
+  "search_info": "Web aramasından elde edilen özet bulgular + kısa kaynak listesi (URL'lerle)."
+}
+  ]]></json_template>
+  <rule>Çıktıyı yalnızca belirtilen JSON formatında üret; JSON dışına çıkma.</rule>
+</prompt>
+"""
+
+COMPOSE_PROMPT = """
+<prompt>
+  <role>Bir e-ticaret içerik uzmanısın. Amacın, aşağıda verilen görsel gözlemleri ve pazar araştırmasını kullanarak SEO uyumlu, profesyonel ve satışa yönelik bir ürün tanıtımı hazırlamak. Web araması yapma; araştırma sana verildi.</role>
+
+  <output>
+    <format>JSON</format>
+    <constraints>
+      <title max_chars="60"/>
+      <description word_count_min="150" word_count_max="300"/>
+      <language>Turkish</language>
+      <return_only_json>true</return_only_json>
+    </constraints>
+    <json_template><![CDATA[
+{
+  "title": "SEO uyumlu ürün başlığı (en fazla 60 karakter)",
+  "description": "150-300 kelime: görsel özellikler, kullanım alanları, hedef kitle ve pazar araştırmasındaki güncel bulgularla desteklenen, profesyonel ve ikna edici açıklama. Doğal SEO anahtar kelimeleri kullan."
+}
+    ]]></json_template>
+  </output>
+
+  <style>
+    <tone>Profesyonel, ikna edici, satış odaklı</tone>
+    <seo>Doğal anahtar kelimeler; başlıkta birincil anahtar kelime; açıklamada semantik varyasyonlar</seo>
+  </style>
+
+  <rules>
+    <rule>Gözlemlerdeki özellikleri (malzeme, tasarım, renk, boyut izlenimi) açıkça belirt.</rule>
+    <rule>Pazar araştırmasındaki güncel bilgileri açıklamaya entegre et; araştırmada olmayan bilgi uydurma.</rule>
+    <rule>Kullanım alanlarını ve hedef kitleyi netleştir.</rule>
+    <rule>Çıktıyı yalnızca belirtilen JSON formatında üret; JSON dışına çıkma.</rule>
+  </rules>
+</prompt>
+"""
+
+# Changing a prompt invalidates the research and results produced with it
+RESEARCH_VERSION = hashlib.sha256((IDENTIFY_PROMPT + RESEARCH_PROMPT).encode("utf-8")).hexdigest()[:12]
+TWO_STAGE_VERSION = hashlib.sha256((RESEARCH_VERSION + COMPOSE_PROMPT).encode("utf-8")).hexdigest()[:12]
+
+# Answers the model gives for "not visible"
+_UNKNOWN = frozenset({"", "-", "yok", "bilinmiyor", "belirsiz", "bilgi yetersiz", "unknown", "n/a", "none", "null"})
+_NOT_WORD = re.compile(r"[^\w]+")
+
+ProductIdentity = namedtuple("ProductIdentity", "brand model category observations")
+
+
+def normalize(value):
+    """Casefolded, accent-insensitive form of a name with punctuation and spacing collapsed"""
+    value = unicodedata.normalize("NFKD", str(value or "").casefold())
+    value = "".join(char for char in value if not unicodedata.combining(char))
+    # Dotless ı has no decomposition; "KULAKLIK" casefolds to "kulaklik", so fold it the same way
+    value = value.replace("ı", "i")
+    value = _NOT_WORD.sub(" ", value).strip()
+    return "" if value in _UNKNOWN else value
+
+
+def parse_identity(text):
+    """
+    ProductIdentity from the identification answer, or None unless the category and a
+    brand or model are known: every unbranded product of a category would otherwise
+    share one research entry (prices, competitors) for the store's whole TTL.
+    """
+    value = find_json_object(text, ("category",))
+    if value is None:
+        return None
+    identity = ProductIdentity(*(str(value.get(field) or "").strip() for field in ProductIdentity._fields))
+    if not normalize(identity.category):
+        return None
+    if not normalize(identity.brand) and not normalize(identity.model):
+        return None
+    return identity
+
+
+def identity_key(identity):
+    """Research store key: products that differ only in spelling or case share their research"""
+    parts = (normalize(identity.brand), normalize(identity.model), normalize(identity.category))
+    return f"research:{RESEARCH_VERSION}:" + "|".join(parts)
+
+
+def research_request(identity):
+    """Per-request part of the research call; RESEARCH_PROMPT is the static part"""
+    return f"<product>{_product_name(identity)}</product>"
+
+
+def parse_research(text):
+    """Research dict with non-empty search_info, or None"""
+    value = find_json_object(text, ("search_info",))
+    if value is None or not value["search_info"]:
+        return None
+    search_info = value["search_info"]
+    if not isinstance(search_info, str):
+        # Sometimes comes back as a list of sources
+        search_info = json.dumps(search_info, ensure_ascii=False)
+    return {"search_info": search_info.strip()}
+
+
+def compose_request(identity, research):
+    """Per-request part of the compose call; COMPOSE_PROMPT is the static part"""
+    return (
+        f"<product>{_product_name(identity)}</product>\n"
+        f"<observations>{identity.observations}</observations>\n"
+        f"<market_research>{research['search_info']}</market_research>"
+    )
+
+
+def _product_name(identity):
+    known = [part for part in (identity.brand, identity.model) if normalize(part)]
+    return " ".join(known + [identity.category])
@@ -0,0 +1,125 @@
+"""
+Model-side caching of the static prompt.
+
+With Gemini's cached-content feature a request template's static prompt,
+together with its tools (the API requires them to live in the cache), is
+uploaded once per API key and model; each request then sends only its own
+parts, such as the image. Entries
+are refreshed in the background before they expire. Where caching fails, for
+example because the prompt is below the model's minimum cacheable size, the
+prompt is sent inline and caching is retried after a back-off.
+"""
+import asyncio
+import logging
+import time
+
+from google.genai import types
+
+logger = logging.getLogger(__name__)
+
+# Entries this close to expiry are not handed out any more
+EXPIRY_MARGIN_SECONDS = 30.0
+
+
+def is_cache_error(error):
+    """The request named cached content the API no longer has (expired, deleted or on another project)"""
+    code = getattr(error, "code", None)
+    if code in (403, 404):
+        return True
+    message = str(error).lower()
+    return "cachedcontent" in message.replace(" ", "") or "cached content" in message
+
+
+class CachedPrompt:
+    def __init__(self, name, config, expires_at):
+        self.name = name
+        self.config = config
+        self.expires_at = expires_at
+
+
+class PromptCache:
+    def __init__(self, display_name, enabled=False, ttl_seconds=3600, refresh_seconds=300, retry_seconds=600):
+        self.display_name = display_name
+        self.enabled = enabled
+        self.ttl_seconds = ttl_seconds
+        self.refresh_seconds = refresh_seconds
+        self.retry_seconds = retry_seconds
+        self._entries = {}  # (key label, model, template name, tier index) -> CachedPrompt
+        self._failed_until = {}
+        self._locks = {}
+        self._refreshing = {}
+        self._stats = {"hits": 0, "misses": 0, "creates": 0, "refreshes": 0, "failures": 0, "invalidations": 0}
+
+    async def lookup(self, api_key, model, template, tier_index):
+        """
+        Request config that points at the cached prompt, or None to send the prompt inline.
+        Creates the cache entry on first use and starts a refresh when it is close to expiry.
+        """
+        if not self.enabled:
+            return None
+        slot = (api_key.label, model, template.name, tier_index)
+        now = time.monotonic()
+        entry = self._entries.get(slot)
+        if entry is None or entry.expires_at - now <= EXPIRY_MARGIN_SECONDS:
+            entry = await self._create(api_key, model, template, tier_index, slot)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+        elif entry.expires_at - now <= self.refresh_seconds and slot not in self._refreshing:
+            self._refreshing[slot] = asyncio.ensure_future(self._refresh(api_key.client, slot, entry))
+        self._stats["hits"] += 1
+        return entry.config
+
+    def invalidate(self, api_key, model, template, tier_index):
+        """Forget an entry the API no longer accepts; the next request recreates it"""
+        if self._entries.pop((api_key.label, model, template.name, tier_index), None) is not None:
+            self._stats["invalidations"] += 1
+
+    def stats(self):
+        return dict(self._stats, entries=len(self._entries))
+
+    async def _create(self, api_key, model, template, tier_index, slot):
+        lock = self._locks.setdefault(slot, asyncio.Lock())
+        # One request creates the entry; the others wait for it instead of uploading the prompt again
+        async with lock:
+            now = time.monotonic()
+            entry = self._entries.get(slot)
+            if entry is not None and entry.expires_at - now > EXPIRY_MARGIN_SECONDS:
+                return entry
+            if self._failed_until.get(slot, 0.0) > now:
+                return None
+            try:
+                cached = await api_key.client.aio.caches.create(
+                    model=model,
+                    config=types.CreateCachedContentConfig(
+                        contents=[types.Content(role="user", parts=[template.prompt_part])],
+                        tools=template.tools,
+                        ttl=f"{self.ttl_seconds}s",
+                        display_name=f"{self.display_name}-{template.name}",
+                    ),
+                )
+            except Exception as e:
+                self._stats["failures"] += 1
+                self._failed_until[slot] = time.monotonic() + self.retry_seconds
+                logger.warning("Could not cache the prompt for %s on %s, sending it inline: %s", model, api_key.label, e)
+                return None
+            config = template.configs[tier_index].model_copy(update={"tools": None, "cached_content": cached.name})
+            entry = CachedPrompt(cached.name, config, now + self.ttl_seconds)
+            self._entries[slot] = entry
+            self._stats["creates"] += 1
+            return entry
+
+    async def _refresh(self, client, slot, entry):
+        started = time.monotonic()
+        try:
+            await client.aio.caches.update(
+                name=entry.name, config=types.UpdateCachedContentConfig(ttl=f"{self.ttl_seconds}s")
+            )
+            entry.expires_at = started + self.ttl_seconds
+            self._stats["refreshes"] += 1
+        except Exception as e:
+            # The entry is recreated once it expires
+            self._stats["failures"] += 1
+            logger.warning("Could not refresh cached prompt %s: %s", entry.name, e)
+        finally:
+            del self._refreshing[slot]
@@ -0,0 +1,201 @@
+"""
+Parsing helpers for Gemini's JSON answers.
+"""
+import json
+import re
+
+FIELDS = ("title", "description", "search_info")
+# A failed decode can cost a pass over the rest of the text (JSONDecodeError
+# also counts the newlines before the failure), so after this many failures
+# the lenient scan takes over; this keeps inputs full of broken JSON linear.
+MAX_DECODE_ATTEMPTS = 32
+PREVIEW_CHARS = 500
+
+# strict=False accepts raw newlines inside strings, which the model often emits
+_decoder = json.JSONDecoder(strict=False)
+# Only '{' followed by a key can start an answer; skips "{termos}"-style braces in citations
+_OBJECT_START = re.compile(r'\{\s*"')
+
+
+class ResponseParseError(ValueError):
+    """The model's answer did not contain a usable title and description"""
+
+
+def parse_gemini_response(response_text, strict=False):
+    """
+    Extract title, description and search_info from a model answer.
+
+    The text is scanned once for JSON objects with `raw_decode`, which copes with
+    code fences, prose around the JSON, escaped quotes and multi-line strings.
+    Broken JSON falls back to a lenient field scan, and non-JSON answers to a
+    "title: ..." line scan; with strict only a well-formed JSON answer is accepted.
+    """
+    result = _decode_first_object(response_text)
+    if result is None:
+        if strict:
+            raise ResponseParseError("Gemini response does not contain a JSON object with title and description")
+        result = _scan_fields(response_text)
+
+    if not result["title"] or not result["description"]:
+        debug_response = response_text[:PREVIEW_CHARS] + "..." if len(response_text) > PREVIEW_CHARS else response_text
+        raise ResponseParseError(
+            f"Could not parse Gemini response. Found title: {'Yes' if result['title'] else 'No'}, "
+            f"Found description: {'Yes' if result['description'] else 'No'}. "
+            f"Response preview: {debug_response}"
+        )
+    return result
+
+
+def find_json_object(text, keys):
+    """First JSON object in text (code fences and prose around it are fine) that has all of keys, or None"""
+    for value in _json_values(text):
+        if isinstance(value, dict) and all(key in value for key in keys):
+            return value
+    return None
+
+
+def _decode_first_object(text):
+    """First JSON object in text with non-empty title and description, or None"""
+    for value in _json_values(text):
+        result = _find_answer(value)
+        if result is not None:
+            return result
+    return None
+
+
+def _json_values(text):
+    """Decode the JSON objects in text one after another, skipping text that does not decode"""
+    attempts = 0
+    match = _OBJECT_START.search(text)
+    while match and attempts < MAX_DECODE_ATTEMPTS:
+        pos = match.start()
+        try:
+            value, end = _decoder.raw_decode(text, pos)
+        except (json.JSONDecodeError, RecursionError):
+            attempts += 1
+            match = _OBJECT_START.search(text, pos + 1)
+            continue
+        yield value
+        # Everything inside the decoded value has been looked at; continue after it
+        match = _OBJECT_START.search(text, end)
+
+
+def _find_answer(value):
+    """Depth-first search of a decoded value for an object with title and description"""
+    if isinstance(value, dict):
+        result = _fields(value)
+        if result["title"] and result["description"]:
+            return result
+        children = value.values()
+    elif isinstance(value, list):
+        children = value
+    else:
+        return None
+    for child in children:
+        result = _find_answer(child)
+        if result is not None:
+            return result
+    return None
+
+
+def _scan_fields(text):
+    """Lenient fallback: top-level string fields of broken JSON, then 'title: ...' lines"""
+    result = dict.fromkeys(FIELDS, "")
+    for name, value in IncrementalFieldExtractor().feed(text):
+        if name in result and isinstance(value, str):
+            result[name] = value.strip()
+    if result["title"] and result["description"]:
+        return result
+
+    for line in text.split("\n"):
+        name, sep, value = line.strip().partition(":")
+        if not sep:
+            continue
+        name = name.strip().strip("\"'*#- ").lower()
+        value = value.strip().strip("\",'* ")
+        if name in ("title", "başlık") and not result["title"]:
+            result["title"] = value
+        elif name in ("description", "açıklama") and not result["description"]:
+            result["description"] = value
+    return result
+
+
+def _fields(obj):
+    result = {}
+    for name in FIELDS:
+        value = obj.get(name, "")
+        if not isinstance(value, str):
+            # search_info sometimes comes back as a list of sources
+            value = json.dumps(value, ensure_ascii=False) if value else ""
+        result[name] = value.strip()
+    return result
+
+
+class IncrementalFieldExtractor:
+    """
+    Incremental scanner for the top-level string fields of a streamed JSON object.
+
+    Text is fed chunk by chunk; each call to `feed` returns the (name, value)
+    pairs whose string value closed inside that chunk, so `title` is available
+    long before the description has finished streaming. Every character is
+    scanned exactly once and text before the first `{` (e.g. a code fence) is
+    ignored.
+    """
+
+    def __init__(self):
+        self._pending = ""  # unfinished top-level string literal carried between chunks
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._expect_key = False
+        self._key = None
+        self._seen = set()
+
+    def feed(self, text):
+        data = self._pending + text
+        string_start = 0 if self._pending else None
+        fields = []
+        for pos in range(len(self._pending), len(data)):
+            char = data[pos]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        field = self._close_string(data[string_start:pos + 1])
+                        if field is not None:
+                            fields.append(field)
+            elif char == '"':
+                if self._depth > 0:
+                    self._in_string = True
+                    string_start = pos
+            elif char in "{[":
+                self._depth += 1
+                if self._depth == 1:
+                    self._expect_key = True
+            elif char in "}]":
+                self._depth = max(self._depth - 1, 0)
+            elif self._depth == 1 and char == ",":
+                self._expect_key = True
+                self._key = None
+            elif self._depth == 1 and char == ":":
+                self._expect_key = False
+        self._pending = data[string_start:] if self._in_string and self._depth == 1 else ""
+        return fields
+
+    def _close_string(self, literal):
+        try:
+            value = json.loads(literal)
+        except json.JSONDecodeError:
+            return None
+        if self._expect_key:
+            self._key = value
+            return None
+        key, self._key = self._key, None
+        if key is None or key in self._seen:
+            return None
+        self._seen.add(key)
+        return key, value
@@ -0,0 +1,171 @@
+"""
+Content-addressed cache for Gemini analysis results.
+
+Entries are keyed by the SHA-256 of the image bytes together with the prompt
+version, model name and generation config, so a prompt or config change never
+serves stale results. The in-memory tier is an LRU bounded by entry count and
+approximate byte size; the optional SQLite tier survives restarts.
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def make_cache_key(image_bytes, prompt_version, model, config_fingerprint):
+    """Build the cache key for an image analysed with the given prompt/model/config"""
+    image_digest = hashlib.sha256(image_bytes).hexdigest()
+    return f"{model}:{prompt_version}:{config_fingerprint}:{image_digest}"
+
+
+def cache_key_scope(key):
+    """Everything in a cache key except the image digest (model, prompt, config)"""
+    return key.rsplit(":", 1)[0]
+
+
+def config_fingerprint(config):
+    """Short stable digest of a generation config object"""
+    return hashlib.sha256(repr(config).encode("utf-8")).hexdigest()[:12]
+
+
+class ResultCache:
+    """Thread-safe LRU + TTL result cache with an optional SQLite tier"""
+
+    def __init__(self, max_entries=10000, max_bytes=64 * 1024 * 1024, ttl_seconds=7 * 24 * 3600, db_path=None,
+                 on_evict=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        # Called with the key once an entry is gone from every tier (evicted or expired)
+        self.on_evict = on_evict
+        self._dropped = []
+        self._entries = OrderedDict()  # key -> (expires_at, value, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._db = None
+        self._stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "expired": 0,
+        }
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, fingerprint TEXT)"
+            )
+            columns = {row[1] for row in self._db.execute("PRAGMA table_info(results)")}
+            if "fingerprint" not in columns:
+                self._db.execute("ALTER TABLE results ADD COLUMN fingerprint TEXT")
+            self._db.execute("DELETE FROM results WHERE expires_at < ?", (time.time(),))
+            self._db.commit()
+
+    def get(self, key, record_miss=True):
+        """Return the cached result dict for key, or None; record_miss=False leaves a miss uncounted"""
+        try:
+            return self._get(key, record_miss)
+        finally:
+            self._notify_dropped()
+
+    def _get(self, key, record_miss):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value, size = entry
+                if expires_at >= now:
+                    self._entries.move_to_end(key)
+                    self._stats["memory_hits"] += 1
+                    return dict(value)
+                self._remove(key)
+                self._stats["expired"] += 1
+                if self._db is None:
+                    self._dropped.append(key)
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value, expires_at FROM results WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    value, expires_at = json.loads(row[0]), row[1]
+                    if expires_at >= now:
+                        self._store(key, value, expires_at)
+                        self._stats["disk_hits"] += 1
+                        return dict(value)
+                    self._db.execute("DELETE FROM results WHERE key = ?", (key,))
+                    self._db.commit()
+                    self._stats["expired"] += 1
+                    self._dropped.append(key)
+
+            if record_miss:
+                self._stats["misses"] += 1
+            return None
+
+    def put(self, key, value, fingerprint=None):
+        """Store a result dict under key in every tier, with the image's perceptual hash if known"""
+        expires_at = time.time() + self.ttl_seconds
+        with self._lock:
+            self._store(key, dict(value), expires_at)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO results (key, value, expires_at, fingerprint) VALUES (?, ?, ?, ?)",
+                    (
+                        key,
+                        json.dumps(value, ensure_ascii=False),
+                        expires_at,
+                        format(fingerprint, "016x") if fingerprint is not None else None,
+                    ),
+                )
+                self._db.commit()
+        self._notify_dropped()
+
+    def fingerprints(self):
+        """(key, perceptual hash) pairs persisted on disk, used to warm the near-duplicate index"""
+        if self._db is None:
+            return []
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT key, fingerprint FROM results WHERE fingerprint IS NOT NULL AND expires_at >= ?",
+                (time.time(),),
+            ).fetchall()
+        return [(key, int(fingerprint, 16)) for key, fingerprint in rows]
+
+    def stats(self):
+        """Snapshot of hit/miss counters and current occupancy"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["hits"] = stats["memory_hits"] + stats["disk_hits"]
+            stats["entries"] = len(self._entries)
+            stats["bytes"] = self._bytes
+            return stats
+
+    def _store(self, key, value, expires_at):
+        size = len(json.dumps(value, ensure_ascii=False).encode("utf-8"))
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (expires_at, value, size)
+        self._bytes += size
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self._stats["evictions"] += 1
+            # With a disk tier the entry is still on disk
+            if self._db is None:
+                self._dropped.append(oldest)
+
+    def _notify_dropped(self):
+        # Outside the lock: the callback may take locks of its own
+        with self._lock:
+            dropped, self._dropped = self._dropped, []
+        if self.on_evict is not None:
+            for key in dropped:
+                self.on_evict(key)
+
+    def _remove(self, key):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
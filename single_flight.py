@@ -0,0 +1,53 @@
+"""
+Request coalescing for identical in-flight analyses.
+
+Concurrent callers asking for the same key share one upstream call and all
+receive its result (or its error). The shared call is cancelled only when
+every caller waiting on it has gone away.
+"""
+import asyncio
+
+
+class _Call:
+    def __init__(self, task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls = {}
+        self._stats = {"calls": 0, "coalesced": 0, "cancelled": 0}
+
+    async def do(self, key, fn):
+        """Run fn() for key unless an identical call is already in flight, then await its result"""
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.ensure_future(fn()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+            self._stats["calls"] += 1
+        else:
+            self._stats["coalesced"] += 1
+
+        call.waiters += 1
+        try:
+            # shield: one waiter being cancelled must not cancel the call for the others
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # Everyone disconnected; later callers must start a fresh call, not join a dying one
+                self._forget(key, call)
+                call.task.cancel()
+                self._stats["cancelled"] += 1
+
+    def in_flight(self):
+        return len(self._calls)
+
+    def stats(self):
+        return dict(self._stats, in_flight=len(self._calls))
+
+    def _forget(self, key, call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
@@ -0,0 +1,92 @@
+"""
+Multi-process serving.
+
+Decoding, preprocessing and response parsing hold the GIL, so one server
+process keeps a single core busy however many it has. The supervisor starts
+N worker processes that each run a complete gRPC server on the same port;
+the kernel spreads incoming connections across them (SO_REUSEPORT). A worker
+that dies is restarted, with a growing delay if it keeps dying right after
+start. On SIGTERM or SIGINT the workers are asked to drain and are killed
+only if they are still running once the grace period is over.
+
+Workers are started with the spawn method rather than fork: a forked child
+would inherit the parent's gRPC and event-loop state, which is not fork-safe.
+"""
+import logging
+import multiprocessing
+import multiprocessing.connection
+import signal
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# A worker that lived at least this long is considered healthy again, resetting its restart delay
+STABLE_SECONDS = 30.0
+
+
+class Supervisor:
+    def __init__(self, target, processes, grace_seconds=30.0, restart_delay_seconds=1.0, restart_delay_max_seconds=30.0):
+        """target(index) runs one worker and must drain and return on SIGTERM"""
+        self.target = target
+        self.processes = processes
+        self.grace_seconds = grace_seconds
+        self.restart_delay_seconds = restart_delay_seconds
+        self.restart_delay_max_seconds = restart_delay_max_seconds
+        self._context = multiprocessing.get_context("spawn")
+        self._workers = {}  # index -> (process, started_at)
+        self._failures = {}
+        self._restart_at = {}
+        self._stop = threading.Event()
+
+    def run(self):
+        """Run the workers until SIGTERM/SIGINT, then drain them; blocks until all have exited"""
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, lambda *_: self._stop.set())
+        for index in range(self.processes):
+            self._start(index)
+        while not self._stop.is_set():
+            sentinels = [process.sentinel for process, _ in self._workers.values()]
+            multiprocessing.connection.wait(sentinels, timeout=0.5)
+            self._reap()
+            self._restart_due()
+        self._drain()
+
+    def _start(self, index):
+        process = self._context.Process(target=self.target, args=(index,), name=f"grpc-worker-{index}")
+        process.start()
+        self._workers[index] = (process, time.monotonic())
+
+    def _reap(self):
+        now = time.monotonic()
+        for index, (process, started_at) in list(self._workers.items()):
+            if process.is_alive():
+                continue
+            del self._workers[index]
+            failures = 1 if now - started_at >= STABLE_SECONDS else self._failures.get(index, 0) + 1
+            self._failures[index] = failures
+            delay = min(self.restart_delay_max_seconds, self.restart_delay_seconds * 2 ** (failures - 1))
+            self._restart_at[index] = now + delay
+            logger.warning("Worker %d (pid %d) exited with %s; restarting in %.1fs",
+                           index, process.pid, process.exitcode, delay)
+
+    def _restart_due(self):
+        now = time.monotonic()
+        for index, restart_at in list(self._restart_at.items()):
+            if restart_at <= now:
+                del self._restart_at[index]
+                self._start(index)
+
+    def _drain(self):
+        print(f"Kapanış: {len(self._workers)} işçi süreç en fazla {self.grace_seconds:.0f} sn içinde boşaltılıyor")
+        for process, _ in self._workers.values():
+            if process.is_alive():
+                process.terminate()
+        # Workers stop their own servers after grace_seconds; the margin covers their shutdown
+        deadline = time.monotonic() + self.grace_seconds + 5.0
+        for process, _ in self._workers.values():
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                logger.warning("Worker pid %d did not drain in time; killing it", process.pid)
+                process.kill()
+                process.join()
@@ -1,6 +1,6 @@
 import grpc
-import product_image_analyzer_pb2
-import product_image_analyzer_pb2_grpc
+import product_analyzer_pb2
+import product_analyzer_pb2_grpc
 import mimetypes
 import sys
 import argparse
@@ -19,7 +19,7 @@ def test_image_file(stub, image_path):
         with open(image_path, "rb") as f:
             image_bytes = f.read()
         
-        request = product_image_analyzer_pb2.ImageRequest(
+        request = product_analyzer_pb2.ImageRequest(
             image=image_bytes,
             filename=filename,
             content_type=content_type
@@ -42,7 +42,7 @@ def test_image_url(stub, image_url):
     print(f"\n=== Testing GenerateFromImageUrl with URL: {image_url} ===")
     
     try:
-        request = product_image_analyzer_pb2.ImageUrlRequest(
+        request = product_analyzer_pb2.ImageUrlRequest(
             image_url=image_url
         )
         
@@ -75,7 +75,7 @@ def main():
     
     # Connect to gRPC server
     channel = grpc.insecure_channel(f"{args.host}:{args.port}")
-    stub = product_image_analyzer_pb2_grpc.ProductImageAnalyzerStub(channel)
+    stub = product_analyzer_pb2_grpc.ProductAnalyzerStub(channel)
     
     print(f"🔗 Connecting to gRPC server at {args.host}:{args.port}")
     
@@ -0,0 +1,59 @@
+import asyncio
+import time
+import unittest
+
+import grpc
+
+from admission import AdmissionController, AdmissionRejected
+
+
+class ExpectedLatencyPerModelTest(unittest.IsolatedAsyncioTestCase):
+    async def call(self, admission, model, seconds):
+        """One finished call to model that took `seconds` from admission"""
+        admitted_at = await admission.acquire(model=model)
+        admission.release(admitted_at - seconds, "ok", model)
+
+    async def test_models_keep_separate_estimates(self):
+        admission = AdmissionController()
+        await self.call(admission, "gemini-2.5-pro", 30.0)
+        await self.call(admission, "gemini-2.5-flash", 2.0)
+        self.assertAlmostEqual(admission.expected_latency("gemini-2.5-pro"), 30.0, delta=0.1)
+        self.assertAlmostEqual(admission.expected_latency("gemini-2.5-flash"), 2.0, delta=0.1)
+        self.assertEqual(admission.expected_latency("unseen"), 0.0)
+        self.assertAlmostEqual(admission.stats()["expected_latency"], 30.0, delta=0.1)
+
+    async def test_deadline_check_uses_the_called_model(self):
+        admission = AdmissionController()
+        await self.call(admission, "gemini-2.5-pro", 30.0)
+        await self.call(admission, "gemini-2.5-flash", 2.0)
+        deadline = time.monotonic() + 10.0
+
+        # A fast tier fits a 10 s deadline even though pro calls take 30 s
+        admitted_at = await admission.acquire(deadline, "gemini-2.5-flash")
+        admission.release(admitted_at, "cancelled", "gemini-2.5-flash")
+
+        with self.assertRaises(AdmissionRejected) as raised:
+            await admission.acquire(deadline, "gemini-2.5-pro")
+        self.assertEqual(raised.exception.code, grpc.StatusCode.DEADLINE_EXCEEDED)
+        self.assertEqual(admission.stats()["rejected_deadline"], 1)
+
+    async def test_failed_calls_leave_the_estimate_alone(self):
+        admission = AdmissionController()
+        await self.call(admission, "gemini-2.5-flash", 2.0)
+        admitted_at = await admission.acquire(model="gemini-2.5-flash")
+        admission.release(admitted_at - 60.0, "error", "gemini-2.5-flash")
+        self.assertAlmostEqual(admission.expected_latency("gemini-2.5-flash"), 2.0, delta=0.1)
+
+    async def test_queued_waiter_budget_uses_the_called_model(self):
+        admission = AdmissionController(initial_limit=1, min_limit=1)
+        await self.call(admission, "gemini-2.5-flash", 0.5)
+        holder = await admission.acquire(model="gemini-2.5-flash")
+        waiter = asyncio.ensure_future(admission.acquire(time.monotonic() + 5.0, "gemini-2.5-flash"))
+        await asyncio.sleep(0.05)
+        admission.release(holder, "ok", "gemini-2.5-flash")
+        admission.release(await waiter, "ok", "gemini-2.5-flash")
+        self.assertEqual(admission.stats()["in_flight"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,38 @@
+import os
+import subprocess
+import sys
+import unittest
+
+import grpc
+
+from analysis_pipeline import BATCH_MAX_BYTES, MAX_IMAGE_BYTES, AnalysisError, AnalysisPipeline
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class BatchBytesTest(unittest.IsolatedAsyncioTestCase):
+    async def test_uploads_over_the_batch_budget_are_rejected(self):
+        image = b"\0" * MAX_IMAGE_BYTES
+        items = [("image", (image, f"{i}.jpg", "image/jpeg")) for i in range(BATCH_MAX_BYTES // MAX_IMAGE_BYTES + 1)]
+        # The size check runs before the pipeline is touched
+        results = AnalysisPipeline.generate_batch(None, items)
+        with self.assertRaises(AnalysisError) as raised:
+            await results.__anext__()
+        self.assertEqual(raised.exception.code, grpc.StatusCode.INVALID_ARGUMENT)
+        self.assertIn("SubmitAnalysis", raised.exception.details)
+
+
+class ReceiveLimitTest(unittest.TestCase):
+    def test_default_is_bounded(self):
+        env = {name: value for name, value in os.environ.items()
+               if name not in ("GRPC_MAX_RECEIVE_MESSAGE_BYTES", "BATCH_MAX_BYTES", "PRODUCT_MAX_IMAGES")}
+        env.update(GOOGLE_API_KEY="fake", BATCH_MAX_ITEMS="1000")
+        script = "import grpc_server; print(grpc_server.GRPC_MAX_RECEIVE_MESSAGE_BYTES)"
+        output = subprocess.run([sys.executable, "-c", script], cwd=ROOT, env=env,
+                                capture_output=True, text=True, check=True).stdout
+        # 16 uploads of 10MB plus framing, however many items a batch may hold
+        self.assertEqual(int(output), 16 * MAX_IMAGE_BYTES + 1024 * 1024)
+
+
+if __name__ == "__main__":
+    unittest.main()
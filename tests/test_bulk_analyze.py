@@ -0,0 +1,51 @@
+import argparse
+import asyncio
+import unittest
+
+import grpc
+
+from bulk_analyze import process
+
+
+class StallingPipeline:
+    """Stalls on the first `stalls` calls, then answers"""
+
+    def __init__(self, stalls):
+        self.stalls = stalls
+        self.calls = 0
+
+    async def generate_from_image_url(self, image_url, deadline=None):
+        self.calls += 1
+        if self.calls <= self.stalls:
+            await asyncio.sleep(3600)
+        return {"title": image_url, "description": "", "search_info": ""}
+
+
+def settings(max_attempts):
+    return argparse.Namespace(timeout=0.1, max_attempts=max_attempts, retry_seconds=0.01)
+
+
+class AttemptTimeoutTest(unittest.IsolatedAsyncioTestCase):
+    async def test_stalled_attempt_is_retried(self):
+        pipeline = StallingPipeline(stalls=1)
+        result, error = await process(pipeline, {"url": "http://example.com/a.jpg"}, settings(max_attempts=2))
+        self.assertIsNone(error)
+        self.assertEqual(result["title"], "http://example.com/a.jpg")
+        self.assertEqual(pipeline.calls, 2)
+
+    async def test_last_timeout_is_deadline_exceeded(self):
+        pipeline = StallingPipeline(stalls=2)
+        result, error = await process(pipeline, {"url": "http://example.com/a.jpg"}, settings(max_attempts=2))
+        self.assertIsNone(result)
+        self.assertEqual(error.code, grpc.StatusCode.DEADLINE_EXCEEDED)
+        self.assertEqual(pipeline.calls, 2)
+
+    async def test_bad_row_is_not_retried(self):
+        pipeline = StallingPipeline(stalls=0)
+        result, error = await process(pipeline, {}, settings(max_attempts=3))
+        self.assertEqual(error.code, grpc.StatusCode.INVALID_ARGUMENT)
+        self.assertEqual(pipeline.calls, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
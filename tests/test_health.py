@@ -0,0 +1,63 @@
+import threading
+import time
+import types
+import unittest
+
+from grpc_health.v1 import health_pb2
+
+from admission import AdmissionController
+from health import HealthMonitor
+from key_pool import ApiKey, KeyPool
+
+
+class FlakyKeyPool(KeyPool):
+    """Fails the first stats() read, like a race with the event loop used to"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.reads = 0
+
+    def stats(self):
+        self.reads += 1
+        if self.reads == 1:
+            raise RuntimeError("deque mutated during iteration")
+        return super().stats()
+
+
+class RecordingServicer:
+    def __init__(self):
+        self.statuses = []
+        self.lock = threading.Lock()
+
+    def set(self, service, status):
+        with self.lock:
+            self.statuses.append(status)
+
+
+def pipeline(keys):
+    return types.SimpleNamespace(admission=AdmissionController(max_queue=10), clients=types.SimpleNamespace(keys=keys))
+
+
+class MonitorLoopTest(unittest.TestCase):
+    def test_failed_update_does_not_stop_the_thread(self):
+        keys = FlakyKeyPool([ApiKey("key0", None, rpm=1000, tpm=10 ** 9)])
+        monitor = HealthMonitor(pipeline(keys), capacity=10, max_error_rate=0.5, min_requests=1)
+        servicer = RecordingServicer()
+        monitor.run_in_thread(servicer, interval_seconds=0.01)
+
+        deadline = time.monotonic() + 2.0
+        while keys.reads < 3:
+            self.assertLess(time.monotonic(), deadline, "monitor thread stopped")
+            time.sleep(0.01)
+        self.assertEqual(monitor.stats()["update_errors"], 1)
+
+        # Still tracking: failing calls now flip readiness
+        for _ in range(5):
+            keys.release(keys.acquire(100), error=RuntimeError("503 UNAVAILABLE"))
+        while health_pb2.HealthCheckResponse.NOT_SERVING not in servicer.statuses:
+            self.assertLess(time.monotonic(), deadline, "status never changed")
+            time.sleep(0.01)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+import contextlib
+import os
+import tempfile
+import unittest
+
+import httpx
+
+from image_fetcher import ImageFetcher
+
+URL = "http://example.com/a.jpg"
+BODY = b"\xff\xd8\xff fresh jpeg"
+
+
+class Clients:
+    """Just enough of the shared client pool for ImageFetcher"""
+
+    def __init__(self, handler):
+        self.http = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+    @contextlib.asynccontextmanager
+    async def track(self, name):
+        yield
+
+
+class ConditionalFetchTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.requests = []
+
+        def handler(request):
+            self.requests.append(request)
+            if request.headers.get("if-none-match") == '"v1"':
+                return httpx.Response(304)
+            return httpx.Response(200, content=BODY, headers={"content-type": "image/jpeg", "etag": '"v1"'})
+
+        clients = Clients(handler)
+        self.addAsyncCleanup(clients.http.aclose)
+        self.fetcher = ImageFetcher(clients, max_bytes=1024 * 1024, cache_dir=directory.name)
+
+    async def test_not_modified_is_served_from_cache(self):
+        await self.fetcher.fetch(URL)
+        self.assertEqual(await self.fetcher.fetch(URL), (BODY, "image/jpeg"))
+        self.assertEqual(len(self.requests), 2)
+
+    async def test_not_modified_without_cached_body_downloads_again(self):
+        await self.fetcher.fetch(URL)
+        os.remove(self.fetcher.cache._path(URL, ".bin"))
+
+        self.assertEqual(await self.fetcher.fetch(URL), (BODY, "image/jpeg"))
+        self.assertEqual([request.headers.get("if-none-match") for request in self.requests], [None, '"v1"', None])
+        # The fresh download is cached again
+        self.assertEqual(self.fetcher.cache.get_body(URL), BODY)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,152 @@
+import asyncio
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+import grpc
+
+from job_queue import FAILED, QUEUED, RUNNING, SUCCEEDED, JobQueue, JobRunner
+
+
+class HangingPipeline:
+    """Model calls that never answer, like a stalled stream"""
+
+    def __init__(self):
+        self.started = 0
+        self.cancelled = 0
+
+    async def generate_from_image_url(self, image_url, deadline=None):
+        self.started += 1
+        try:
+            await asyncio.sleep(3600)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+
+
+class AnsweringPipeline:
+    async def generate_from_image_url(self, image_url, deadline=None):
+        return {"title": image_url, "description": "", "search_info": ""}
+
+
+class ThreadRecordingQueue(JobQueue):
+    """Remembers which threads ran the blocking SQLite calls"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.threads = set()
+
+    def claim(self):
+        self.threads.add(threading.get_ident())
+        return super().claim()
+
+    def complete(self, job, result):
+        self.threads.add(threading.get_ident())
+        super().complete(job, result)
+
+
+class JobQueueTestCase(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.db_path = os.path.join(directory.name, "jobs.db")
+
+    async def run_until(self, runner, predicate, timeout=5.0):
+        runner.start(asyncio.get_running_loop())
+        deadline = time.monotonic() + timeout
+        try:
+            while not predicate():
+                self.assertLess(time.monotonic(), deadline, "runner did not get there in time")
+                await asyncio.sleep(0.02)
+        finally:
+            await runner.stop()
+
+
+class LeaseTest(JobQueueTestCase):
+    def test_expired_lease_is_taken_over(self):
+        queue = JobQueue(self.db_path, lease_seconds=0.1, retry_base_seconds=0, retry_max_seconds=0)
+        job = queue.submit("image_url", ("http://example.com/a.jpg",))
+        first, _ = queue.claim()
+        self.assertIsNone(queue.claim())
+        time.sleep(0.15)
+        second, args = queue.claim()
+        self.assertEqual((second["id"], second["attempts"], args), (job["id"], 2, ("http://example.com/a.jpg",)))
+        # The first worker lost the lease; its late result must not overwrite the new attempt
+        queue.complete(first, {"title": "stale"})
+        self.assertEqual(queue.get(job["id"])["state"], RUNNING)
+
+    def test_expired_lease_backs_off(self):
+        queue = JobQueue(self.db_path, lease_seconds=0.1, retry_base_seconds=60, retry_max_seconds=60)
+        job = queue.submit("image_url", ("http://example.com/a.jpg",))
+        queue.claim()
+        time.sleep(0.15)
+        # Not reclaimed straight away: a job that kills its worker would otherwise loop forever
+        self.assertIsNone(queue.claim())
+        job = queue.get(job["id"])
+        self.assertEqual((job["state"], job["attempts"]), (QUEUED, 1))
+        self.assertIn("Lease expired", job["error_message"])
+
+    def test_expired_lease_fails_after_max_attempts(self):
+        queue = JobQueue(self.db_path, lease_seconds=0.05, max_attempts=2, retry_base_seconds=0, retry_max_seconds=0)
+        job = queue.submit("image_url", ("http://example.com/a.jpg",))
+        for _ in range(2):
+            self.assertIsNotNone(queue.claim())
+            time.sleep(0.1)
+        self.assertIsNone(queue.claim())
+        job = queue.get(job["id"])
+        self.assertEqual((job["state"], job["attempts"]), (FAILED, 2))
+        self.assertEqual(job["error_code"], grpc.StatusCode.INTERNAL.value[0])
+
+    def test_release_does_not_count_the_attempt(self):
+        queue = JobQueue(self.db_path)
+        job = queue.submit("image_url", ("http://example.com/a.jpg",))
+        claimed, _ = queue.claim()
+        queue.release(claimed)
+        job = queue.get(job["id"])
+        self.assertEqual((job["state"], job["attempts"]), (QUEUED, 0))
+
+
+class AttemptTimeoutTest(JobQueueTestCase):
+    async def test_hung_attempt_times_out_before_its_lease(self):
+        queue = JobQueue(self.db_path, lease_seconds=3.0)
+        pipeline = HangingPipeline()
+        runner = JobRunner(queue, pipeline, workers=2, timeout_seconds=0.2, max_attempts=2,
+                           retry_base_seconds=0.01, retry_max_seconds=0.01, poll_seconds=0.05)
+        job = queue.submit("image_url", ("http://example.com/a.jpg",))
+        await self.run_until(runner, lambda: queue.get(job["id"])["state"] == FAILED)
+
+        job = queue.get(job["id"])
+        self.assertEqual(job["attempts"], 2)
+        self.assertEqual(job["error_code"], grpc.StatusCode.DEADLINE_EXCEEDED.value[0])
+        # Every attempt was cancelled by its timeout; none was left running under an expired lease
+        self.assertEqual((pipeline.started, pipeline.cancelled), (2, 2))
+        self.assertEqual(runner.stats()["retried"], 1)
+
+    async def test_stop_hands_running_jobs_back(self):
+        queue = JobQueue(self.db_path)
+        runner = JobRunner(queue, HangingPipeline(), workers=1, timeout_seconds=60, poll_seconds=0.05)
+        job = queue.submit("image_url", ("http://example.com/a.jpg",))
+        await self.run_until(runner, lambda: queue.get(job["id"])["state"] == RUNNING)
+        job = queue.get(job["id"])
+        self.assertEqual((job["state"], job["attempts"]), (QUEUED, 0))
+
+    async def test_answer_completes_the_job(self):
+        queue = JobQueue(self.db_path)
+        runner = JobRunner(queue, AnsweringPipeline(), workers=1, poll_seconds=0.05)
+        job = queue.submit("image_url", ("http://example.com/a.jpg",))
+        await self.run_until(runner, lambda: queue.get(job["id"])["state"] == SUCCEEDED)
+        self.assertEqual(queue.get(job["id"])["result"]["title"], "http://example.com/a.jpg")
+
+    async def test_queue_calls_run_off_the_event_loop(self):
+        queue = ThreadRecordingQueue(self.db_path)
+        runner = JobRunner(queue, AnsweringPipeline(), workers=1, poll_seconds=0.05)
+        job = queue.submit("image_url", ("http://example.com/a.jpg",))
+        await self.run_until(runner, lambda: queue.get(job["id"])["state"] == SUCCEEDED)
+        self.assertTrue(queue.threads)
+        self.assertNotIn(threading.get_ident(), queue.threads)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+import unittest
+
+from key_pool import ApiKey, KeyPool, KeySpec, NoKeyAvailable, is_quota_error, split_quota
+
+
+class ApiError(Exception):
+    def __init__(self, code, message):
+        super().__init__(f"{code} {message}")
+        self.code = code
+
+
+QUOTA = ApiError(429, "RESOURCE_EXHAUSTED")
+OVERLOADED = ApiError(503, "UNAVAILABLE: The model is overloaded")
+
+
+def pool(*labels):
+    return KeyPool([ApiKey(label, None, rpm=1000, tpm=10 ** 9) for label in labels])
+
+
+def fail(keys, error, exclude=()):
+    lease = keys.acquire(100, exclude=exclude)
+    keys.release(lease, error=error)
+    return lease.api_key
+
+
+class KeyEjectionTest(unittest.TestCase):
+    def test_single_key_is_never_ejected(self):
+        keys = pool("key0")
+        for _ in range(5):
+            fail(keys, QUOTA)
+        # Still usable: the last healthy key keeps serving through a 429 burst
+        self.assertEqual(keys.acquire(100).api_key.label, "key0")
+        stats = keys.stats()["key0"]
+        self.assertEqual((stats["ejected"], stats["ejections_total"], stats["ejections_skipped"]), (0, 0, 5))
+        self.assertEqual(stats["failures_total"], 5)
+
+    def test_server_errors_do_not_eject(self):
+        keys = pool("key0", "key1")
+        for _ in range(3):
+            fail(keys, OVERLOADED)
+            fail(keys, RuntimeError("503 UNAVAILABLE: stream reset"))
+        stats = keys.stats()
+        self.assertEqual(sum(key["ejected"] for key in stats.values()), 0)
+        self.assertEqual(sum(key["failures_total"] for key in stats.values()), 6)
+
+    def test_quota_error_ejects_while_another_key_is_healthy(self):
+        keys = pool("key0", "key1")
+        ejected = fail(keys, QUOTA)
+        other = keys.acquire(100)
+        self.assertIsNot(other.api_key, ejected)
+        keys.release(other)
+        # The remaining key is the last healthy one and is kept
+        fail(keys, QUOTA)
+        self.assertEqual(keys.acquire(100).api_key, other.api_key)
+        with self.assertRaises(NoKeyAvailable):
+            keys.acquire(100, exclude=[other.api_key])
+
+    def test_retry_on_another_key_after_server_error(self):
+        keys = pool("key0", "key1")
+        first = fail(keys, OVERLOADED)
+        second = keys.acquire(100, exclude=[first])
+        self.assertIsNot(second.api_key, first)
+
+    def test_quota_error_detection(self):
+        self.assertTrue(is_quota_error(QUOTA))
+        self.assertTrue(is_quota_error(RuntimeError("429 RESOURCE_EXHAUSTED (fake)")))
+        self.assertFalse(is_quota_error(OVERLOADED))
+        self.assertFalse(is_quota_error(ApiError(500, "INTERNAL")))
+
+
+class ConcurrentStatsTest(unittest.TestCase):
+    def test_stats_while_calls_are_charged(self):
+        keys = KeyPool([ApiKey("key0", None, rpm=10 ** 9, tpm=10 ** 12)])
+        errors = []
+        done = threading.Event()
+
+        def read_stats():
+            while not done.is_set():
+                try:
+                    keys.stats()
+                except RuntimeError as e:
+                    errors.append(e)
+
+        reader = threading.Thread(target=read_stats)
+        reader.start()
+        calls = 0
+        deadline = time.monotonic() + 0.5
+        while time.monotonic() < deadline:
+            keys.release(keys.acquire(100), tokens_used=10)
+            calls += 1
+        done.set()
+        reader.join()
+        self.assertEqual(errors, [])
+        stats = keys.stats()["key0"]
+        self.assertEqual((stats["requests_last_minute"], stats["tokens_last_minute"]), (calls, 10 * calls))
+
+
+class QuotaShareTest(unittest.TestCase):
+    def test_split_quota(self):
+        keys = split_quota([KeySpec("a", 150, 2000000), KeySpec("b", 2, 3)], 4)
+        self.assertEqual(keys, [KeySpec("a", 37, 500000), KeySpec("b", 1, 1)])
+
+    def test_worker_processes_share_the_budgets(self):
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env = dict(os.environ, GEMINI_QUOTA_SHARES="4", GOOGLE_API_KEYS="k1:100:1000,k2",
+                   ADMISSION_RATE="20", ADMISSION_MAX_LIMIT="256", ADMISSION_MAX_QUEUE="256")
+        script = (
+            "import analysis_pipeline as p; "
+            "print(p.API_KEYS[0].rpm, p.API_KEYS[0].tpm, p.ADMISSION_RATE, p.ADMISSION_MAX_LIMIT, p.ADMISSION_MAX_QUEUE)"
+        )
+        output = subprocess.run([sys.executable, "-c", script], cwd=root, env=env,
+                                capture_output=True, text=True, check=True).stdout.split()
+        self.assertEqual(output, ["25", "250", "5.0", "64", "64"])
+
+
+if __name__ == "__main__":
+    unittest.main()
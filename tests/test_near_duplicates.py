@@ -0,0 +1,64 @@
+import unittest
+
+from perceptual_hash import NearDuplicateIndex
+from result_cache import ResultCache, cache_key_scope
+
+SCOPE = "model:prompt:config"
+
+
+def key(name):
+    return f"{SCOPE}:{name}"
+
+
+class NearDuplicateEvictionTest(unittest.TestCase):
+    def setUp(self):
+        self.index = NearDuplicateIndex(max_distance=6)
+        self.cache = ResultCache(
+            max_entries=2, on_evict=lambda cache_key: self.index.remove(cache_key, cache_key_scope(cache_key))
+        )
+
+    def store(self, name, fingerprint):
+        self.cache.put(key(name), {"title": name}, fingerprint=fingerprint)
+        self.index.add(fingerprint, key(name), SCOPE)
+
+    def lookup(self, fingerprint):
+        return self.index.lookup(fingerprint, SCOPE, lambda cache_key: self.cache.get(cache_key, record_miss=False))
+
+    def test_evicted_results_leave_the_index(self):
+        self.store("a", 0b0)
+        self.store("b", 0b11)
+        self.store("c", 0xFFFF_0000_0000_0000)  # evicts "a"
+        self.assertEqual(self.index.stats()["entries"], 2)
+        # "a" would have been the exact match; the next closest live result is returned instead
+        cache_key, distance, value = self.lookup(0b0)
+        self.assertEqual((cache_key, distance, value), (key("b"), 2, {"title": "b"}))
+
+    def test_stale_match_falls_through_to_farther_one(self):
+        # Entries dropped without the callback, e.g. expired, are skipped and forgotten on lookup
+        self.cache.on_evict = None
+        self.store("a", 0b0)
+        self.store("b", 0b11)
+        self.store("c", 0xFFFF_0000_0000_0000)
+        match = self.lookup(0b0)
+        self.assertEqual(match[0], key("b"))
+        stats = self.index.stats()
+        self.assertEqual((stats["hits"], stats["stale"], stats["entries"]), (1, 1, 2))
+        self.assertEqual(self.cache.stats()["misses"], 0)
+
+    def test_no_live_match(self):
+        self.cache.on_evict = None
+        self.store("a", 0b0)
+        self.cache = ResultCache()
+        self.assertIsNone(self.lookup(0b1))
+        self.assertEqual(self.index.stats()["hits"], 0)
+
+    def test_key_stored_again_with_new_hash(self):
+        self.store("a", 0b0)
+        self.store("a", 0xFFFF)
+        self.assertEqual(self.index.stats()["entries"], 1)
+        self.assertIsNone(self.lookup(0b0))
+        self.assertEqual(self.lookup(0xFFFF)[0], key("a"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,31 @@
+import json
+import unittest
+
+from product_research import identity_key, parse_identity
+
+
+def answer(**fields):
+    return json.dumps(dict({"brand": "", "model": "", "category": "", "observations": "Siyah kulak üstü"}, **fields))
+
+
+class ParseIdentityTest(unittest.TestCase):
+    def test_category_alone_is_not_an_identity(self):
+        self.assertIsNone(parse_identity(answer(category="kablosuz kulaklık")))
+        self.assertIsNone(parse_identity(answer(brand="bilinmiyor", model="-", category="kablosuz kulaklık")))
+
+    def test_brand_or_model_with_category(self):
+        self.assertEqual(parse_identity(answer(brand="Sony", category="kablosuz kulaklık")).brand, "Sony")
+        self.assertEqual(parse_identity(answer(model="WH-1000XM5", category="kablosuz kulaklık")).model, "WH-1000XM5")
+
+    def test_category_is_still_required(self):
+        self.assertIsNone(parse_identity(answer(brand="Sony", model="WH-1000XM5")))
+        self.assertIsNone(parse_identity("no json here"))
+
+    def test_spelling_variants_share_a_key(self):
+        first = parse_identity(answer(brand="SONY", model="WH 1000XM5", category="Kablosuz Kulaklık"))
+        second = parse_identity(answer(brand="sony", model="wh-1000xm5", category="KABLOSUZ KULAKLIK"))
+        self.assertEqual(identity_key(first), identity_key(second))
+
+
+if __name__ == "__main__":
+    unittest.main()